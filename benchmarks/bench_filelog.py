@@ -0,0 +1,52 @@
+"""
+RotatingLogFile 写入性能对比
+
+用法: python -m benchmarks.bench_filelog [--lines 100000]
+"""
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+from qinglong.filelog import RotatingLogFile
+
+
+class StatPerLineLogFile(RotatingLogFile):
+    """复现旧的写入路径：每行 stat 一次并立即 flush"""
+
+    def _should_rotate(self):
+        try:
+            return self.filename.stat().st_size >= self.max_size
+        except OSError:
+            return False
+
+
+def bench(factory, lines: int) -> float:
+    with tempfile.TemporaryDirectory() as tmp:
+        log = factory(Path(tmp) / "bench.log")
+        message = "2025-01-01 00:00:00 INFO scraper fetched page 12345 in 0.123s, 42 items"
+        start = time.perf_counter()
+        with log:
+            for _ in range(lines):
+                log.write(message)
+        return lines / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lines", type=int, default=100_000)
+    args = parser.parse_args()
+
+    cases = {
+        "stat+flush per line (old)": lambda f: StatPerLineLogFile(f),
+        "flush per line": lambda f: RotatingLogFile(f),
+        "buffered 1s": lambda f: RotatingLogFile(f, flush_interval=1.0),
+        "buffered 1s + fsync": lambda f: RotatingLogFile(f, flush_interval=1.0, fsync=True),
+    }
+    for name, factory in cases.items():
+        print(f"{name:<28} {bench(factory, args.lines):>12,.0f} lines/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+启动时加载调度任务的耗时对比：memory 每次重建所有任务，sqlite 只对比差异
+
+用法: python -m benchmarks.bench_jobstore [--tasks 1000]
+需要安装 sqlalchemy。
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+
+def child(mode: str, tasks: int):
+    from datetime import datetime
+
+    from qinglong import api
+    from qinglong.database import project_db, task_db
+    from qinglong.models import ProjectInfo, TaskInfo, TaskStatus
+
+    if mode == "populate":
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        project_db["bench"] = ProjectInfo(name="bench", project_path="bench", created_at=now, upgrade_at=now)
+        with task_db.transaction():
+            for i in range(tasks):
+                task_db[f"task-{i}"] = TaskInfo(
+                    name=f"task-{i}",
+                    project_name="bench",
+                    cron=f"{i % 60} * * * *",
+                    command="main.py",
+                    status=TaskStatus.STARTED,
+                    created_at=now,
+                    upgrade_at=now,
+                )
+
+    start = time.perf_counter()
+    api.init_task()
+    print(f"{time.perf_counter() - start:.3f}")
+
+
+def boot(mode: str, jobstore: str, data: Path, tasks: int) -> float:
+    env = os.environ | {
+        "DB_PATH": str(data / "db"),
+        "TASK_LOG_PATH": str(data / "log"),
+        "SCHEDULER_JOBSTORE": jobstore,
+        "UV_MAINTENANCE_ON_START": "false",
+    }
+    cmd = [sys.executable, "-m", "benchmarks.bench_jobstore", "--child", mode, "--tasks", str(tasks)]
+    output = subprocess.run(cmd, env=env, check=True, capture_output=True, text=True).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tasks", type=int, default=1000)
+    parser.add_argument("--child", choices=["populate", "boot"])
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.tasks)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data = Path(tmp)
+        (data / "db").mkdir()
+        (data / "log").mkdir()
+        first = boot("populate", "sqlite", data, args.tasks)
+        memory = boot("boot", "memory", data, args.tasks)
+        sqlite = boot("boot", "sqlite", data, args.tasks)
+
+    print(f"first boot, sqlite (add {args.tasks} jobs)  {first:>8.3f}s")
+    print(f"restart, memory (re-add all jobs)     {memory:>8.3f}s")
+    print(f"restart, sqlite (reconcile only)      {sqlite:>8.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future
+
+_logger = logging.getLogger(__name__)
+
+
+class AsyncRunner:
+    """
+    在后台线程中运行的共享事件循环
+
+    所有通过 asyncio 运行的任务子进程都由这一个事件循环监管，
+    不再为每个运行中的任务占用一个调度线程。
+    """
+
+    def __init__(self, name: str = "qinglong-aiorunner"):
+        self.name = name
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """获取事件循环，首次访问时启动后台线程"""
+        with self._lock:
+            if self._loop is None or self._loop.is_closed():
+                loop = asyncio.new_event_loop()
+                started = threading.Event()
+                self._thread = threading.Thread(target=self._run_loop, args=(loop, started), name=self.name, daemon=True)
+                self._thread.start()
+                started.wait()
+                self._loop = loop
+                _logger.info(f"async runner started: {self.name}")
+            return self._loop
+
+    @staticmethod
+    def _run_loop(loop: asyncio.AbstractEventLoop, started: threading.Event):
+        asyncio.set_event_loop(loop)
+        loop.call_soon(started.set)
+        loop.run_forever()
+
+    def submit(self, coro) -> Future:
+        """把协程提交到事件循环中运行，立即返回 concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def stop(self):
+        """停止事件循环"""
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = None
+        if loop is None:
+            return
+        loop.call_soon_threadsafe(loop.stop)
+        if thread is not None:
+            thread.join()
+        loop.close()
+
+
+runner = AsyncRunner()
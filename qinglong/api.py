@@ -1,33 +1,505 @@
 from __future__ import annotations
 
+from collections import OrderedDict
 from datetime import datetime
+import hmac
+import json
 import shutil
 import logging
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 from pathlib import Path
 
+import yaml
+from apscheduler.executors.base import MaxInstancesReachedError
+from apscheduler.jobstores.base import JobLookupError
+from pydantic import ValidationError
+
 from .config import settings as cfg
-from .models import ProjectInfo, TaskInfo, TaskStatus
+from .models import (
+    FileWatch,
+    ProjectInfo,
+    ProjectUpdate,
+    ResourceLimits,
+    RetryPolicy,
+    RunStatus,
+    RunTrigger,
+    SchedulePolicy,
+    TaskImportResult,
+    TaskInfo,
+    TaskStatus,
+)
 from .database import project_db, task_db
-from .scheduler import scheduler
+from .scheduler import scheduler, spread_offset
 from .download import ProjectDownloder
-from .uvtask import UvTask
+from .uvtask import UvTask, DEPENDENCY_FILES, init_registry, prewarmer
+from .history import history
+from .pidfile import pidfiles
+from .watcher import watchers
 from . import errors
 
 _logger = logging.getLogger(__name__)
 task_dict: dict[str, UvTask] = {}
 
+# 批量拉取的进度，供界面轮询
+_pull_lock = threading.Lock()
+_pull_progress: dict = {"running": False, "total": 0, "done": 0, "results": {}}
+
+# 定期清理运行记录的调度任务 id
+_HISTORY_COMPACT_JOB = "qinglong:compact-run-history"
+
+# 依赖触发的状态：(流水线 id, 下游任务) -> 已完成的上游任务，None 表示不属于流水线的普通触发
+_dag_lock = threading.Lock()
+_upstream_done: dict[tuple[str | None, str], set[str]] = {}
+# 一次性调度任务 id 的分隔符；任务名会用作日志文件名，不可能包含 NUL，
+# 因此不会与任务的定时调度任务 id（即任务名）或其他任务的一次性调度任务冲突
+_JOB_ID_SEP = "\0"
+# 每个任务待执行的一次性调度任务 id，取消时不用遍历所有调度任务
+_pending_lock = threading.Lock()
+_pending_jobs: dict[str, set[str]] = {}
+# 通过 run_pipeline 启动的流水线，只保留最近的若干条
+_pipelines: OrderedDict[str, dict] = OrderedDict()
+_MAX_PIPELINES = 100
+
+
+def _slot_keys(task_info: TaskInfo) -> list[str]:
+    """任务运行前需要获取空位的并发限制 key"""
+    keys = [f"project:{task_info.project_name}"]
+    if task_info.concurrency_group:
+        keys.append(f"group:{task_info.concurrency_group}")
+    return keys
+
+
+def _apply_project_limit(project_info: ProjectInfo):
+    limit = project_info.max_concurrency
+    if limit is None:
+        limit = cfg.PROJECT_MAX_CONCURRENCY
+    scheduler.limiter.set_limit(f"project:{project_info.name}", limit)
+
+
+def _schedule_options(task_info: TaskInfo) -> dict:
+    """按任务的 schedule 和全局配置得到调度任务的补偿和错峰参数"""
+    policy = task_info.schedule or SchedulePolicy()
+    misfire = cfg.SCHEDULER_MISFIRE_GRACE_TIME if policy.misfire_grace_time is None else policy.misfire_grace_time
+    spread = cfg.SCHEDULER_SPREAD if policy.spread is None else policy.spread
+    return dict(
+        # APScheduler 用 None 表示不限制
+        misfire_grace_time=misfire or None,
+        coalesce=cfg.SCHEDULER_COALESCE if policy.coalesce is None else policy.coalesce,
+        jitter=(cfg.SCHEDULER_JITTER if policy.jitter is None else policy.jitter) or None,
+        offset=spread_offset(task_info.name, spread),
+    )
+
+
+def _job_signature(task_info: TaskInfo) -> str:
+    """调度相关配置的签名，保存在调度任务的 name 中，不一致时需要重建调度任务"""
+    options = _schedule_options(task_info)
+    return "|".join(str(value) for value in (task_info.cron, task_info.executor, *options.values()))
+
+
+def _task_job(task_info: TaskInfo) -> dict:
+    """任务对应的调度任务参数"""
+    executor = task_info.executor if scheduler.is_thread_executor(task_info.executor) else "default"
+    return dict(
+        func=execute_task,
+        args=(task_info.name,),
+        trigger=task_info.cron,
+        job_id=task_info.name,
+        name=_job_signature(task_info),
+        paused=(task_info.status == TaskStatus.PAUSED),
+        executor=executor,
+        **_schedule_options(task_info),
+    )
+
+
+def _add_task_job(task_info: TaskInfo):
+    """没有 cron 的任务不需要定时调度"""
+    if not task_info.cron:
+        return None
+    return scheduler.add_job(**_task_job(task_info))
+
+
+def _remove_task_job(task_name: str):
+    if scheduler.get_job(task_name) is not None:
+        scheduler.remove_job(task_name)
+
+
+def _ensure_uvtask(task_info: TaskInfo, project_info: ProjectInfo) -> UvTask:
+    """创建或更新任务对应的 UvTask，保留已有对象以免丢失正在运行的进程"""
+    task = task_dict.get(task_info.name)
+    if task is None:
+        task = UvTask(
+            name=task_info.name,
+            cmd=task_info.command,
+            project_path=project_info.project_path,
+            limits=task_info.limits,
+            timeout=task_info.timeout,
+            kill_grace=task_info.kill_grace,
+        )
+        task_dict[task_info.name] = task
+    else:
+        task.cmd = task_info.command
+        task.project_path = Path(project_info.project_path)
+        task.limits = task_info.limits
+        task.timeout = task_info.timeout
+        task.kill_grace = task_info.kill_grace
+    return task
+
+
+def _on_file_change(task_name: str, changed: list[str]):
+    """监视的文件变化后延迟 debounce 秒运行，期间再有变化会重新计时"""
+    task_info = task_db.get(task_name)
+    if task_info is None or task_info.watch is None or task_info.status == TaskStatus.PAUSED:
+        return
+    _logger.debug(f"task {task_name} watched files changed: {changed[:10]}")
+    _fire_task(task_name, RunTrigger.WATCH, delay=task_info.watch.debounce)
+
+
+def _sync_watch(task_info: TaskInfo, project_info: ProjectInfo):
+    """按任务配置和状态开始或停止文件监视"""
+    if task_info.watch is None or task_info.status == TaskStatus.PAUSED:
+        watchers.remove(task_info.name)
+        return
+    # 单文件工程在文件所在目录运行，相对路径也相对于该目录
+    project_path = Path(project_info.project_path)
+    base = project_path if project_path.is_dir() else project_path.parent
+    path = base / task_info.watch.path
+    watchers.set(task_info.name, task_info.watch, path, lambda changed: _on_file_change(task_info.name, changed))
+
+
+def trigger_task(task_name: str, token: str | None) -> TaskInfo:
+    """
+    外部请求触发任务，需要任务设置了 webhook_token 且令牌一致
+
+    多个请求在任务开始运行前到达时只运行一次。
+    """
+    task_info: TaskInfo | None = task_db.get(task_name)
+    if task_info is None:
+        raise errors.TaskNotFoundError(task_name)
+    if not task_info.webhook_token or not hmac.compare_digest((token or "").encode(), task_info.webhook_token.encode()):
+        raise errors.TriggerRejectedError(task_name, "invalid token")
+    if task_info.status == TaskStatus.PAUSED:
+        raise errors.TriggerRejectedError(task_name, "task is paused")
+    _fire_task(task_name, RunTrigger.WEBHOOK)
+    return task_info
+
+
+def _oneoff_job_id(task_name: str, trigger: RunTrigger, pipeline: str | None = None) -> str:
+    """同一任务、触发方式和流水线的一次性调度任务共用 id，排队期间的重复触发只运行一次"""
+    return _JOB_ID_SEP.join([task_name, trigger.value, pipeline or ""])
+
+
+def _fire_task(task_name: str, trigger: RunTrigger, delay: float = 0, pipeline: str | None = None, attempt: int = 1):
+    """通过一次性的调度任务立即或延迟运行任务，不占用当前线程"""
+    job_id = _oneoff_job_id(task_name, trigger, pipeline)
+    kwargs = {"attempt": attempt, "trigger": trigger.value, "pipeline": pipeline}
+    with _pending_lock:
+        scheduler.add_delayed_job(job_id, execute_task, delay, args=(task_name,), kwargs=kwargs)
+        _pending_jobs.setdefault(task_name, set()).add(job_id)
+
+
+def _discard_pending(task_name: str, job_id: str):
+    """一次性调度任务开始运行后从待执行索引中移除；同 id 已经重新添加时保留"""
+    with _pending_lock:
+        job_ids = _pending_jobs.get(task_name)
+        if job_ids is None or job_id not in job_ids or scheduler.get_job(job_id) is not None:
+            return
+        job_ids.discard(job_id)
+        if not job_ids:
+            del _pending_jobs[task_name]
+
+
+def _cancel_pending(task_name: str):
+    """取消任务待执行的重试和依赖触发"""
+    with _pending_lock:
+        job_ids = _pending_jobs.pop(task_name, set())
+        for job_id in job_ids:
+            try:
+                scheduler.remove_job(job_id)
+            except JobLookupError:
+                pass
+
+
+def _schedule_retry(task_name: str, attempt: int, exit_code: int | None, pipeline: str | None = None) -> bool:
+    """按任务的重试策略，在运行失败后安排一次性的重试，返回是否安排了重试"""
+    task, task_info = task_dict.get(task_name), task_db.get(task_name)
+    if task is None or task_info is None or task_info.retry is None:
+        return False
+    if not task_info.retry.should_retry(attempt, task.last_status, exit_code):
+        return False
+    delay = task_info.retry.delay_for(attempt)
+    _logger.info(f"task {task_name} attempt {attempt} {task.last_status.value}, retry in {delay:.1f}s")
+    _fire_task(task_name, RunTrigger.RETRY, delay, pipeline, attempt + 1)
+    return True
+
+
+def _fire_downstream(task_name: str, pipeline: str | None):
+    """上游任务成功后，触发所有上游都已完成的下游任务"""
+    ready = []
+    with _dag_lock:
+        scope = None
+        if pipeline is not None:
+            state = _pipelines.get(pipeline)
+            if state is None:
+                return
+            state["done"].append(task_name)
+            scope = set(state["tasks"])
+        for row in task_db.dumps():
+            if task_name not in row["depends_on"]:
+                continue
+            downstream = row["name"]
+            if scope is not None and downstream not in scope:
+                continue
+            if scope is None and row["status"] == TaskStatus.PAUSED:
+                continue
+            # 已删除的上游不再等待
+            required = {name for name in row["depends_on"] if name in task_db and (scope is None or name in scope)}
+            done = _upstream_done.setdefault((pipeline, downstream), set())
+            done.add(task_name)
+            if done >= required:
+                del _upstream_done[(pipeline, downstream)]
+                ready.append(downstream)
+    for downstream in ready:
+        _logger.info(f"task {downstream} triggered by upstream {task_name}")
+        _fire_task(downstream, RunTrigger.DEPENDENCY, pipeline=pipeline)
+
+
+def _fail_downstream(task_name: str, pipeline: str | None):
+    """
+    任务最终失败后不再触发下游
+
+    流水线中标记流水线失败并清除它的依赖状态；流水线之外清除下游任务已记录的上游完成状态，
+    下游要等所有上游重新成功后才会触发。
+    """
+    with _dag_lock:
+        if pipeline is not None:
+            state = _pipelines.get(pipeline)
+            if state is not None:
+                state["failed"] = task_name
+            keys = [key for key in _upstream_done if key[0] == pipeline]
+        else:
+            downstream = {row["name"] for row in task_db.dumps() if task_name in row["depends_on"]}
+            keys = [key for key in _upstream_done if key[0] is None and key[1] in downstream]
+        for key in keys:
+            del _upstream_done[key]
+
+
+def _skip_run(task_name: str, pipeline: str | None):
+    """任务仍在运行，本次触发被跳过；流水线中的跳过不会再有运行结果，视为失败结束流水线"""
+    _logger.warning(f"uvtask {task_name} is still running, skip this run")
+    if pipeline is not None:
+        _fail_downstream(task_name, pipeline)
+
+
+def _after_run(task_name: str, attempt: int, exit_code: int | None, pipeline: str | None):
+    """一次运行结束后，按结果安排重试或触发下游任务"""
+    task = task_dict.get(task_name)
+    if task is None:
+        return
+    if task.last_status == RunStatus.SUCCESS:
+        _fire_downstream(task_name, pipeline)
+    elif not _schedule_retry(task_name, attempt, exit_code, pipeline):
+        _fail_downstream(task_name, pipeline)
+
+
+def _settle(future: Future, func):
+    """运行 func 并把结果或异常设置到 future"""
+    try:
+        result = func()
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    future.set_result(result)
+    return result
+
+
+def execute_task(
+    task_name: str, attempt: int = 1, trigger: str | None = None, pipeline: str | None = None
+) -> int | Future | None:
+    """
+    调度器触发任务时调用，按 TASK_RUNNER 选择执行引擎，并在并发上限内排队运行
+
+    thread 模式下有并发空位时直接运行并返回退出码，需要排队时返回跟踪这次运行的 Future；
+    asyncio 模式下提交后立即返回运行的 Future。本次运行被跳过时返回 None。
+    """
+    task = task_dict.get(task_name)
+    if task is None or task_name not in task_db:
+        raise errors.TaskNotFoundError(task_name)
+    keys = _slot_keys(task_db[task_name])
+    if trigger is not None:
+        run_trigger = RunTrigger(trigger)
+        _discard_pending(task_name, _oneoff_job_id(task_name, run_trigger, pipeline))
+    else:
+        run_trigger = RunTrigger.RETRY if attempt > 1 else RunTrigger.CRON
+    if cfg.TASK_RUNNER == "asyncio":
+
+        def on_done(future):
+            if not future.cancelled() and future.exception() is None:
+                _after_run(task_name, attempt, future.result(), pipeline)
+
+        skipped = False
+
+        def on_skip():
+            nonlocal skipped
+            skipped = True
+            _skip_run(task_name, pipeline)
+
+        future = task.submit(
+            slot=scheduler.limiter.slot_async(*keys),
+            trigger=run_trigger,
+            attempt=attempt,
+            callback=on_done,
+            on_skip=on_skip,
+        )
+        # 跳过时得到的是上一次运行的 Future，不属于本次触发
+        return None if skipped else future
+    else:
+        # 重试、依赖触发和定时触发是不同的调度任务，不受 max_instances 约束，需要自行避免重复运行；
+        # 运行权在排队等待并发空位期间也保持占用，重复触发直接跳过
+        if not task.reserve():
+            _skip_run(task_name, pipeline)
+            return None
+        granted = scheduler.limiter.acquire(*keys)
+
+        def run():
+            try:
+                exit_code = task.run(trigger=run_trigger, attempt=attempt, reserved=True)
+            finally:
+                scheduler.limiter.release(*keys)
+            _after_run(task_name, attempt, exit_code, pipeline)
+            return exit_code
+
+        if granted.done():
+            return run()
+        # 工程或并发组已满时排队等待空位，不在线程池中阻塞，否则一个工程的排队任务会占满线程池；
+        # 轮到时由释放空位的一方提交到执行器运行
+        _logger.debug(f"uvtask {task_name} waiting for a concurrency slot")
+        done = Future()
+        executor = task_db[task_name].executor
+        executor = executor if scheduler.is_thread_executor(executor) else "default"
+
+        def dispatch(_):
+            try:
+                scheduler.dispatch(lambda: _settle(done, run), executor)
+            except Exception as e:
+                scheduler.limiter.release(*keys)
+                task.unreserve()
+                done.set_exception(e)
+
+        granted.add_done_callback(dispatch)
+        return done
+
+
+def _dependency_error(graph: dict[str, list[str]], name: str) -> str | None:
+    """检查任务的上游是否存在、是否形成环，graph 为任务名到上游任务的映射"""
+    for upstream in graph[name]:
+        if upstream == name:
+            return "depends on itself"
+        if upstream not in graph:
+            return f"unknown upstream task '{upstream}'"
+    # 沿上游方向查找，回到自身说明有环
+    seen: set[str] = set()
+    stack = list(graph[name])
+    while stack:
+        current = stack.pop()
+        if current == name:
+            return "dependency cycle"
+        if current not in seen:
+            seen.add(current)
+            stack.extend(graph.get(current, ()))
+    return None
+
+
+def _dependency_graph() -> dict[str, list[str]]:
+    return {row["name"]: row["depends_on"] for row in task_db.dumps()}
+
+
+def _downstream_tasks(task_name: str) -> list[str]:
+    """任务及其所有下游任务"""
+    downstream: dict[str, list[str]] = {}
+    for name, upstreams in _dependency_graph().items():
+        for upstream in upstreams:
+            downstream.setdefault(upstream, []).append(name)
+    tasks = {task_name}
+    stack = [task_name]
+    while stack:
+        for name in downstream.get(stack.pop(), ()):
+            if name not in tasks:
+                tasks.add(name)
+                stack.append(name)
+    return sorted(tasks)
+
+
+def run_pipeline(task_name: str) -> str:
+    """
+    运行以该任务为起点的流水线
+
+    先运行该任务，每个任务成功后触发流水线中上游都已完成的下游任务，互不依赖的分支并行运行。
+    返回流水线 id，用 get_pipeline 查询进度。
+    """
+    if task_name not in task_db:
+        raise errors.TaskNotFoundError(task_name)
+    pipeline = uuid.uuid4().hex[:12]
+    with _dag_lock:
+        _pipelines[pipeline] = {
+            "id": pipeline,
+            "root": task_name,
+            "tasks": _downstream_tasks(task_name),
+            "done": [],
+            "failed": None,
+            "started_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        while len(_pipelines) > _MAX_PIPELINES:
+            _pipelines.popitem(last=False)
+    _fire_task(task_name, RunTrigger.MANUAL, pipeline=pipeline)
+    return pipeline
+
+
+def get_pipeline(pipeline: str) -> dict:
+    """查询流水线进度，status 为 running、success 或 failed"""
+    with _dag_lock:
+        state = _pipelines.get(pipeline)
+        if state is None:
+            raise errors.PipelineNotFoundError(pipeline)
+        state = {key: list(value) if isinstance(value, list) else value for key, value in state.items()}
+    if state["failed"]:
+        state["status"] = "failed"
+    elif len(state["done"]) == len(state["tasks"]):
+        state["status"] = "success"
+    else:
+        state["status"] = "running"
+    return state
+
+
+def compact_run_history():
+    """按保留策略清理运行记录，由调度器定期调用"""
+    return history.compact()
+
 
 def list_projects():
-    projects: list[dict] = [v.model_dump() for v in project_db.values()]
+    prewarm_status = prewarmer.status()
+    projects: list[dict] = []
+    for row in project_db.dumps():
+        project = dict(row)
+        status = prewarm_status.get(project["name"])
+        project["env_state"] = status["state"] if status else None
+        projects.append(project)
     return projects
 
 
 def list_tasks():
-    tasks: list[dict] = [v.model_dump() for v in task_db.values()]
+    tasks: list[dict] = task_db.dumps()
     return tasks
 
 
-def clone_project(url: str, name: str | None = None):
+def _dependency_changed(update: ProjectUpdate) -> bool:
+    """新克隆或依赖文件有变化时，工程的虚拟环境才需要重新构建"""
+    return update.old_sha is None or any(file in DEPENDENCY_FILES for file in update.changed_files)
+
+
+def clone_project(url: str, name: str | None = None, timeout: float | None = None) -> ProjectUpdate:
     project_name = name if name else url.split("/")[-1]
 
     created_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -39,7 +511,6 @@ def clone_project(url: str, name: str | None = None):
         project_info: ProjectInfo = project_db[project_name]
         project_info.url = url
         project_info.project_path = str(project_path)
-        project_info.upgrade_at = created_at
     else:
         project_info = ProjectInfo(
             name=project_name,
@@ -49,43 +520,168 @@ def clone_project(url: str, name: str | None = None):
             upgrade_at=created_at,
         )
 
-    project_downloader.download()
+    update = project_downloader.download(timeout=timeout)
+    if update.changed:
+        project_info.upgrade_at = created_at
 
     project_db[project_name] = project_info
+    _apply_project_limit(project_info)
+    if cfg.PREWARM_ON_UPDATE and project_path.is_dir() and _dependency_changed(update):
+        prewarm_project(project_name)
+    return update
+
+
+def prewarm_project(project_name: str):
+    """在后台构建工程的虚拟环境，期间触发的任务会等待构建完成"""
+    project_info: ProjectInfo = project_db.get(project_name)
+    if not project_info:
+        raise errors.ProjectNotFoundError(project_name)
+    return prewarmer.submit(project_name, Path(project_info.project_path))
+
+
+def get_prewarm_status(project_name: str | None = None):
+    """工程虚拟环境的预热状态，project_name 为空时返回所有工程"""
+    return prewarmer.status(project_name)
 
 
-def pull_project(project_name: str):
+def pull_project(project_name: str, timeout: float | None = None) -> ProjectUpdate:
     project_info: ProjectInfo = project_db.get(project_name)
     if not project_info:
         raise errors.ProjectNotFoundError(project_name)
 
-    clone_project(
+    return clone_project(
         url=project_info.url,
         name=project_info.name,
+        timeout=timeout,
     )
 
 
+def _pull_one(project_name: str, timeout: float) -> dict:
+    start = time.monotonic()
+    result = {"status": "failed", "old_sha": None, "new_sha": None, "changed_files": [], "error": None}
+    try:
+        update = pull_project(project_name, timeout=timeout)
+        result.update(update.model_dump(), status="updated" if update.changed else "unchanged")
+    except Exception as e:
+        elapsed = time.monotonic() - start
+        result.update(status="timeout" if timeout and elapsed >= timeout else "failed", error=str(e))
+        _logger.error(f"pull project {project_name} failed: {e}")
+    result["duration"] = round(time.monotonic() - start, 3)
+    return result
+
+
+def pull_all_projects(max_workers: int | None = None, timeout: float | None = None) -> dict:
+    """
+    在线程池中并行拉取所有 Git 工程，返回汇总报告
+
+    参数:
+        max_workers (int): 并发数，默认使用 PULL_MAX_WORKERS
+        timeout (float): 单个工程的超时时间（秒），默认使用 PULL_TIMEOUT
+    """
+    max_workers = max_workers or cfg.PULL_MAX_WORKERS
+    timeout = cfg.PULL_TIMEOUT if timeout is None else timeout
+    names = [name for name, info in project_db.items() if info.url]
+
+    with _pull_lock:
+        if _pull_progress["running"]:
+            raise errors.PullInProgressError()
+        _pull_progress.clear()
+        _pull_progress.update(
+            running=True,
+            total=len(names),
+            done=0,
+            started_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            finished_at=None,
+            results={},
+        )
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="qinglong-pull") as executor:
+            futures = {executor.submit(_pull_one, name, timeout): name for name in names}
+            for future in as_completed(futures):
+                with _pull_lock:
+                    _pull_progress["results"][futures[future]] = future.result()
+                    _pull_progress["done"] += 1
+    finally:
+        with _pull_lock:
+            _pull_progress.update(running=False, finished_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+
+    return get_pull_progress()
+
+
+def get_pull_progress() -> dict:
+    """当前或最近一次批量拉取的进度和结果"""
+    with _pull_lock:
+        progress = dict(_pull_progress)
+        progress["results"] = dict(progress["results"])
+    summary = {"updated": 0, "unchanged": 0, "failed": 0, "timeout": 0}
+    for result in progress["results"].values():
+        summary[result["status"]] += 1
+    progress["summary"] = summary
+    return progress
+
+
 def remove_project(project_name: str):
     project_info: ProjectInfo = project_db.get(project_name)
     if not project_info:
         raise errors.ProjectNotFoundError(project_name)
 
-    # TODO: 这里需要删除定时任务,或者对存在定时任务的工程报错。
-
     base_path = cfg.PROJECT_PATH
     project_path = base_path / project_info.name
     _logger.debug(f"remove project: {project_path},absolute: {project_path.absolute()}")
-    if project_path.exists():
-        if project_path.is_file():
-            project_path.unlink()
-        else:
-            _logger.debug(f"remove project use shutil: {project_path}")
-            shutil.rmtree(str(project_path.absolute()))
-    else:
+    if not project_path.exists():
         _logger.debug(f"remove project not exist: {project_path}")
         raise errors.ProjectNotFoundError(project_name)
 
+    # 先停止并删除工程下的任务，再删除工程目录
+    _remove_project_tasks(project_name)
+    if project_path.is_file():
+        project_path.unlink()
+    else:
+        _logger.debug(f"remove project use shutil: {project_path}")
+        shutil.rmtree(str(project_path.absolute()))
+
     del project_db[project_name]
+    scheduler.limiter.set_limit(f"project:{project_name}", 0)
+
+
+def _remove_project_tasks(project_name: str):
+    """级联删除工程的任务：移除调度任务、终止正在运行的进程并删除日志"""
+    task_names = task_db.index_keys(project_name)
+    tasks: list[UvTask] = []
+    terminated = []
+    for task_name in task_names:
+        _remove_task_job(task_name)
+        _cancel_pending(task_name)
+        watchers.remove(task_name)
+        task = task_dict.pop(task_name, None)
+        if task is None:
+            continue
+        tasks.append(task)
+        # 先向所有任务发送 SIGTERM，再一起等待宽限期，不逐个等待
+        try:
+            terminated.append((task, task.terminate(), time.monotonic() + task.grace))
+        except errors.TaskNotRunningError:
+            pass
+    for task, process, deadline in terminated:
+        task.wait_terminated(process, deadline)
+    for task in tasks:
+        task.remove_logs()
+    with task_db.transaction():
+        for task_name in task_names:
+            del task_db[task_name]
+    _logger.info(f"removed {len(task_names)} tasks of project {project_name}")
+
+
+def set_project_concurrency(project_name: str, limit: int | None):
+    """设置工程同时运行的任务数上限，None 表示使用全局配置，0 表示不限制"""
+    project_info: ProjectInfo = project_db.get(project_name)
+    if not project_info:
+        raise errors.ProjectNotFoundError(project_name)
+    project_info.max_concurrency = limit
+    project_db[project_name] = project_info
+    _apply_project_limit(project_info)
+    return project_info
 
 
 def get_project_config(project_name: str):
@@ -96,9 +692,30 @@ def get_project_config(project_name: str):
     return project_path / "config.yaml"
 
 
-def set_task(name: str, project_name: str, cron: str, cmd: str):
+def set_task(
+    name: str,
+    project_name: str,
+    cron: str,
+    cmd: str,
+    executor: str = "default",
+    concurrency_group: str | None = None,
+    limits: ResourceLimits | None = None,
+    timeout: float | None = None,
+    kill_grace: float | None = None,
+    retry: RetryPolicy | None = None,
+    schedule: SchedulePolicy | None = None,
+    depends_on: list[str] | None = None,
+    watch: FileWatch | None = None,
+    webhook_token: str | None = None,
+):
     if project_name not in project_db:
         raise errors.ProjectNotFoundError(project_name)
+    if not scheduler.is_thread_executor(executor):
+        raise errors.InvalidExecutorError(executor)
+    depends_on = list(depends_on or [])
+    graph = _dependency_graph() | {name: depends_on}
+    if reason := _dependency_error(graph, name):
+        raise errors.TaskDependencyError(name, reason)
 
     created_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     project_info: ProjectInfo = project_db[project_name]
@@ -110,8 +727,18 @@ def set_task(name: str, project_name: str, cron: str, cmd: str):
 
         task_info.cron = cron
         task_info.command = cmd
+        task_info.executor = executor
+        task_info.concurrency_group = concurrency_group
+        task_info.limits = limits
+        task_info.timeout = timeout
+        task_info.kill_grace = kill_grace
+        task_info.retry = retry
+        task_info.schedule = schedule
+        task_info.depends_on = depends_on
+        task_info.watch = watch
+        task_info.webhook_token = webhook_token
         task_info.upgrade_at = created_at
-        scheduler.remove_job(name)
+        _remove_task_job(name)
     else:
         task_info = TaskInfo(
             name=name,
@@ -121,26 +748,136 @@ def set_task(name: str, project_name: str, cron: str, cmd: str):
             created_at=created_at,
             upgrade_at=created_at,
             status=TaskStatus.STARTED,
+            executor=executor,
+            concurrency_group=concurrency_group,
+            limits=limits,
+            timeout=timeout,
+            kill_grace=kill_grace,
+            retry=retry,
+            schedule=schedule,
+            depends_on=depends_on,
+            watch=watch,
+            webhook_token=webhook_token,
         )
 
-    if name in task_dict:
-        task = task_dict[name]
-        task.cmd = cmd
-        task.project_path = Path(project_info.project_path)
-    else:
-        task = UvTask(name=name, cmd=task_info.command, project_path=project_info.project_path)
-        task_dict[name] = task
-
-    scheduler.add_job(func=task.run, trigger=task_info.cron, job_id=name)
+    _ensure_uvtask(task_info, project_info)
+    _add_task_job(task_info)
+    _sync_watch(task_info, project_info)
 
     task_db[name] = task_info
 
 
+def export_tasks(format: str = "json", project_name: str | None = None, include_secrets: bool = False) -> str:
+    """
+    导出任务配置为 JSON 或 YAML，可用 import_tasks 导入
+
+    默认不导出 webhook_token，导入时已有任务保留原令牌；include_secrets 为 True 时一并导出。
+    """
+    exclude = {"created_at", "upgrade_at"} if include_secrets else {"created_at", "upgrade_at", "webhook_token"}
+    rows = [
+        task_info.model_dump(mode="json", exclude=exclude)
+        for task_info in task_db.values()
+        if project_name is None or task_info.project_name == project_name
+    ]
+    if format == "json":
+        return json.dumps(rows, ensure_ascii=False, indent=2)
+    if format in ("yaml", "yml"):
+        return yaml.safe_dump(rows, allow_unicode=True, sort_keys=False)
+    raise errors.TaskImportError(f"unsupported format '{format}'")
+
+
+def _load_task_rows(data: str, format: str) -> list:
+    try:
+        if format == "json":
+            rows = json.loads(data)
+        elif format in ("yaml", "yml"):
+            rows = yaml.safe_load(data)
+        else:
+            raise errors.TaskImportError(f"unsupported format '{format}'")
+    except (ValueError, yaml.YAMLError) as e:
+        raise errors.TaskImportError(str(e)) from e
+    if not isinstance(rows, list):
+        raise errors.TaskImportError("document must be a list of tasks")
+    return rows
+
+
+def _validate_task_row(row, now: str) -> TaskInfo:
+    """校验一行导入数据，已存在的任务在原配置上更新"""
+    if not isinstance(row, dict):
+        raise ValueError("task must be a mapping")
+    name = row.get("name")
+    # 名称类型错误时交给模型校验报错，不能用来查询数据库
+    existing: TaskInfo | None = task_db.get(name) if isinstance(name, str) else None
+    base = existing.model_dump() if existing else {"created_at": now, "status": TaskStatus.STARTED}
+    task_info = TaskInfo.model_validate(base | row | {"upgrade_at": now})
+    if existing and existing.project_name != task_info.project_name:
+        raise errors.SetTaskError(task_info.name)
+    if task_info.project_name not in project_db:
+        raise errors.ProjectNotFoundError(task_info.project_name)
+    if not scheduler.is_thread_executor(task_info.executor):
+        raise errors.InvalidExecutorError(task_info.executor)
+    if task_info.cron:
+        scheduler.parse_trigger(task_info.cron)
+    return task_info
+
+
+def import_tasks(data: str, format: str = "json", skip_invalid: bool = False) -> TaskImportResult:
+    """
+    批量导入任务
+
+    先校验所有行，默认有任何一行出错时不做改动，只返回每行的错误；
+    skip_invalid 为 True 时跳过出错的行导入其余任务。
+    所有任务在一个事务中写入，提交成功后再更新 UvTask、文件监视并批量注册调度任务，
+    写入失败时内存中的状态保持不变。
+    """
+    rows = _load_task_rows(data, format)
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    result = TaskImportResult()
+    tasks: dict[str, TaskInfo] = {}
+    for index, row in enumerate(rows):
+        try:
+            task_info = _validate_task_row(row, now)
+            if task_info.name in tasks:
+                raise ValueError(f"duplicate task name '{task_info.name}'")
+        except (ValidationError, ValueError, errors.ProjectError, errors.TaskError) as e:
+            result.errors[index] = str(e)
+            continue
+        tasks[task_info.name] = task_info
+
+    # 依赖关系在整批任务导入后的结果上校验，允许同一批中的任务互相引用
+    graph = _dependency_graph() | {name: task_info.depends_on for name, task_info in tasks.items()}
+    for index, row in enumerate(rows):
+        name = row.get("name") if isinstance(row, dict) else None
+        if index not in result.errors and name in tasks and (reason := _dependency_error(graph, name)):
+            result.errors[index] = str(errors.TaskDependencyError(name, reason))
+            del tasks[name]
+
+    if result.errors and not skip_invalid:
+        return result
+
+    jobs = [_task_job(task_info) for task_info in tasks.values() if task_info.cron]
+    with task_db.transaction():
+        for name, task_info in tasks.items():
+            task_db[name] = task_info
+
+    for name, task_info in tasks.items():
+        _remove_task_job(name)
+        _ensure_uvtask(task_info, project_db[task_info.project_name])
+        _sync_watch(task_info, project_db[task_info.project_name])
+    scheduler.add_jobs(jobs)
+
+    result.imported = list(tasks)
+    _logger.info(f"imported {len(tasks)} tasks, {len(result.errors)} errors")
+    return result
+
+
 def remove_task(task_name: str):
     if task_name not in task_db:
         raise errors.TaskNotFoundError(task_name)
 
-    scheduler.remove_job(task_name)
+    _remove_task_job(task_name)
+    _cancel_pending(task_name)
+    watchers.remove(task_name)
 
     del task_dict[task_name]
     del task_db[task_name]
@@ -151,9 +888,11 @@ def start_task(task_name: str):
         raise errors.TaskNotFoundError(task_name)
     task_info: TaskInfo = task_db[task_name]
     task_info.status = TaskStatus.STARTED
-    scheduler.resume_job(task_name)
+    if scheduler.get_job(task_name) is not None:
+        scheduler.resume_job(task_name)
     task_info.upgrade_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     task_db[task_name] = task_info
+    _sync_watch(task_info, project_db[task_info.project_name])
     return task_info
 
 
@@ -162,20 +901,32 @@ def pause_task(task_name: str):
         raise errors.TaskNotFoundError(task_name)
     task_info: TaskInfo = task_db[task_name]
     task_info.status = TaskStatus.PAUSED
-    scheduler.pause_job(task_name)
+    if scheduler.get_job(task_name) is not None:
+        scheduler.pause_job(task_name)
+    _cancel_pending(task_name)
+    watchers.remove(task_name)
     task_info.upgrade_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     task_db[task_name] = task_info
     return task_info
 
 
-def run_task(task_name: str):
+def run_task(task_name: str) -> Future:
+    """
+    立即运行一次任务，不影响定时计划和暂停状态
+
+    与定时运行共用 max_instances，任务正在运行时抛出 TaskAlreadyRunningError。
+    返回的 Future 在这次运行结束时完成，结果为退出码；asyncio 模式下跟踪提交到事件循环的运行。
+    """
     if task_name not in task_db:
         raise errors.TaskNotFoundError(task_name)
-    task_info: TaskInfo = task_db[task_name]
-
-    scheduler.run_job(task_name, paused=(task_info.status == TaskStatus.PAUSED))
-
-    return task_info
+    job = _task_job(task_db[task_name])
+    try:
+        # 没有 cron 的任务没有调度任务，使用相同的参数提交
+        return scheduler.submit(
+            task_name, func=execute_task, args=job["args"], executor=job["executor"], trigger=RunTrigger.MANUAL.value
+        )
+    except MaxInstancesReachedError as e:
+        raise errors.TaskAlreadyRunningError(task_name) from e
 
 
 def kill_task(task_name: str):
@@ -187,6 +938,31 @@ def kill_task(task_name: str):
     task.kill()
 
 
+def get_init_metrics():
+    """各工程虚拟环境的初始化耗时，以及任务等待初始化的耗时"""
+    return init_registry.stats()
+
+
+def get_scheduler_stats() -> dict:
+    """调度延迟、线程池排队数、错过和跳过次数以及运行耗时，用于判断线程池是否饱和"""
+    stats = scheduler.stats.snapshot()
+    sizes = {"default": cfg.SCHEDULER_THREAD_POOL_SIZE, **cfg.SCHEDULER_EXECUTORS}
+    stats["pools"] = {name: {"size": sizes.get(name), "queued": queued} for name, queued in scheduler.queue_depth().items()}
+    return stats
+
+
+def get_task_runs(task_name: str, since: datetime | float | None = None, limit: int = 100) -> list[dict]:
+    """查询任务最近的运行记录，按开始时间倒序"""
+    if task_name not in task_db:
+        raise errors.TaskNotFoundError(task_name)
+    return [record.model_dump() | {"duration": record.duration} for record in history.query(task_name, since, limit)]
+
+
+def get_resource_usage(since: datetime | float | None = None, limit: int = 20) -> list[dict]:
+    """按 CPU 时间排序的各任务资源用量汇总"""
+    return history.top(since, limit)
+
+
 def get_task_logs(task_name: str, limit: int = 1000):
     if task_name not in task_db:
         raise errors.TaskNotFoundError(task_name)
@@ -197,37 +973,87 @@ def get_task_logs(task_name: str, limit: int = 1000):
 
 
 def sync_project():
-    for task_name, task_info in task_db.items():
-        project_name = task_info.project_name
-        if project_name not in project_db:
-            del task_db[task_name]
+    with task_db.transaction():
+        for project_name in task_db.index_values():
+            if project_name not in project_db:
+                for task_name in task_db.index_keys(project_name):
+                    del task_db[task_name]
+
+
+def reap_orphans() -> list[str]:
+    """
+    清理上次面板异常退出时遗留的任务进程组
+
+    只应在启动时、运行任何任务之前调用一次。
+    """
+    reaped = pidfiles.reap()
+    abandoned = history.abandon_running()
+    if reaped or abandoned:
+        _logger.warning(f"reaped orphan tasks: {reaped}, {abandoned} unfinished runs marked failed")
+    return reaped
 
 
 def init_task():
-    UvTask.python_upgrade()
-    UvTask.cache_prune()
+    """
+    启动时加载任务
+
+    为每个任务创建 UvTask，并只对与 task_db 不一致的调度任务做增删改，
+    持久化存储中未变化的调度任务保留原有的下次运行时间和暂停状态。
+    """
+    if cfg.UV_MAINTENANCE_ON_START:
+        UvTask.python_upgrade()
+        UvTask.cache_prune()
+    for project_info in project_db.values():
+        _apply_project_limit(project_info)
+
+    jobs = {job.id: job for job in scheduler.jobs}
     for task_name, task_info in task_db.items():
         if task_info.project_name not in project_db:
             continue
 
-        # 如果任务已存在，不添加，避免重新加载时的冲突
-        if task_name in [job.id for job in scheduler.jobs]:
-            _logger.error(f"task {task_name} already exists, removing and adding again")
-            continue
+        # 重新加载时保留已有的任务对象，避免丢失正在运行的进程，只更新其配置
+        _ensure_uvtask(task_info, project_db[task_info.project_name])
+        _sync_watch(task_info, project_db[task_info.project_name])
+
+        job = jobs.pop(task_name, None)
+        paused = task_info.status == TaskStatus.PAUSED
+        if job is None or job.name != _job_signature(task_info):
+            if job is not None:
+                scheduler.remove_job(task_name)
+            _add_task_job(task_info)
+        elif paused != (job.next_run_time is None):
+            if paused:
+                scheduler.pause_job(task_name)
+            else:
+                scheduler.resume_job(task_name)
 
-        project_info: ProjectInfo = project_db[task_info.project_name]
-        task = UvTask(name=task_name, cmd=task_info.command, project_path=project_info.project_path)
-        task_dict[task_name] = task
+    # 任务已被删除，但调度任务（包括待执行的重试）还留在持久化存储中
+    for job_id, job in jobs.items():
+        if job.func is execute_task and job.args[0] not in task_db:
+            _logger.info(f"remove orphan job: {job_id}")
+            scheduler.remove_job(job_id)
 
+    if cfg.RUN_HISTORY_COMPACT_INTERVAL > 0:
         scheduler.add_job(
-            func=task.run, trigger=task_info.cron, job_id=task_name, paused=(task_info.status == TaskStatus.PAUSED)
+            job_id=_HISTORY_COMPACT_JOB,
+            func=compact_run_history,
+            trigger=cfg.RUN_HISTORY_COMPACT_INTERVAL,
+            replace_existing=True,
         )
 
+    scheduler.resume()
+
 
 def sync_task():
     tasks = set(task_db.keys())
-    jobs = set(job.id for job in scheduler.jobs)
-    for task_name in tasks - jobs:
-        del task_db[task_name]
-    for job_name in jobs - tasks:
-        scheduler.remove_job(job_name)
+    # 只对比运行任务的调度任务，不影响清理运行记录等内部任务
+    task_jobs = [job for job in scheduler.jobs if job.func is execute_task]
+    jobs = set(job.id for job in task_jobs)
+    # 没有 cron 的任务本来就没有调度任务
+    scheduled = {row["name"] for row in task_db.dumps() if row["cron"]}
+    with task_db.transaction():
+        for task_name in scheduled - jobs:
+            del task_db[task_name]
+    for job in task_jobs:
+        if job.args[0] not in tasks:
+            scheduler.remove_job(job.id)
@@ -1,4 +1,5 @@
 from pathlib import Path
+from typing import Literal
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -19,7 +20,63 @@ class Settings(BaseSettings):
     TASK_LOG_MAX_BYTES: int = 1024 * 1024
     # 任务日志备份数量
     TASK_LOG_BACKUP_COUNT: int = 5
+    # 任务日志批量刷新间隔（秒），0 表示每行立即刷新
+    TASK_LOG_FLUSH_INTERVAL: float = 1.0
+    # 任务日志写缓冲大小（字节）
+    TASK_LOG_FLUSH_BYTES: int = 64 * 1024
+    # 任务日志每次刷新后是否 fsync
+    TASK_LOG_FSYNC: bool = False
     DEBUG: bool = True
+    # 任务执行引擎：thread 每次运行占用一个调度线程；asyncio 由共享事件循环监管所有子进程
+    TASK_RUNNER: Literal["thread", "asyncio"] = "thread"
+    # clone/pull 之后是否在后台预先构建工程虚拟环境
+    PREWARM_ON_UPDATE: bool = True
+    # 预热虚拟环境的线程数
+    PREWARM_WORKERS: int = 2
+    # 批量拉取工程时的并发数
+    PULL_MAX_WORKERS: int = 8
+    # 批量拉取时单个工程的超时时间（秒）
+    PULL_TIMEOUT: float = 300
+    # 调度任务存储：memory 每次启动重建；sqlite 持久化到 DB_PATH/jobs.sqlite（需要安装 sqlite 可选依赖：uv sync --extra sqlite）
+    SCHEDULER_JOBSTORE: Literal["memory", "sqlite"] = "memory"
+    # 启动时是否执行 uv python upgrade 和 uv cache prune
+    UV_MAINTENANCE_ON_START: bool = True
+    # 调度器默认线程池大小
+    SCHEDULER_THREAD_POOL_SIZE: int = 10
+    # 额外的命名线程池及大小，例如 {"io": 20, "cpu": 4}，任务通过 executor 字段选择
+    SCHEDULER_EXECUTORS: dict[str, int] = {}
+    # 同一工程同时运行的任务数上限，0 表示不限制，可被工程自身的设置覆盖
+    PROJECT_MAX_CONCURRENCY: int = 0
+    # 并发组及其上限，例如 {"browser": 2}，任务通过 concurrency_group 字段加入
+    CONCURRENCY_GROUPS: dict[str, int] = {}
+    # 任务错过触发时间后仍然运行的宽限时间（秒），0 表示总是运行；排队等待线程池的运行也按此判断
+    SCHEDULER_MISFIRE_GRACE_TIME: int = 0
+    # 任务错过多次触发（例如面板停止期间）时是否合并为一次运行
+    SCHEDULER_COALESCE: bool = True
+    # 任务每次触发随机延迟的最大秒数，0 表示不延迟
+    SCHEDULER_JITTER: int = 0
+    # 按任务名散列错开相同触发时间的任务，最大延迟秒数，0 表示不错开
+    SCHEDULER_SPREAD: int = 0
+
+    # 运行记录保留天数，0 表示不按时间清理
+    RUN_HISTORY_RETENTION_DAYS: int = 30
+    # 每个任务最多保留的运行记录数，0 表示不限制
+    RUN_HISTORY_MAX_PER_TASK: int = 10000
+    # 清理运行记录的间隔（秒）
+    RUN_HISTORY_COMPACT_INTERVAL: int = 3600
+    # 任务超时后从 SIGTERM 到 SIGKILL 的默认宽限时间（秒）
+    TASK_KILL_GRACE: float = 5.0
+    # asyncio 模式下采样子进程资源用量的间隔（秒）
+    RESOURCE_SAMPLE_INTERVAL: float = 1.0
+    # 未安装 watchfiles 时轮询监视目录的间隔（秒）
+    WATCH_POLL_INTERVAL: float = 2.0
+
+    # 文件下载共享连接池的最大连接数
+    DOWNLOAD_MAX_CONNECTIONS: int = 20
+    # 文件下载的超时时间（秒）
+    DOWNLOAD_TIMEOUT: float = 30
+    # 流式下载和校验时每次读写的块大小
+    DOWNLOAD_CHUNK_SIZE: int = 1024 * 1024
 
     DOWNLOAD_HEADERS: dict = {
         "Sec-Ch-Ua": '"Google Chrome";v="123", "Not:A-Brand";v="8", "Chromium";v="123"',
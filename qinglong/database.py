@@ -1,9 +1,144 @@
+import threading
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+
 import shelvez as shelve
+from pydantic import BaseModel
 from .config import settings as cfg
 from .models import ProjectInfo, TaskInfo
 
 _project_serializer = shelve.serialer.PydanticSerializer(ProjectInfo)  # type: ignore[arg-type]
 _task_serializer = shelve.serialer.PydanticSerializer(TaskInfo)  # type: ignore[arg-type]
 
-project_db = shelve.open(cfg.DB_PATH / "project.sqlite", serializer=_project_serializer)
-task_db = shelve.open(cfg.DB_PATH / "task.sqlite", serializer=_task_serializer)
+
+class CachedStore(MutableMapping):
+    """
+    shelvez 存储的内存读缓存
+
+    首次访问时把所有记录解码一次，之后的读取都走内存；写入时同时更新存储和缓存。
+    读取返回副本，调用方修改后需要写回才会生效。
+    指定 index 字段时，同时维护该字段值到键的二级索引。
+    """
+
+    def __init__(self, shelf, index: str | None = None):
+        self.shelf = shelf
+        self.index = index
+        self._lock = threading.RLock()
+        self._cache: dict[str, BaseModel] | None = None
+        self._index: dict[str, dict[str, None]] = {}
+        # model_dump 的结果，供列表接口直接返回
+        self._dumps: list[dict] | None = None
+
+    @property
+    def cache(self) -> dict[str, BaseModel]:
+        with self._lock:
+            if self._cache is None:
+                self._cache = {key: self.shelf[key] for key in self.shelf}
+                self._index = {}
+                for key, value in self._cache.items():
+                    self._index_add(key, value)
+            return self._cache
+
+    def _index_add(self, key: str, value: BaseModel):
+        if self.index:
+            self._index.setdefault(getattr(value, self.index), {})[key] = None
+
+    def _index_remove(self, key: str, value: BaseModel):
+        if self.index:
+            field = getattr(value, self.index)
+            keys = self._index.get(field, {})
+            keys.pop(key, None)
+            if not keys:
+                self._index.pop(field, None)
+
+    def index_keys(self, value) -> list[str]:
+        """索引字段等于 value 的所有键"""
+        with self._lock:
+            self.cache
+            return list(self._index.get(value, ()))
+
+    def index_values(self) -> list:
+        """索引字段当前出现过的所有值"""
+        with self._lock:
+            self.cache
+            return list(self._index)
+
+    def invalidate(self):
+        """丢弃缓存，下次访问时重新从存储加载"""
+        with self._lock:
+            self._cache = None
+            self._index = {}
+            self._dumps = None
+
+    def __getitem__(self, key: str):
+        return self.cache[key].model_copy(deep=True)
+
+    def __setitem__(self, key: str, value: BaseModel):
+        with self._lock:
+            self.shelf[key] = value
+            old = self.cache.get(key)
+            if old is not None:
+                self._index_remove(key, old)
+            self.cache[key] = value.model_copy(deep=True)
+            self._index_add(key, value)
+            self._dumps = None
+
+    def __delitem__(self, key: str):
+        with self._lock:
+            del self.shelf[key]
+            old = self.cache.pop(key, None)
+            if old is not None:
+                self._index_remove(key, old)
+            self._dumps = None
+
+    def __contains__(self, key):
+        return key in self.cache
+
+    def __iter__(self):
+        # 迭代键的快照，允许在遍历时删除
+        return iter(list(self.cache))
+
+    def __len__(self):
+        return len(self.cache)
+
+    def clear(self):
+        with self._lock:
+            self.shelf.clear()
+            self._cache = {}
+            self._index = {}
+            self._dumps = None
+
+    def dumps(self) -> list[dict]:
+        """所有记录的 model_dump 结果，未修改时直接返回缓存，返回的字典不应被修改"""
+        with self._lock:
+            if self._dumps is None:
+                self._dumps = [value.model_dump() for value in self.cache.values()]
+            return list(self._dumps)
+
+    @contextmanager
+    def transaction(self):
+        """在一个事务中批量写入，出错时回滚并重新加载缓存"""
+        with self._lock:
+            # shelvez 的连接为 autocommit 模式，需要显式开启和提交事务
+            cx = self.shelf.dict._cx
+            if cx.in_transaction:
+                # 已经在事务中，合并到外层事务
+                yield self
+                return
+            cx.execute("BEGIN")
+            try:
+                yield self
+            except BaseException:
+                cx.execute("ROLLBACK")
+                self.invalidate()
+                raise
+            cx.execute("COMMIT")
+
+    def close(self):
+        with self._lock:
+            self.shelf.close()
+            self.invalidate()
+
+
+project_db = CachedStore(shelve.open(cfg.DB_PATH / "project.sqlite", serializer=_project_serializer))
+task_db = CachedStore(shelve.open(cfg.DB_PATH / "task.sqlite", serializer=_task_serializer), index="project_name")
@@ -1,28 +1,149 @@
 from pathlib import Path
+import hashlib
 import logging
+import os
+import shutil
+import signal
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import httpx
-from git import Repo
+from git import GitCommandError, Repo
 from .config import settings as cfg
+from .models import ProjectUpdate
+from . import errors
 
 _logger = logging.getLogger(__name__)
 
+_client: httpx.Client | None = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> httpx.Client:
+    """所有下载共享的连接池客户端，支持 HTTP/2"""
+    global _client
+    with _client_lock:
+        if _client is None or _client.is_closed:
+            _client = httpx.Client(
+                http2=True,
+                headers=cfg.DOWNLOAD_HEADERS,
+                timeout=cfg.DOWNLOAD_TIMEOUT,
+                follow_redirects=True,
+                limits=httpx.Limits(max_connections=cfg.DOWNLOAD_MAX_CONNECTIONS),
+            )
+        return _client
+
 
 class FileDownloader:
-    def __init__(self, url, filepath, cookies=None):
+    def __init__(self, url, filepath, cookies=None, checksum: str | None = None):
+        """
+        参数:
+            url (str): 下载地址
+            filepath (str): 保存路径
+            cookies (dict): 请求携带的 cookies
+            checksum (str): 可选的校验值，格式为 "算法:摘要"，例如 "sha256:..."，省略算法时使用 sha256
+        """
         self.url = url
         self.filepath = Path(filepath)
-        self.session = httpx.Client()
-        self.session.headers.update(cfg.DOWNLOAD_HEADERS)
-        if cookies:
-            self.session.cookies.update(cookies)
+        self.cookies = cookies
+        self.checksum = checksum
+        self.session = get_client()
+
+    @property
+    def partpath(self) -> Path:
+        """下载中的临时文件，下载完成并校验通过后原子地重命名为目标文件"""
+        return self.filepath.with_name(self.filepath.name + ".part")
+
+    @property
+    def validatorpath(self) -> Path:
+        """临时文件对应的 ETag 或 Last-Modified，续传时作为 If-Range 发送，确保远端文件没有变化"""
+        return self.filepath.with_name(self.filepath.name + ".part.validator")
+
+    def _load_validator(self) -> str | None:
+        try:
+            return self.validatorpath.read_text().strip() or None
+        except OSError:
+            return None
+
+    def _save_validator(self, response: httpx.Response):
+        etag = response.headers.get("ETag")
+        # If-Range 只能使用强 ETag，弱 ETag 时退回 Last-Modified
+        validator = etag if etag and not etag.startswith("W/") else response.headers.get("Last-Modified")
+        if validator:
+            self.validatorpath.write_text(validator)
+        else:
+            self.validatorpath.unlink(missing_ok=True)
+
+    def _headers(self, offset: int, validator: str | None = None) -> dict:
+        headers = {}
+        if self.cookies:
+            headers["Cookie"] = "; ".join(f"{k}={v}" for k, v in self.cookies.items())
+        if offset:
+            headers["Range"] = f"bytes={offset}-"
+            headers["If-Range"] = validator
+        return headers
+
+    def _verify(self, path: Path):
+        algorithm, _, expected = self.checksum.rpartition(":")
+        digest = hashlib.new(algorithm or "sha256")
+        with open(path, "rb") as f:
+            while chunk := f.read(cfg.DOWNLOAD_CHUNK_SIZE):
+                digest.update(chunk)
+        if digest.hexdigest().lower() != expected.lower():
+            path.unlink(missing_ok=True)
+            raise errors.ChecksumMismatchError(self.url, expected, digest.hexdigest())
+
+    def _fetch(self, resume=True):
+        part = self.partpath
+        validator = self._load_validator() if resume else None
+        # 没有记录校验值时无法确认临时文件与远端是同一个文件，从头下载
+        offset = part.stat().st_size if validator and part.exists() else 0
+        with self.session.stream("GET", self.url, headers=self._headers(offset, validator)) as response:
+            if response.status_code == httpx.codes.REQUESTED_RANGE_NOT_SATISFIABLE and offset:
+                # 临时文件比远端还大，无法续传，重新下载
+                _logger.debug(f"Range not satisfiable, restart download: {self.url}")
+                return self._fetch(resume=False)
+            response.raise_for_status()
+            if response.status_code == httpx.codes.PARTIAL_CONTENT:
+                if not response.headers.get("Content-Range", "").startswith(f"bytes {offset}-"):
+                    # 返回的片段不是从临时文件末尾开始，拼接会损坏文件，重新下载
+                    _logger.debug(f"Content-Range mismatch, restart download: {self.url}")
+                    return self._fetch(resume=False)
+            else:
+                # 服务端不支持 Range，或 If-Range 不匹配（远端文件已变化）返回了完整文件，从头下载
+                offset = 0
+            if not offset:
+                self._save_validator(response)
+            with open(part, "ab" if offset else "wb") as f:
+                for chunk in response.iter_bytes(cfg.DOWNLOAD_CHUNK_SIZE):
+                    f.write(chunk)
 
-    def download(self):
+    def download(self) -> Path:
+        """流式下载到临时文件，支持断点续传，完成后校验并重命名为目标文件"""
         url = self.url
         _logger.debug(f"Downloading file from {url} to {self.filepath}")
-        response = self.session.get(url, timeout=30)
-        response.raise_for_status()
+        self.filepath.parent.mkdir(parents=True, exist_ok=True)
+        self._fetch()
+        if self.checksum:
+            self._verify(self.partpath)
+        self.partpath.replace(self.filepath)
+        self.validatorpath.unlink(missing_ok=True)
         _logger.debug(f"Downloaded file from {url} to {self.filepath}")
-        self.filepath.write_bytes(response.content)
+        return self.filepath
+
+
+def download_files(downloaders: list[FileDownloader], max_workers: int = 4) -> list[Path | Exception]:
+    """并发下载多个文件，按输入顺序返回保存路径，失败的返回对应的异常"""
+
+    def download(downloader: FileDownloader):
+        try:
+            return downloader.download()
+        except Exception as e:
+            _logger.error(f"Download {downloader.url} failed: {e}")
+            return e
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="qinglong-download") as executor:
+        return list(executor.map(download, downloaders))
 
 
 class ProjectDownloder:
@@ -30,9 +151,71 @@ class ProjectDownloder:
         self.url = url
         self.projectpath = Path(projectpath)
 
-    def download(self):
+    def download(self, timeout: float | None = None) -> ProjectUpdate:
+        """
+        克隆或增量更新工程
+
+        参数:
+            timeout (float): git 命令的超时时间（秒），超时后终止 git 进程
+        """
         if not self.projectpath.exists():
-            repo = Repo.clone_from(self.url, self.projectpath, depth=1)
-        else:
-            repo = Repo(self.projectpath)
-            res = repo.remotes.origin.pull()
+            self._clone(timeout)
+            return ProjectUpdate(new_sha=Repo(self.projectpath).head.commit.hexsha)
+        return self.update(Repo(self.projectpath), timeout=timeout)
+
+    def _clone(self, timeout: float | None):
+        # Repo.clone_from 会忽略 kill_after_timeout，这里直接运行 git 并自行超时
+        # git 会派生 git-remote-http 等子进程，超时后终止整个进程组，并删除克隆了一半的目录
+        command = ["git", "clone", "--depth", "1", "--", self.url, str(self.projectpath)]
+        process = subprocess.Popen(
+            command,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            text=True,
+            env={**os.environ, "GIT_TERMINAL_PROMPT": "0"},
+            start_new_session=True,
+        )
+        try:
+            _, stderr = process.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            os.killpg(process.pid, signal.SIGKILL)
+            process.communicate()
+            shutil.rmtree(self.projectpath, ignore_errors=True)
+            raise GitCommandError(command, "timeout", f"clone timed out after {timeout}s")
+        if process.returncode != 0:
+            shutil.rmtree(self.projectpath, ignore_errors=True)
+            raise GitCommandError(command, process.returncode, stderr)
+
+    def update(self, repo: Repo, timeout: float | None = None) -> ProjectUpdate:
+        """fetch 当前分支的上游，有新提交时快进并返回变化的文件，没有变化时不改动工作区"""
+        old_sha = repo.head.commit.hexsha
+        if repo.head.is_detached:
+            return self._update_pinned(repo, old_sha, timeout)
+        branch = repo.active_branch
+        tracking = branch.tracking_branch()
+        remote_branch = tracking.remote_head if tracking is not None else branch.name
+
+        fetch_info = repo.remotes.origin.fetch(remote_branch, kill_after_timeout=timeout)
+        new_sha = fetch_info[0].commit.hexsha
+        if new_sha == old_sha:
+            _logger.debug(f"Project {self.projectpath} is up to date at {old_sha}")
+            return ProjectUpdate(old_sha=old_sha, new_sha=new_sha)
+
+        changed_files = repo.git.diff("--name-only", old_sha, new_sha).splitlines()
+        repo.git.merge("--ff-only", new_sha, kill_after_timeout=timeout)
+        _logger.debug(f"Project {self.projectpath} updated {old_sha[:8]} -> {new_sha[:8]}: {changed_files}")
+        return ProjectUpdate(old_sha=old_sha, new_sha=new_sha, changed_files=changed_files)
+
+    def _update_pinned(self, repo: Repo, old_sha: str, timeout: float | None = None) -> ProjectUpdate:
+        """HEAD 固定在标签或提交上时不跟随分支，只在所在的标签被移动后切换到标签的新位置"""
+        tags = [tag.name for tag in repo.tags if tag.commit.hexsha == old_sha]
+        repo.remotes.origin.fetch(tags=True, force=True, kill_after_timeout=timeout)
+        for tag in tags:
+            new_sha = repo.tags[tag].commit.hexsha
+            if new_sha != old_sha:
+                changed_files = repo.git.diff("--name-only", old_sha, new_sha).splitlines()
+                repo.git.checkout(new_sha, kill_after_timeout=timeout)
+                _logger.debug(f"Project {self.projectpath} tag {tag} moved {old_sha[:8]} -> {new_sha[:8]}")
+                return ProjectUpdate(old_sha=old_sha, new_sha=new_sha, changed_files=changed_files)
+        _logger.info(f"Project {self.projectpath} is pinned at {tags[0] if tags else old_sha[:8]}, skip update")
+        return ProjectUpdate(old_sha=old_sha, new_sha=old_sha)
@@ -15,6 +15,16 @@ class ProjectNotFoundError(ProjectError):
         return f"Project '{self.project_name}' not found."
 
 
+class PullInProgressError(ProjectError):
+    """Raised when a bulk pull is started while another one is running."""
+
+    def __init__(self):
+        super().__init__("A bulk pull is already in progress.")
+
+    def __str__(self):
+        return "A bulk pull is already in progress."
+
+
 class TaskError(Exception):
     """Base class for all exceptions raised by the task."""
 
@@ -52,3 +62,90 @@ class TaskNotRunningError(TaskError):
 
     def __str__(self):
         return f"Task '{self.task_name}' is not running."
+
+
+class TaskAlreadyRunningError(TaskError):
+    """Raised when a task is already running."""
+
+    def __init__(self, task_name: str):
+        super().__init__(f"Task '{task_name}' is already running.")
+        self.task_name = task_name
+
+    def __str__(self):
+        return f"Task '{self.task_name}' is already running."
+
+
+class TriggerRejectedError(TaskError):
+    """Raised when an external trigger is not accepted."""
+
+    def __init__(self, task_name: str, reason: str):
+        super().__init__(f"Trigger of task '{task_name}' rejected: {reason}.")
+        self.task_name = task_name
+        self.reason = reason
+
+    def __str__(self):
+        return f"Trigger of task '{self.task_name}' rejected: {self.reason}."
+
+
+class InvalidExecutorError(TaskError):
+    """Raised when a task is assigned to an executor that can not run it."""
+
+    def __init__(self, executor: str):
+        super().__init__(f"Executor '{executor}' can not run tasks.")
+        self.executor = executor
+
+    def __str__(self):
+        return f"Executor '{self.executor}' can not run tasks."
+
+
+class TaskDependencyError(TaskError):
+    """Raised when task dependencies are invalid."""
+
+    def __init__(self, task_name: str, reason: str):
+        super().__init__(f"Task '{task_name}' has invalid dependencies: {reason}.")
+        self.task_name = task_name
+        self.reason = reason
+
+    def __str__(self):
+        return f"Task '{self.task_name}' has invalid dependencies: {self.reason}."
+
+
+class PipelineNotFoundError(TaskError):
+    """Raised when a pipeline is not found."""
+
+    def __init__(self, pipeline: str):
+        super().__init__(f"Pipeline '{pipeline}' not found.")
+        self.pipeline = pipeline
+
+    def __str__(self):
+        return f"Pipeline '{self.pipeline}' not found."
+
+
+class TaskImportError(TaskError):
+    """Raised when a task import document can not be parsed."""
+
+    def __init__(self, reason: str):
+        super().__init__(f"Task import failed: {reason}.")
+        self.reason = reason
+
+    def __str__(self):
+        return f"Task import failed: {self.reason}."
+
+
+class DownloadError(Exception):
+    """Base class for all exceptions raised by the downloader."""
+
+    pass
+
+
+class ChecksumMismatchError(DownloadError):
+    """Raised when a downloaded file does not match the expected checksum."""
+
+    def __init__(self, url: str, expected: str, actual: str):
+        super().__init__(f"Checksum mismatch for '{url}': expected {expected}, got {actual}.")
+        self.url = url
+        self.expected = expected
+        self.actual = actual
+
+    def __str__(self):
+        return f"Checksum mismatch for '{self.url}': expected {self.expected}, got {self.actual}."
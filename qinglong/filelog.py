@@ -1,11 +1,104 @@
+import os
+import io
+import time
+import threading
+import weakref
 from pathlib import Path
 from datetime import datetime
 from collections import deque
 from itertools import islice
 
 
+def tail_lines(filename, limit: int, encoding="utf-8", block_size=64 * 1024) -> list[str]:
+    """
+    从文件末尾按块反向读取最后 limit 行
+
+    只解码最终返回的行，读到足够的换行符后立即停止，不会读取整个文件。
+
+    返回:
+        list[str]: 由新到旧排列的行
+    """
+    if limit <= 0:
+        return []
+
+    chunks = []
+    newlines = 0
+    with open(filename, "rb") as f:
+        pos = f.seek(0, os.SEEK_END)
+        # 多读一个换行符，确保最旧的一行是完整的
+        while pos > 0 and newlines <= limit:
+            size = min(block_size, pos)
+            pos -= size
+            f.seek(pos)
+            chunk = f.read(size)
+            chunks.append(chunk)
+            newlines += chunk.count(b"\n")
+
+    lines = b"".join(reversed(chunks)).splitlines()
+    if pos > 0:
+        # 第一行可能只读到了一半
+        lines = lines[1:]
+    return [line.decode(encoding, errors="replace") for line in reversed(lines[-limit:])]
+
+
+class _Flusher:
+    """
+    后台刷新线程，所有批量模式的日志文件共用
+
+    写入后一直没有新行时，由该线程在刷新间隔到达后把缓冲的数据落盘，保证实时日志的延迟不超过刷新间隔。
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._pending: weakref.WeakSet = weakref.WeakSet()
+        self._thread: threading.Thread | None = None
+
+    def schedule(self, log_file: "RotatingLogFile"):
+        with self._cond:
+            if log_file in self._pending:
+                return
+            self._pending.add(log_file)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="log-flusher", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                files = list(self._pending)
+                now = time.monotonic()
+                due = [f for f in files if now - f._last_flush >= f.flush_interval]
+                if not due:
+                    self._cond.wait(min(f._last_flush + f.flush_interval for f in files) - now)
+                    continue
+            # 不持有本线程的锁时获取文件锁，避免与 write 交叉加锁
+            for log_file in due:
+                log_file._flush_if_due()
+            with self._cond:
+                for log_file in due:
+                    if not log_file._dirty:
+                        self._pending.discard(log_file)
+
+
+_flusher = _Flusher()
+
+
 class RotatingLogFile:
-    def __init__(self, filename, max_size=1024 * 1024, backup_count=5, encoding="utf-8", mode="a", buffer_lines=1000):
+    def __init__(
+        self,
+        filename,
+        max_size=1024 * 1024,
+        backup_count=5,
+        encoding="utf-8",
+        mode="a",
+        buffer_lines=1000,
+        flush_interval=0.0,
+        flush_bytes=64 * 1024,
+        fsync=False,
+    ):
         """
         初始化日志文件类
 
@@ -15,6 +108,9 @@ class RotatingLogFile:
             backup_count (int): 保留的备份文件数量，默认为5
             encoding (str): 文件编码，默认为utf-8
             mode (str): 文件打开模式，默认为追加模式'a'
+            flush_interval (float): 批量刷新间隔（秒），小于等于0时每行立即刷新
+            flush_bytes (int): 批量模式下的写缓冲大小（字节），缓冲写满时由文件对象自动落盘
+            fsync (bool): 每次刷新后是否调用 fsync，保证掉电不丢日志
         """
         self.filename = Path(filename)
         self.max_size = max_size
@@ -22,13 +118,33 @@ class RotatingLogFile:
         self.encoding = encoding
         self.mode = mode
         self.buffer_lines = buffer_lines
+        self.flush_interval = flush_interval
+        self.flush_bytes = flush_bytes
+        self.fsync = fsync
 
         # 确保日志目录存在
         self.filename.parent.mkdir(exist_ok=True)
         # 打开日志文件
         self._file = None
+        # 当前日志文件大小，在内存中累加，避免每行都 stat
+        self._size = 0
+        self._last_flush = time.monotonic()
+        # 是否有写入后还未刷新的数据
+        self._dirty = False
+        self._lock = threading.RLock()
+        # 内存中的日志尾部缓存，首次读取时才从磁盘加载
+        self._buffer = None
 
-        self.buffer = deque(self._readlines(buffer_lines), maxlen=buffer_lines)
+    @property
+    def buffer(self) -> deque:
+        """最近的日志行（由新到旧），首次访问时从日志文件尾部加载"""
+        if self._buffer is None:
+            with self._lock:
+                if self._buffer is None:
+                    # 先把还在写缓冲区中的行落盘，保证读到的尾部完整
+                    self.flush()
+                    self._buffer = deque(self._readlines(self.buffer_lines), maxlen=self.buffer_lines)
+        return self._buffer
 
     def _readlines(self, hint=1000):
         lines = []
@@ -36,22 +152,28 @@ class RotatingLogFile:
             backup_file = self._backup_file(i)
             if not backup_file.exists():
                 break
-            lines.extend(reversed(backup_file.read_text(encoding=self.encoding).splitlines()))
+            lines.extend(tail_lines(backup_file, hint - len(lines), encoding=self.encoding))
             if len(lines) >= hint:
                 break
 
-        return lines[:hint]
+        return lines
+
+    @property
+    def buffered(self) -> bool:
+        """是否为批量刷新模式"""
+        return self.flush_interval > 0
 
     def _should_rotate(self):
-        """检查是否需要轮转日志"""
-        try:
-            return self.filename.stat().st_size >= self.max_size
-        except OSError:
-            return False
+        """检查是否需要轮转日志，使用内存中记录的文件大小"""
+        return self._size >= self.max_size
 
     def _open_file(self):
-        """打开日志文件"""
-        return open(self.filename, self.mode, encoding=self.encoding)
+        """打开日志文件，并同步一次当前文件大小"""
+        buffering = max(self.flush_bytes, io.DEFAULT_BUFFER_SIZE) if self.buffered else -1
+        file = open(self.filename, self.mode, encoding=self.encoding, buffering=buffering)
+        self._size = os.fstat(file.fileno()).st_size
+        self._last_flush = time.monotonic()
+        return file
 
     def _backup_file(self, backup_count):
         if backup_count == 0:
@@ -85,22 +207,41 @@ class RotatingLogFile:
         参数:
             message (str): 日志消息
         """
-        if self._should_rotate():
-            self._rotate()
-        elif self._file is None or self._file.closed:
-            self._file = self._open_file()
+        with self._lock:
+            if self._file is None or self._file.closed:
+                self._file = self._open_file()
+            if self._should_rotate():
+                self._rotate()
 
-        self.buffer.appendleft(message)
-        self._file.write(message + "\n")
-        self._file.flush()
+            if self._buffer is not None:
+                self._buffer.appendleft(message)
+            line = message + "\n"
+            self._file.write(line)
+            self._size += len(line.encode(self.encoding))
+
+            if not self.buffered or time.monotonic() - self._last_flush >= self.flush_interval:
+                self.flush()
+            else:
+                self._dirty = True
+                _flusher.schedule(self)
 
     def readlines(self, limit=1000):
         return islice(self.buffer, limit)
 
     def flush(self):
         """刷新文件缓冲区"""
-        if self._file is not None:
-            self._file.flush()
+        with self._lock:
+            if self._file is not None and not self._file.closed:
+                self._file.flush()
+                if self.fsync:
+                    os.fsync(self._file.fileno())
+            self._last_flush = time.monotonic()
+            self._dirty = False
+
+    def _flush_if_due(self):
+        with self._lock:
+            if self._dirty and time.monotonic() - self._last_flush >= self.flush_interval:
+                self.flush()
 
     def log(self, message: str, level="INFO"):
         """
@@ -120,9 +261,20 @@ class RotatingLogFile:
 
     def close(self):
         """关闭日志文件"""
-        if self._file and not self._file.closed:
-            self.flush()
-            self._file.close()
+        with self._lock:
+            if self._file and not self._file.closed:
+                self.flush()
+                self._file.close()
+
+    def remove(self):
+        """关闭并删除日志文件及所有备份"""
+        with self._lock:
+            self.close()
+            self._file = None
+            for i in range(self.backup_count + 1):
+                self._backup_file(i).unlink(missing_ok=True)
+            self._size = 0
+            self._buffer = None
 
     def __enter__(self):
         """上下文管理器入口"""
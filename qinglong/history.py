@@ -0,0 +1,193 @@
+import logging
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from .config import settings as cfg
+from .models import RunRecord, RunStatus, RunTrigger, RunUsage
+
+_logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    task TEXT NOT NULL,
+    trigger TEXT NOT NULL,
+    status TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    finished_at REAL,
+    exit_code INTEGER,
+    attempt INTEGER NOT NULL DEFAULT 1,
+    limit_breach TEXT,
+    user_time REAL,
+    system_time REAL,
+    max_rss INTEGER,
+    read_bytes INTEGER,
+    write_bytes INTEGER,
+    voluntary_switches INTEGER,
+    involuntary_switches INTEGER
+);
+CREATE INDEX IF NOT EXISTS runs_task_started_at ON runs (task, started_at);
+CREATE INDEX IF NOT EXISTS runs_started_at ON runs (started_at);
+"""
+
+_USAGE_COLUMNS = list(RunUsage.model_fields)
+_COLUMNS = ", ".join(
+    ["id", "task", "trigger", "status", "started_at", "finished_at", "exit_code", "attempt", "limit_breach", *_USAGE_COLUMNS]
+)
+
+# 清理时每批删除的行数，避免长时间占用写锁
+_DELETE_BATCH = 10000
+
+
+def _timestamp(value: datetime | float | None) -> float | None:
+    if isinstance(value, datetime):
+        return value.timestamp()
+    return value
+
+
+class RunHistory:
+    """
+    任务运行记录，只追加写入的 SQLite 表
+
+    按 (task, started_at) 建索引，按任务查询最近的记录只需要扫描索引的一段。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._cx = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._cx.execute("PRAGMA journal_mode = wal")
+        self._cx.execute("PRAGMA synchronous = normal")
+        self._cx.execute("PRAGMA busy_timeout = 5000")
+        self._cx.executescript(_SCHEMA)
+
+    def start(self, task: str, trigger: RunTrigger = RunTrigger.CRON, started_at: float | None = None, attempt: int = 1) -> int:
+        """记录一次运行开始，返回运行记录 id"""
+        started_at = time.time() if started_at is None else started_at
+        with self._lock:
+            cursor = self._cx.execute(
+                "INSERT INTO runs (task, trigger, status, started_at, attempt) VALUES (?, ?, ?, ?, ?)",
+                (task, trigger.value, RunStatus.RUNNING.value, started_at, attempt),
+            )
+        return cursor.lastrowid
+
+    def finish(
+        self,
+        run_id: int,
+        exit_code: int | None,
+        status: RunStatus | None = None,
+        usage: RunUsage | None = None,
+        limit_breach: str | None = None,
+    ):
+        """记录运行结束，未指定状态时按退出码判断成功或失败"""
+        if status is None:
+            status = RunStatus.SUCCESS if exit_code == 0 else RunStatus.FAILED
+        values = usage.model_dump() if usage else dict.fromkeys(_USAGE_COLUMNS)
+        assignments = ", ".join(f"{column} = ?" for column in _USAGE_COLUMNS)
+        with self._lock:
+            self._cx.execute(
+                f"UPDATE runs SET status = ?, finished_at = ?, exit_code = ?, limit_breach = ?, {assignments} WHERE id = ?",
+                (status.value, time.time(), exit_code, limit_breach, *values.values(), run_id),
+            )
+
+    def abandon_running(self) -> int:
+        """把上次退出时仍在运行的记录标记为失败，返回更新的行数"""
+        with self._lock:
+            cursor = self._cx.execute(
+                "UPDATE runs SET status = ?, finished_at = ? WHERE status = ?",
+                (RunStatus.FAILED.value, time.time(), RunStatus.RUNNING.value),
+            )
+        return cursor.rowcount
+
+    def get(self, run_id: int) -> RunRecord | None:
+        with self._lock:
+            row = self._cx.execute(f"SELECT {_COLUMNS} FROM runs WHERE id = ?", (run_id,)).fetchone()
+        return self._record(row) if row else None
+
+    def query(self, task: str, since: datetime | float | None = None, limit: int = 100) -> list[RunRecord]:
+        """按开始时间倒序查询任务的运行记录"""
+        sql = f"SELECT {_COLUMNS} FROM runs WHERE task = ?"
+        params: list = [task]
+        if since is not None:
+            sql += " AND started_at >= ?"
+            params.append(_timestamp(since))
+        sql += " ORDER BY started_at DESC LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._cx.execute(sql, params).fetchall()
+        return [self._record(row) for row in rows]
+
+    def top(self, since: datetime | float | None = None, limit: int = 20) -> list[dict]:
+        """按 CPU 时间汇总各任务的资源用量，用于找出占用资源最多的任务"""
+        sql = """
+            SELECT task, COUNT(*), SUM(user_time + system_time), MAX(max_rss), SUM(read_bytes), SUM(write_bytes)
+            FROM runs WHERE user_time IS NOT NULL
+        """
+        params: list = []
+        if since is not None:
+            sql += " AND started_at >= ?"
+            params.append(_timestamp(since))
+        sql += " GROUP BY task ORDER BY 3 DESC LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._cx.execute(sql, params).fetchall()
+        keys = ("task", "runs", "cpu_time", "max_rss", "read_bytes", "write_bytes")
+        return [dict(zip(keys, row)) for row in rows]
+
+    @staticmethod
+    def _record(row) -> RunRecord:
+        values = dict(zip(_COLUMNS.split(", "), row))
+        usage = {column: values.pop(column) for column in _USAGE_COLUMNS}
+        if usage["user_time"] is not None:
+            values["usage"] = RunUsage(**usage)
+        return RunRecord(**values)
+
+    def _delete_batches(self, where: str, params: tuple) -> int:
+        deleted = 0
+        while True:
+            with self._lock:
+                cursor = self._cx.execute(
+                    f"DELETE FROM runs WHERE id IN (SELECT id FROM runs WHERE {where} LIMIT {_DELETE_BATCH})", params
+                )
+            deleted += cursor.rowcount
+            if cursor.rowcount < _DELETE_BATCH:
+                return deleted
+
+    def compact(self, retention_days: int | None = None, max_per_task: int | None = None) -> int:
+        """
+        清理过期的运行记录，返回删除的行数
+
+        参数:
+            retention_days (int): 保留天数，0 表示不按时间清理
+            max_per_task (int): 每个任务最多保留的记录数，0 表示不限制
+        """
+        retention_days = cfg.RUN_HISTORY_RETENTION_DAYS if retention_days is None else retention_days
+        max_per_task = cfg.RUN_HISTORY_MAX_PER_TASK if max_per_task is None else max_per_task
+        deleted = 0
+        if retention_days > 0:
+            deleted += self._delete_batches("started_at < ?", (time.time() - retention_days * 86400,))
+        if max_per_task > 0:
+            with self._lock:
+                tasks = [row[0] for row in self._cx.execute("SELECT DISTINCT task FROM runs")]
+            for task in tasks:
+                with self._lock:
+                    row = self._cx.execute(
+                        "SELECT started_at FROM runs WHERE task = ? ORDER BY started_at DESC LIMIT 1 OFFSET ?",
+                        (task, max_per_task - 1),
+                    ).fetchone()
+                if row:
+                    deleted += self._delete_batches("task = ? AND started_at < ?", (task, row[0]))
+        if deleted:
+            with self._lock:
+                self._cx.execute("PRAGMA optimize")
+            _logger.info(f"run history compacted, {deleted} rows deleted")
+        return deleted
+
+    def close(self):
+        with self._lock:
+            self._cx.close()
+
+
+history = RunHistory(cfg.DB_PATH / "history.sqlite")
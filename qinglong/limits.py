@@ -0,0 +1,100 @@
+import logging
+import shutil
+import signal
+
+from .models import ResourceLimits
+
+_logger = logging.getLogger(__name__)
+
+# 进程因超出限制失败时在输出中留下的特征
+_OUTPUT_MARKERS = {
+    "memory": ("MemoryError", "Cannot allocate memory", "std::bad_alloc", "out of memory"),
+    "open_files": ("Too many open files",),
+}
+
+
+def command_prefix(limits: ResourceLimits | None) -> list[str]:
+    """
+    设置 CPU 和 IO 优先级的命令前缀，放在 uv run 之前，对整个进程树生效
+
+    系统中没有 nice 或 ionice 时忽略对应的设置。
+    """
+    if limits is None:
+        return []
+    prefix = []
+    if limits.nice is not None and (nice := shutil.which("nice")):
+        prefix += [nice, "-n", str(limits.nice)]
+    if limits.ionice_class is not None and (ionice := shutil.which("ionice")):
+        prefix += [ionice, "-c", str(limits.ionice_class)]
+        if limits.ionice_level is not None:
+            prefix += ["-n", str(limits.ionice_level)]
+    return prefix
+
+
+def task_prefix(limits: ResourceLimits | None) -> list[str]:
+    """
+    设置资源上限的命令前缀，放在 uv run 之后，只限制任务进程而不限制 uv 本身
+
+    使用 prlimit 在 exec 任务命令之前设置 rlimit，系统中没有 prlimit 时忽略。
+    """
+    if limits is None:
+        return []
+    rlimits = []
+    if limits.memory is not None:
+        rlimits.append(f"--as={limits.memory}")
+    if limits.cpu_time is not None:
+        # 软限制超出后发送 SIGXCPU，硬限制多留一点余量让进程有机会处理
+        rlimits.append(f"--cpu={limits.cpu_time}:{limits.cpu_time + 5}")
+    if limits.open_files is not None:
+        rlimits.append(f"--nofile={limits.open_files}")
+    if not rlimits:
+        return []
+    prlimit = shutil.which("prlimit")
+    if prlimit is None:
+        _logger.warning("prlimit not found, resource limits are not applied")
+        return []
+    return [prlimit, *rlimits, "--"]
+
+
+def _cpu_limit_exceeded(return_code: int | None) -> bool:
+    """
+    是否因 CPU 时间超限被 SIGXCPU 终止
+
+    uv run 会把子进程的信号转换为 128 + 信号值的退出码，与任务自己以 129-255 退出无法区分，
+    因此只采信几乎不会被主动使用的 SIGXCPU。
+    """
+    if return_code is None:
+        return False
+    return return_code in (-signal.SIGXCPU, 128 + signal.SIGXCPU)
+
+
+class BreachDetector:
+    """
+    根据退出信号和输出判断运行是否超出了资源上限
+
+    CPU 时间超限由 SIGXCPU 判断；内存和文件数超限时进程通常自行报错退出，只能从输出中识别。
+    超时或被手动终止的运行不做判断。
+    """
+
+    def __init__(self, limits: ResourceLimits | None):
+        self.limits = limits
+        self.breaches: set[str] = set()
+        self._markers = {}
+        if limits is not None:
+            if limits.memory is not None:
+                self._markers["memory"] = _OUTPUT_MARKERS["memory"]
+            if limits.open_files is not None:
+                self._markers["open_files"] = _OUTPUT_MARKERS["open_files"]
+
+    def feed(self, line: str):
+        for name, markers in self._markers.items():
+            if name not in self.breaches and any(marker in line for marker in markers):
+                self.breaches.add(name)
+
+    def result(self, return_code: int | None, stopped: bool = False) -> str | None:
+        """返回超出的限制名称，用逗号分隔；正常退出或运行被超时、手动终止时不记录"""
+        if self.limits is None or return_code == 0 or stopped:
+            return None
+        if self.limits.cpu_time is not None and _cpu_limit_exceeded(return_code):
+            self.breaches.add("cpu_time")
+        return ",".join(sorted(self.breaches)) or None
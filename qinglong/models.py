@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import enum
+import random
 
 from pydantic import BaseModel
 
@@ -12,6 +13,23 @@ class ProjectInfo(BaseModel):
     created_at: str
     upgrade_at: str
     info: str | None = None
+    # 同时运行的任务数上限，None 表示使用全局配置，0 表示不限制
+    max_concurrency: int | None = None
+
+
+class ProjectUpdate(BaseModel):
+    """
+    一次工程更新的结果
+    """
+
+    # 新克隆的工程没有旧版本
+    old_sha: str | None = None
+    new_sha: str
+    changed_files: list[str] = []
+
+    @property
+    def changed(self) -> bool:
+        return self.old_sha != self.new_sha
 
 
 class TaskStatus(str, enum.Enum):
@@ -19,6 +37,110 @@ class TaskStatus(str, enum.Enum):
     PAUSED = "paused"
 
 
+class PrewarmState(str, enum.Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+class RunTrigger(str, enum.Enum):
+    CRON = "cron"
+    MANUAL = "manual"
+    RETRY = "retry"
+    DEPENDENCY = "dependency"
+    WATCH = "watch"
+    WEBHOOK = "webhook"
+
+
+class RunStatus(str, enum.Enum):
+    RUNNING = "running"
+    SUCCESS = "success"
+    FAILED = "failed"
+    TIMEOUT = "timeout"
+
+
+class ResourceLimits(BaseModel):
+    """
+    任务进程的资源上限，未设置的项不限制
+    """
+
+    # 虚拟内存上限（字节），RLIMIT_AS；Linux 不执行 RLIMIT_RSS，因此按地址空间限制
+    memory: int | None = None
+    # CPU 时间上限（秒），RLIMIT_CPU
+    cpu_time: int | None = None
+    # 打开文件数上限，RLIMIT_NOFILE
+    open_files: int | None = None
+    # nice 值增量，越大优先级越低
+    nice: int | None = None
+    # ionice 调度类：1 实时，2 尽力而为，3 空闲
+    ionice_class: int | None = None
+    # ionice 优先级 0-7，越小优先级越高
+    ionice_level: int | None = None
+
+
+class RetryPolicy(BaseModel):
+    """
+    运行失败后的重试策略，第 n 次重试前等待 delay * backoff^(n-1) 秒，并加上随机抖动
+    """
+
+    # 最多运行的次数，包括第一次
+    max_attempts: int = 3
+    # 第一次重试前的等待时间（秒）
+    delay: float = 10.0
+    # 每次重试等待时间的增长倍数
+    backoff: float = 2.0
+    # 等待时间上限（秒）
+    max_delay: float = 3600.0
+    # 随机抖动比例，0.1 表示在 ±10% 内浮动，避免同时失败的任务同时重试
+    jitter: float = 0.1
+    # 只在这些退出码时重试，为空时任何失败都重试
+    exit_codes: list[int] = []
+    # 超时后是否重试
+    retry_on_timeout: bool = True
+
+    def should_retry(self, attempt: int, status: RunStatus, exit_code: int | None) -> bool:
+        """第 attempt 次运行结束后是否需要重试"""
+        if attempt >= self.max_attempts or status == RunStatus.SUCCESS:
+            return False
+        if status == RunStatus.TIMEOUT:
+            return self.retry_on_timeout
+        return not self.exit_codes or exit_code in self.exit_codes
+
+    def delay_for(self, attempt: int) -> float:
+        """第 attempt 次运行失败后到下一次重试的等待时间"""
+        delay = min(self.delay * self.backoff ** (attempt - 1), self.max_delay)
+        return max(delay * random.uniform(1 - self.jitter, 1 + self.jitter), 0.0)
+
+
+class SchedulePolicy(BaseModel):
+    """
+    定时触发的补偿和错峰策略，字段为 None 时使用全局配置
+    """
+
+    # 错过触发时间后仍然运行的宽限时间（秒），0 表示总是运行
+    misfire_grace_time: int | None = None
+    # 错过多次触发时是否只运行一次
+    coalesce: bool | None = None
+    # 每次触发随机延迟的最大秒数
+    jitter: int | None = None
+    # 按任务名散列出 0 ~ spread 秒的固定延迟，错开相同 cron 的任务
+    spread: int | None = None
+
+
+class FileWatch(BaseModel):
+    """
+    监视目录中的文件变化，变化停止 debounce 秒后触发一次任务
+    """
+
+    # 监视的目录或文件，相对路径相对于工程目录
+    path: str
+    # 只关心匹配这些 glob 模式的文件名，为空时不过滤
+    patterns: list[str] = []
+    recursive: bool = True
+    debounce: float = 1.0
+
+
 class TaskInfo(BaseModel):
     """
     任务信息
@@ -26,12 +148,94 @@ class TaskInfo(BaseModel):
 
     name: str
     project_name: str
+    # 为空时不定时运行，只由上游任务或手动触发
     cron: str
     command: str
     status: TaskStatus = TaskStatus.PAUSED
     created_at: str
     upgrade_at: str
     info: str | None = None
+    # 运行任务的调度器执行器
+    executor: str = "default"
+    # 所属并发组，与同组任务共享并发上限
+    concurrency_group: str | None = None
+    # 进程资源上限
+    limits: ResourceLimits | None = None
+    # 单次运行的超时时间（秒），超时后终止整个进程组
+    timeout: float | None = None
+    # 超时后从 SIGTERM 到 SIGKILL 的宽限时间（秒），None 使用全局配置
+    kill_grace: float | None = None
+    # 失败重试策略，None 表示不重试
+    retry: RetryPolicy | None = None
+    # 错过触发和错峰策略，None 使用全局配置
+    schedule: SchedulePolicy | None = None
+    # 上游任务，全部成功完成后触发本任务
+    depends_on: list[str] = []
+    # 文件变化时触发
+    watch: FileWatch | None = None
+    # 设置后可通过 POST /api/tasks/{name}/trigger 携带该令牌触发
+    webhook_token: str | None = None
+
+
+class RunUsage(BaseModel):
+    """
+    一次运行的资源用量，包含子孙进程
+    """
+
+    # CPU 时间（秒）
+    user_time: float = 0.0
+    system_time: float = 0.0
+    # 单个进程的最大常驻内存（字节）
+    max_rss: int = 0
+    # 块设备读写量（字节）
+    read_bytes: int = 0
+    write_bytes: int = 0
+    # 主动和被动上下文切换次数
+    voluntary_switches: int = 0
+    involuntary_switches: int = 0
+
+    @property
+    def cpu_time(self) -> float:
+        return self.user_time + self.system_time
+
+
+class RunRecord(BaseModel):
+    """
+    一次任务运行的记录，时间为 unix 时间戳
+    """
+
+    id: int
+    task: str
+    trigger: RunTrigger
+    status: RunStatus
+    started_at: float
+    finished_at: float | None = None
+    exit_code: int | None = None
+    # 第几次尝试，重试时递增
+    attempt: int = 1
+    usage: RunUsage | None = None
+    # 超出的资源限制，多个用逗号分隔
+    limit_breach: str | None = None
+
+    @property
+    def duration(self) -> float | None:
+        if self.finished_at is None:
+            return None
+        return self.finished_at - self.started_at
+
+
+class TaskImportResult(BaseModel):
+    """
+    批量导入任务的结果
+    """
+
+    imported: list[str] = []
+    # 出错的行号及原因
+    errors: dict[int, str] = {}
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
 
 
 if __name__ == "__main__":
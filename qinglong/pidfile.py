@@ -0,0 +1,89 @@
+import logging
+import os
+import signal
+import time
+from pathlib import Path
+
+from .config import settings as cfg
+
+_logger = logging.getLogger(__name__)
+
+
+def _start_time(pid: int) -> str | None:
+    """进程的启动时间（开机后的时钟周期数），用于识别 pid 是否已被复用"""
+    try:
+        return Path(f"/proc/{pid}/stat").read_text().rpartition(")")[2].split()[19]
+    except (OSError, IndexError):
+        return None
+
+
+def _group_alive(pgid: int) -> bool:
+    try:
+        os.killpg(pgid, 0)
+    except (ProcessLookupError, PermissionError):
+        return False
+    return True
+
+
+class PidFiles:
+    """
+    记录正在运行的任务进程组
+
+    每个任务一个 pidfile，内容为进程组 id 和组长进程的启动时间。
+    面板异常退出后留下的 pidfile 对应的就是孤儿进程组，启动时由 reap 清理。
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    def _file(self, name: str) -> Path:
+        return self.path / f"{name}.pid"
+
+    def write(self, name: str, pid: int):
+        self._file(name).write_text(f"{pid} {_start_time(pid) or ''}")
+
+    def remove(self, name: str):
+        self._file(name).unlink(missing_ok=True)
+
+    def reap(self, grace: float | None = None) -> list[str]:
+        """终止所有 pidfile 记录的残留进程组，返回被清理的任务名"""
+        grace = cfg.TASK_KILL_GRACE if grace is None else grace
+        orphans = {}
+        for file in self.path.glob("*.pid"):
+            try:
+                pid_text, _, start_time = file.read_text().partition(" ")
+                pid = int(pid_text)
+            except (OSError, ValueError):
+                file.unlink(missing_ok=True)
+                continue
+            # 组长进程已退出时组内可能仍有进程；组长还在但启动时间不同说明 pid 已被复用
+            current = _start_time(pid)
+            if current is not None and start_time and current != start_time:
+                file.unlink(missing_ok=True)
+                continue
+            if _group_alive(pid):
+                orphans[file.stem] = pid
+            else:
+                file.unlink(missing_ok=True)
+
+        for name, pgid in orphans.items():
+            _logger.warning(f"reap orphan task process group: {name}, pgid {pgid}")
+            # 进程组可能在检查之后已经退出
+            try:
+                os.killpg(pgid, signal.SIGTERM)
+            except (ProcessLookupError, PermissionError):
+                pass
+        deadline = time.monotonic() + grace
+        while time.monotonic() < deadline and any(_group_alive(pgid) for pgid in orphans.values()):
+            time.sleep(0.05)
+        for name, pgid in orphans.items():
+            try:
+                os.killpg(pgid, signal.SIGKILL)
+            except (ProcessLookupError, PermissionError):
+                pass
+            self.remove(name)
+        return list(orphans)
+
+
+pidfiles = PidFiles(cfg.DB_PATH / "pids")
@@ -1,24 +1,396 @@
 import asyncio
+import hashlib
 import logging
+import threading
 import time
+import uuid
+from collections import Counter, deque
+from concurrent.futures import CancelledError, Future
+from contextlib import contextmanager, asynccontextmanager
 from datetime import datetime, timedelta
+from apscheduler.jobstores.base import JobLookupError
 from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.triggers.base import BaseTrigger
+from apscheduler.events import (
+    EVENT_JOB_ERROR,
+    EVENT_JOB_EXECUTED,
+    EVENT_JOB_MAX_INSTANCES,
+    EVENT_JOB_MISSED,
+    EVENT_JOB_SUBMITTED,
+)
+from apscheduler.executors.base import MaxInstancesReachedError
+from apscheduler.executors.pool import ThreadPoolExecutor
 from apscheduler.jobstores.memory import MemoryJobStore
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.date import DateTrigger
 from apscheduler.triggers.interval import IntervalTrigger
 from apscheduler.util import undefined
 
 from .config import settings as cfg
+from .metrics import Histogram
 
 _logger = logging.getLogger(__name__)
 
+# submit 提交的一次性调度任务放在内存中，包装函数无法序列化到持久化存储
+_SUBMIT_JOBSTORE = "submit"
+# submit 提交的调度任务 id 为 job_id + 分隔符 + 随机后缀
+_SUBMIT_SEP = "\0submit\0"
+# dispatch 提交的调度任务 id 前缀，这些运行已经作为原来的调度任务统计过，不再计入统计
+_DISPATCH_PREFIX = "\0dispatch\0"
+# 等待提交事件的已结束运行最多保留的数量，提交事件丢失时不会无限增长
+_MAX_FINISHED = 1000
+
+
+class ConcurrencyLimiter:
+    """
+    按 key 限制同时运行的数量
+
+    超过上限的运行按先来后到排队等待空位，而不是被丢弃。没有设置上限的 key 不做限制。
+    等待方持有一个 Future，空位释放时由释放方按排队顺序分配并完成它，不需要轮询。
+    """
 
-class Scheduler:
     def __init__(self):
+        self._lock = threading.Lock()
+        self._limits: dict[str, int] = {}
+        self._held: Counter = Counter()
+        self._waiters: deque[tuple[tuple[str, ...], Future]] = deque()
+
+    @property
+    def limits(self) -> dict[str, int]:
+        return dict(self._limits)
+
+    def set_limit(self, key: str, limit: int | None):
+        """设置上限，limit 为 0 或 None 时取消限制；已经持有的空位在释放前仍然计数"""
+        with self._lock:
+            if not limit:
+                self._limits.pop(key, None)
+            else:
+                self._limits[key] = limit
+            granted = self._grant_waiters()
+        for future in granted:
+            future.set_result(None)
+
+    @staticmethod
+    def _normalize(keys) -> tuple[str, ...]:
+        return tuple(sorted(set(keys)))
+
+    def _fits(self, keys: tuple[str, ...], blocked: set[str]) -> bool:
+        return all(key not in blocked and (key not in self._limits or self._held[key] < self._limits[key]) for key in keys)
+
+    def _take(self, keys: tuple[str, ...]):
+        for key in keys:
+            self._held[key] += 1
+
+    def _grant_waiters(self) -> list[Future]:
+        """按排队顺序分配空位，排在前面的等待方没拿到的 key 不会被后来者抢先，需在 _lock 中调用"""
+        granted = []
+        blocked: set[str] = set()
+        waiting = deque()
+        for keys, future in self._waiters:
+            if future.cancelled():
+                continue
+            if self._fits(keys, blocked):
+                if future.set_running_or_notify_cancel():
+                    self._take(keys)
+                    granted.append(future)
+                continue
+            blocked.update(keys)
+            waiting.append((keys, future))
+        self._waiters = waiting
+        return granted
+
+    def acquire(self, *keys: str) -> Future:
+        """
+        申请所有 key 的空位，不阻塞
+
+        返回:
+            Future: 拿到空位时完成，有空位时返回的 Future 已经完成；用完后调用 release 释放。
+                还在排队时可以 cancel 放弃排队
+        """
+        keys = self._normalize(keys)
+        future = Future()
+        with self._lock:
+            blocked = {key for waiter_keys, _ in self._waiters for key in waiter_keys}
+            if self._fits(keys, blocked):
+                future.set_running_or_notify_cancel()
+                self._take(keys)
+            else:
+                self._waiters.append((keys, future))
+                return future
+        future.set_result(None)
+        return future
+
+    def release(self, *keys: str):
+        """释放 acquire 拿到的空位，并分配给排队的等待方"""
+        with self._lock:
+            for key in self._normalize(keys):
+                self._held[key] -= 1
+                if self._held[key] <= 0:
+                    del self._held[key]
+            granted = self._grant_waiters()
+        for future in granted:
+            future.set_result(None)
+
+    @contextmanager
+    def slot(self, *keys: str):
+        """阻塞等待所有 key 的空位"""
+        self.acquire(*keys).result()
+        try:
+            yield
+        finally:
+            self.release(*keys)
+
+    @asynccontextmanager
+    async def slot_async(self, *keys: str):
+        """slot 的协程版本，等待空位时不阻塞事件循环"""
+        future = self.acquire(*keys)
+        try:
+            await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            # 还在排队时取消排队；已经分配了空位时归还
+            if not future.cancel():
+                self.release(*keys)
+            raise
+        try:
+            yield
+        finally:
+            self.release(*keys)
+
+
+def spread_offset(name: str, spread: int) -> int:
+    """按名称散列出 0 ~ spread-1 秒的固定偏移，重启后保持不变"""
+    if spread <= 0:
+        return 0
+    return int.from_bytes(hashlib.sha1(name.encode()).digest()[:4], "big") % spread
+
+
+class OffsetTrigger(BaseTrigger):
+    """
+    把内部触发器的每次触发时间推迟固定的 offset 秒，再加上 0 ~ jitter 秒的随机延迟
+
+    不修改内部触发器，相同 cron 表达式的任务可以共用同一个解析结果。
+    """
+
+    __slots__ = ("trigger", "offset", "jitter")
+
+    def __init__(self, trigger: BaseTrigger, offset: float = 0, jitter: int | None = None):
+        self.trigger = trigger
+        self.offset = offset
+        self.jitter = jitter
+
+    def get_next_fire_time(self, previous_fire_time, now):
+        delta = timedelta(seconds=self.offset)
+        if previous_fire_time is not None:
+            previous_fire_time -= delta
+        next_fire_time = self.trigger.get_next_fire_time(previous_fire_time, now - delta)
+        if next_fire_time is None:
+            return None
+        return self._apply_jitter(next_fire_time + delta, self.jitter, now)
+
+    def __getstate__(self):
+        return {"version": 1, "trigger": self.trigger, "offset": self.offset, "jitter": self.jitter}
+
+    def __setstate__(self, state):
+        self.trigger = state["trigger"]
+        self.offset = state["offset"]
+        self.jitter = state["jitter"]
+
+    def __str__(self):
+        return f"{self.trigger} +{self.offset}s" + (f" ~{self.jitter}s" if self.jitter else "")
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} ({self.trigger!r}, offset={self.offset}, jitter={self.jitter})>"
+
+
+# 执行器排队数的桶上界
+QUEUE_DEPTH_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500)
+
+
+class SchedulerStats:
+    """
+    通过 APScheduler 事件统计调度延迟、执行器排队数和运行耗时
+
+    - lag: 提交到执行器的时间与计划触发时间的差
+    - duration: 从提交到运行结束的耗时，包含在线程池中排队的时间；任务函数返回 Future 时
+      （asyncio 模式下提交到事件循环的运行）统计到该 Future 完成
+    - queue_depth: 每次提交时线程池中等待线程的运行数，无法读取时不采样
+    - counts: 提交、完成、出错、错过（超过 misfire_grace_time）和因 max_instances 跳过的次数
+    """
+
+    EVENT_MASK = EVENT_JOB_SUBMITTED | EVENT_JOB_EXECUTED | EVENT_JOB_ERROR | EVENT_JOB_MISSED | EVENT_JOB_MAX_INSTANCES
+
+    def __init__(self, queue_depth=None):
+        """
+        参数:
+            queue_depth (Callable[[], int | None]): 返回当前排队数，每次提交时采样，返回 None 时不采样
+        """
+        self._lock = threading.Lock()
+        self._queue_depth = queue_depth
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.lag = Histogram()
+            self.duration = Histogram()
+            self.queue_depth = Histogram(buckets=QUEUE_DEPTH_BUCKETS)
+            self.counts = Counter()
+            # 按任务统计的错过和跳过次数
+            self.job_counts: dict[str, Counter] = {}
+            # (job_id, 计划时间) -> 提交时间，用于计算耗时和运行中的数量
+            self._submitted: dict[tuple[str, float], float] = {}
+            # 事件分发顺序不保证，结束事件可能早于提交事件；按插入顺序保留最近的 _MAX_FINISHED 个
+            self._finished: dict[tuple[str, float], None] = {}
+            self.started_at = time.time()
+
+    def record_submit(self, job_id: str, run_times: list[datetime]):
+        now = time.time()
+        depth = self._queue_depth() if self._queue_depth else None
+        with self._lock:
+            for run_time in run_times:
+                key = (job_id, run_time.timestamp())
+                self.counts["submitted"] += 1
+                self.lag.observe(max(now - key[1], 0.0))
+                if key in self._finished:
+                    del self._finished[key]
+                else:
+                    self._submitted[key] = now
+        if depth is not None:
+            self.queue_depth.observe(depth)
+
+    def _record_finish(self, job_id: str, run_time: datetime, outcome: str):
+        now = time.time()
+        key = (job_id, run_time.timestamp())
+        with self._lock:
+            self.counts[outcome] += 1
+            if outcome not in ("executed", "failed"):
+                # 错过的运行没有提交，也不会有提交事件
+                self.job_counts.setdefault(job_id, Counter())[outcome] += 1
+                return
+            submitted_at = self._submitted.pop(key, None)
+            if submitted_at is None:
+                self._finished[key] = None
+                if len(self._finished) > _MAX_FINISHED:
+                    del self._finished[next(iter(self._finished))]
+                submitted_at = key[1]
+            self.duration.observe(max(now - submitted_at, 0.0))
+
+    def on_event(self, event):
+        if event.job_id.startswith(_DISPATCH_PREFIX):
+            return
+        if event.code == EVENT_JOB_SUBMITTED:
+            self.record_submit(event.job_id, event.scheduled_run_times)
+        elif event.code == EVENT_JOB_EXECUTED and isinstance(event.retval, Future):
+            # 运行被转交到事件循环，等真正的运行结束再记录
+            event.retval.add_done_callback(
+                lambda future: self._record_finish(
+                    event.job_id,
+                    event.scheduled_run_time,
+                    "executed" if not future.cancelled() and future.exception() is None else "failed",
+                )
+            )
+        elif event.code == EVENT_JOB_EXECUTED:
+            self._record_finish(event.job_id, event.scheduled_run_time, "executed")
+        elif event.code == EVENT_JOB_ERROR:
+            self._record_finish(event.job_id, event.scheduled_run_time, "failed")
+        elif event.code == EVENT_JOB_MISSED:
+            self._record_finish(event.job_id, event.scheduled_run_time, "missed")
+        elif event.code == EVENT_JOB_MAX_INSTANCES:
+            # 没有提交到执行器，不会有结束事件
+            with self._lock:
+                self.counts["skipped"] += len(event.scheduled_run_times)
+                self.job_counts.setdefault(event.job_id, Counter())["skipped"] += len(event.scheduled_run_times)
+
+    def snapshot(self, top: int = 20) -> dict:
+        with self._lock:
+            counts = dict(self.counts)
+            running = len(self._submitted)
+            job_counts = sorted(
+                ({"job_id": job_id, **counter} for job_id, counter in self.job_counts.items()),
+                key=lambda row: -(row.get("missed", 0) + row.get("skipped", 0)),
+            )[:top]
+        return {
+            "since": self.started_at,
+            "counts": {key: counts.get(key, 0) for key in ("submitted", "executed", "failed", "missed", "skipped")},
+            # 已提交但未结束的运行，包括在线程池中排队的
+            "running": running,
+            "lag": self.lag.snapshot(),
+            "duration": self.duration.snapshot(),
+            "queue_depth": self.queue_depth.snapshot(),
+            "jobs": job_counts,
+        }
+
+
+class Scheduler:
+    def __init__(self, jobstore: str | None = None):
+        """
+        参数:
+            jobstore (str): memory 或 sqlite，默认使用 SCHEDULER_JOBSTORE 配置。
+                sqlite 模式下任务持久化到 DB_PATH/jobs.sqlite，调度器以暂停状态启动，
+                等任务对象准备好后再调用 resume 开始触发。
+        """
         cfg.DB_PATH.mkdir(parents=True, exist_ok=True)
-        jobstores = {"default": MemoryJobStore()}
-        self.scheduler = BackgroundScheduler(jobstores=jobstores)
-        self.scheduler.start()
+        self.persistent = (jobstore or cfg.SCHEDULER_JOBSTORE) == "sqlite"
+        if self.persistent:
+            try:
+                from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore  # type: ignore[import-not-found]
+            except ImportError as e:
+                raise RuntimeError(
+                    "SCHEDULER_JOBSTORE=sqlite 需要安装 sqlalchemy: uv sync --extra sqlite "
+                    "| SCHEDULER_JOBSTORE=sqlite requires sqlalchemy: uv sync --extra sqlite"
+                ) from e
+
+            jobstores = {"default": SQLAlchemyJobStore(engine=self.create_sqlite_engine())}
+        else:
+            jobstores = {"default": MemoryJobStore()}
+        jobstores[_SUBMIT_JOBSTORE] = MemoryJobStore()
+        self.executors = self._create_executors()
+        # 线程池占满时排队的运行轮到时已经超过触发时间，不能按 misfire 丢弃
+        job_defaults = {"misfire_grace_time": None}
+        self.scheduler = BackgroundScheduler(jobstores=jobstores, executors=self.executors, job_defaults=job_defaults)
+        self.limiter = ConcurrencyLimiter()
+        self.stats = SchedulerStats(queue_depth=self._total_queue_depth)
+        self.scheduler.add_listener(self.stats.on_event, SchedulerStats.EVENT_MASK)
+        # 按 job_id 统计运行中的实例数，submit 据此与定时运行共用 max_instances
+        self._instances_lock = threading.Lock()
+        self._instances: Counter = Counter()
+        self.scheduler.add_listener(self._count_instances, EVENT_JOB_SUBMITTED | EVENT_JOB_EXECUTED | EVENT_JOB_ERROR)
+        for group, limit in cfg.CONCURRENCY_GROUPS.items():
+            self.limiter.set_limit(f"group:{group}", limit)
+        self.scheduler.start(paused=self.persistent)
+
+    def resume(self):
+        """开始处理到期的任务"""
+        self.scheduler.resume()
+
+    def shutdown(self, wait=True):
+        self.scheduler.shutdown(wait=wait)
+
+    @staticmethod
+    def _create_executors():
+        executors = {"default": ThreadPoolExecutor(cfg.SCHEDULER_THREAD_POOL_SIZE)}
+        for name, size in cfg.SCHEDULER_EXECUTORS.items():
+            executors[name] = ThreadPoolExecutor(size)
+        return executors
+
+    def is_thread_executor(self, name: str) -> bool:
+        return isinstance(self.executors.get(name), ThreadPoolExecutor)
+
+    def queue_depth(self) -> dict[str, int | None]:
+        """各线程池中等待空闲线程的运行数，无法读取时为 None"""
+        depths = {}
+        for name, executor in self.executors.items():
+            if isinstance(executor, ThreadPoolExecutor):
+                # APScheduler 没有公开排队数，读取底层 concurrent.futures 线程池的工作队列，
+                # 这两个都是私有属性，版本变化后读取不到时返回 None
+                try:
+                    depths[name] = executor._pool._work_queue.qsize()
+                except AttributeError:
+                    depths[name] = None
+        return depths
+
+    def _total_queue_depth(self) -> int | None:
+        depths = [depth for depth in self.queue_depth().values() if depth is not None]
+        return sum(depths) if depths else None
 
     @property
     def jobs(self):
@@ -45,25 +417,62 @@ class Scheduler:
         event.listen(engine, "connect", enable_wal)
         return engine
 
-    def add_job(self, job_id, func, trigger, paused=False, max_instances=1, **kwargs):
+    @staticmethod
+    def parse_trigger(trigger):
+        """把 cron 表达式或间隔秒数转换为触发器"""
         try:
             trigger = int(trigger)
-        except ValueError:
+        except (TypeError, ValueError):
             pass
 
         if isinstance(trigger, str):
             trigger = CronTrigger.from_crontab(trigger)
         elif isinstance(trigger, int):
             trigger = IntervalTrigger(seconds=trigger)
+        return trigger
+
+    def add_job(self, job_id, func, trigger, paused=False, max_instances=1, offset=0, jitter=None, **kwargs):
+        """
+        参数:
+            offset (float): 每次触发固定推迟的秒数，用于错开相同 cron 的任务
+            jitter (int): 每次触发随机推迟的最大秒数
+        """
+        trigger = self.parse_trigger(trigger)
+        if offset or jitter:
+            trigger = OffsetTrigger(trigger, offset, jitter)
 
         if max_instances is None:
             max_instances = undefined
+        if paused:
+            # 直接以暂停状态加入，不用再单独暂停一次
+            kwargs["next_run_time"] = None
         _logger.info(f"add_job: {job_id}, {trigger}, {max_instances}, {kwargs}")
 
-        job = self.scheduler.add_job(func, id=job_id, trigger=trigger, max_instances=max_instances, **kwargs)
-        if paused:
-            self.pause_job(job_id)
-        return job
+        return self.scheduler.add_job(func, id=job_id, trigger=trigger, max_instances=max_instances, **kwargs)
+
+    def add_jobs(self, jobs: list[dict]):
+        """批量添加任务，相同的 cron 表达式只解析一次"""
+        triggers = {}
+        added = []
+        for job in jobs:
+            trigger = job["trigger"]
+            if isinstance(trigger, (str, int)):
+                if trigger not in triggers:
+                    triggers[trigger] = self.parse_trigger(trigger)
+                job = job | {"trigger": triggers[trigger]}
+            added.append(self.add_job(**job))
+        return added
+
+    def add_delayed_job(self, job_id, func, delay: float, **kwargs):
+        """添加在 delay 秒后运行一次的任务，等待期间不占用执行线程；同 id 的任务会被替换"""
+        run_date = datetime.now() + timedelta(seconds=delay)
+        _logger.info(f"add_delayed_job: {job_id}, {run_date}")
+        return self.scheduler.add_job(
+            func, id=job_id, trigger=DateTrigger(run_date), replace_existing=True, misfire_grace_time=None, **kwargs
+        )
+
+    def get_job(self, job_id):
+        return self.scheduler.get_job(job_id)
 
     def remove_job(self, job_id):
         self.scheduler.remove_job(job_id)
@@ -74,12 +483,116 @@ class Scheduler:
     def resume_job(self, job_id):
         self.scheduler.resume_job(job_id)
 
-    def run_job(self, job_id, paused=False):
-        now_time = datetime.now() + timedelta(microseconds=100)
-        self.scheduler.modify_job(job_id, next_run_time=now_time)
-        if paused:
-            time.sleep(0.1)
-            self.pause_job(job_id)
+    def _change_instances(self, job_id: str, delta: int):
+        with self._instances_lock:
+            self._instances[job_id] += delta
+            if self._instances[job_id] == 0:
+                del self._instances[job_id]
+
+    def _count_instances(self, event):
+        # submit 提交的运行在 submit 中计数，结束时由包装函数减去
+        if _SUBMIT_SEP in event.job_id or event.job_id.startswith(_DISPATCH_PREFIX):
+            return
+        if event.code == EVENT_JOB_SUBMITTED:
+            self._change_instances(event.job_id, len(event.scheduled_run_times))
+        elif isinstance(event.retval, Future):
+            # 运行被转交到事件循环，真正的运行结束前仍计入
+            event.retval.add_done_callback(lambda future: self._change_instances(event.job_id, -1))
+        else:
+            self._change_instances(event.job_id, -1)
+
+    def dispatch(self, func, executor="default"):
+        """
+        在执行器中尽快运行 func 一次
+
+        用于接续已经作为调度任务统计过的运行（例如等到并发空位后再运行），不计入统计和 max_instances。
+        """
+        self.scheduler.add_job(
+            func,
+            trigger=DateTrigger(),
+            id=f"{_DISPATCH_PREFIX}{uuid.uuid4().hex}",
+            executor=executor,
+            jobstore=_SUBMIT_JOBSTORE,
+            misfire_grace_time=None,
+        )
+
+    def submit(self, job_id, func=None, args=(), executor="default", **kwargs) -> Future:
+        """
+        立即运行一次，不修改调度任务的下次运行时间和暂停状态
+
+        以 id 唯一的一次性调度任务提交。已有 job_id 对应的调度任务时使用它的函数、参数和执行器，
+        kwargs 覆盖其关键字参数；没有时使用传入的 func。
+        运行中的定时运行和之前提交的运行一起计入 max_instances，超出时抛出 MaxInstancesReachedError。
+
+        返回:
+            Future: 函数返回时完成，结果为函数的返回值；函数返回 Future 时（运行被转交到事件循环等其他地方），
+                跟踪该 Future，在真正的运行结束时完成，在此之前一直计入 max_instances
+        """
+        job = self.get_job(job_id)
+        max_instances = 1
+        if job is not None:
+            func, args, executor, max_instances = job.func, job.args, job.executor, job.max_instances
+            kwargs = job.kwargs | kwargs
+        elif func is None:
+            raise JobLookupError(job_id)
+        with self._instances_lock:
+            if self._instances[job_id] >= max_instances:
+                raise MaxInstancesReachedError(job if job is not None else _JobRef(job_id, max_instances))
+            self._instances[job_id] += 1
+        future = Future()
+
+        def finish(source: Future | None = None, result=None, error: BaseException | None = None):
+            self._change_instances(job_id, -1)
+            if source is not None:
+                if source.cancelled():
+                    error = CancelledError()
+                elif source.exception() is not None:
+                    error = source.exception()
+                else:
+                    result = source.result()
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+        def run(*args, **kwargs):
+            future.set_running_or_notify_cancel()
+            try:
+                result = func(*args, **kwargs)
+            except BaseException as e:
+                finish(error=e)
+                raise
+            if isinstance(result, Future):
+                result.add_done_callback(finish)
+            else:
+                finish(result=result)
+            return result
+
+        _logger.info(f"submit: {job_id}, {kwargs}")
+        try:
+            self.scheduler.add_job(
+                run,
+                trigger=DateTrigger(),
+                id=f"{job_id}{_SUBMIT_SEP}{uuid.uuid4().hex}",
+                name=job.name if job is not None else job_id,
+                args=args,
+                kwargs=kwargs,
+                executor=executor,
+                jobstore=_SUBMIT_JOBSTORE,
+                misfire_grace_time=None,
+            )
+        except BaseException:
+            self._change_instances(job_id, -1)
+            raise
+        return future
+
+
+class _JobRef:
+    """没有对应的调度任务时，用于构造 MaxInstancesReachedError"""
+
+    def __init__(self, id: str, max_instances: int):
+        self.id = id
+        self.max_instances = max_instances
 
 
 scheduler = Scheduler()
@@ -1,11 +1,14 @@
 import logging
+import threading
 import tomllib
 from functools import wraps
 
-from nicegui import ui
+from fastapi import Request
+from fastapi.responses import JSONResponse
+from nicegui import app, ui
 import yaml
 
-from . import api
+from . import api, errors
 
 _logger = logging.getLogger(__name__)
 
@@ -18,6 +21,7 @@ DIALOG_WIDTH = "min-w-[50%] min-h-[100%]"
 PROJECT_COLUMNS = [
     {"name": "name", "label": "Name", "field": "name", "required": True, "align": "left"},
     {"name": "path", "label": "Path", "field": "project_path", "sortable": True},
+    {"name": "env_state", "label": "Env", "field": "env_state", "sortable": True},
     {"name": "upgrade_at", "label": "Upgrade At", "field": "upgrade_at", "sortable": True},
     {"name": "created_at", "label": "Created At", "field": "created_at", "sortable": True},
     {"name": "url", "label": "Url", "field": "url", "sortable": True},
@@ -34,6 +38,19 @@ TASK_COLUMNS = [
 ]
 
 
+@app.post("/api/tasks/{task_name}/trigger")
+def trigger_task(task_name: str, request: Request):
+    """外部系统通过 HTTP POST 触发任务，令牌放在 X-Qinglong-Token 请求头或 token 查询参数中"""
+    token = request.headers.get("X-Qinglong-Token") or request.query_params.get("token")
+    try:
+        api.trigger_task(task_name, token)
+    except errors.TaskNotFoundError as e:
+        return JSONResponse({"detail": str(e)}, status_code=404)
+    except errors.TriggerRejectedError as e:
+        return JSONResponse({"detail": str(e)}, status_code=403)
+    return JSONResponse({"task": task_name, "status": "accepted"}, status_code=202)
+
+
 def error_handler(func):
     @wraps(func)
     def wrapper(*args, **kwargs):
@@ -49,6 +66,7 @@ def error_handler(func):
 class MainPage:
     def __init__(self):
         try:
+            api.reap_orphans()
             api.init_task()
             self._init_dialogs()
             self._init_ui()
@@ -95,6 +113,18 @@ class MainPage:
                 self.pull_spinner = ui.spinner(size="lg").style("display: none")
                 self.pull_status = ui.label().style("display: none")
 
+        with ui.dialog() as self.dialog_pull_all, ui.card().style("max-width: none"):
+            # 批量拉取对话框
+            ui.label("Pull All Projects")
+            self.pull_all_progress = ui.linear_progress(value=0, show_value=False)
+            self.pull_all_status = ui.label()
+            self.pull_all_results = ui.markdown()
+
+        with ui.dialog() as self.dialog_stats, ui.card().style("max-width: none"):
+            # 调度器统计
+            ui.label("Scheduler Stats")
+            self.scheduler_stats = ui.markdown()
+
         with ui.dialog() as self.dialog_task, ui.card():
             # 任务设置对话框
             ui.label("Set Task")
@@ -110,6 +140,7 @@ class MainPage:
         with ui.button_group():
             ui.button("Clone", on_click=self.dialog_clone.open)
             ui.button("Pull", on_click=self.pull_project)
+            ui.button("Pull All", on_click=self.pull_all_projects)
             ui.button("Remove", on_click=self.start_remove_project)
             ui.button("Config", on_click=self.start_config_project)
         self.project_table = ui.table(columns=PROJECT_COLUMNS, rows=[], row_key="name", selection="single", title="Project")
@@ -124,6 +155,7 @@ class MainPage:
             ui.button("Run", on_click=self.run_task)
             ui.button("Kill", on_click=self.start_kill_task)
             ui.button("Logs", on_click=self.show_task_logs)
+            ui.button("Stats", on_click=self.show_scheduler_stats)
 
     @property
     def project_selected_name(self) -> str:
@@ -200,10 +232,14 @@ class MainPage:
 
             def do_pull():
                 try:
-                    api.pull_project(project_name)
+                    update = api.pull_project(project_name)
                     self.update_project_table()
                     self.dialog_pull.close()
-                    ui.notify("Project pulled successfully", type="positive")
+                    if update.changed:
+                        message = f"Project pulled: {update.old_sha[:8]} -> {update.new_sha[:8]}, {len(update.changed_files)} files changed"
+                    else:
+                        message = "Project is already up to date"
+                    ui.notify(message, type="positive")
                 except Exception as e:
                     ui.notify(f"Failed to pull project: {e}", type="negative")
                 finally:
@@ -214,6 +250,37 @@ class MainPage:
         except ValueError as e:
             ui.notify(str(e), type="warning")
 
+    @error_handler
+    def pull_all_projects(self) -> None:
+        """并行拉取所有项目，并显示进度"""
+
+        def do_pull_all():
+            try:
+                api.pull_all_projects()
+            except Exception as e:
+                _logger.error(f"批量拉取项目失败: {e}")
+
+        def refresh():
+            progress = api.get_pull_progress()
+            total = progress["total"] or 1
+            self.pull_all_progress.set_value(progress["done"] / total)
+            summary = ", ".join(f"{k}: {v}" for k, v in progress["summary"].items())
+            self.pull_all_status.set_text(f"{progress['done']}/{progress['total']} {summary}")
+            rows = [
+                f"| {name} | {result['status']} | {result['duration']}s | {result['error'] or ''} |"
+                for name, result in sorted(progress["results"].items())
+            ]
+            self.pull_all_results.content = "\n".join(["| Project | Status | Duration | Error |", "|---|---|---|---|", *rows])
+            if not thread.is_alive():
+                timer.cancel()
+                self.update_project_table()
+
+        self.pull_all_progress.set_value(0)
+        self.dialog_pull_all.open()
+        thread = threading.Thread(target=do_pull_all, name="qinglong-pull-all", daemon=True)
+        thread.start()
+        timer = ui.timer(0.5, refresh)
+
     @error_handler
     def start_remove_project(self) -> None:
         """开始删除项目"""
@@ -327,10 +394,41 @@ class MainPage:
     @error_handler
     def run_task(self) -> None:
         """运行任务"""
-        ui.notify(f"Running {self.task_selected_name}...")
         api.run_task(self.task_selected_name)
+        ui.notify(f"Running {self.task_selected_name}...")
         self.update_task_table()
 
+    @error_handler
+    def show_scheduler_stats(self) -> None:
+        """显示调度延迟、排队和运行耗时统计"""
+        stats = api.get_scheduler_stats()
+        counts = " | ".join(f"{key}: {value}" for key, value in stats["counts"].items())
+        pools = " | ".join(
+            f"{name}: {'unknown' if pool['queued'] is None else pool['queued']} queued / {pool['size']} threads"
+            for name, pool in stats["pools"].items()
+        )
+        rows = [
+            f"| {name} | {stats[name]['count']} | {stats[name]['avg']:.3f} | {stats[name]['p50']} | {stats[name]['p95']} | {stats[name]['max']:.3f} |"
+            for name in ("lag", "duration", "queue_depth")
+        ]
+        jobs = [
+            f"| {job['job_id'].replace(chr(0), ':')} | {job.get('missed', 0)} | {job.get('skipped', 0)} |"
+            for job in stats["jobs"]
+        ]
+        lines = [
+            f"**Runs**: {counts} | running: {stats['running']}",
+            "",
+            f"**Pools**: {pools}",
+            "",
+            "| Metric | Count | Avg | P50 | P95 | Max |",
+            "|---|---|---|---|---|---|",
+            *rows,
+        ]
+        if jobs:
+            lines += ["", "| Job | Missed | Skipped |", "|---|---|---|", *jobs]
+        self.scheduler_stats.content = "\n".join(lines)
+        self.dialog_stats.open()
+
     @error_handler
     def show_task_logs(self) -> None:
         """显示任务日志"""
@@ -0,0 +1,98 @@
+import os
+from pathlib import Path
+
+from .models import RunUsage
+
+_CLK_TCK = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+
+def from_rusage(rusage) -> RunUsage:
+    """把 os.wait4 返回的 rusage 转换为运行资源用量，包含已被等待回收的所有子孙进程"""
+    return RunUsage(
+        user_time=rusage.ru_utime,
+        system_time=rusage.ru_stime,
+        # Linux 上 ru_maxrss 的单位是 KB
+        max_rss=rusage.ru_maxrss * 1024,
+        read_bytes=rusage.ru_inblock * 512,
+        write_bytes=rusage.ru_oublock * 512,
+        voluntary_switches=rusage.ru_nvcsw,
+        involuntary_switches=rusage.ru_nivcsw,
+    )
+
+
+def _children(pid: int) -> list[int]:
+    children = []
+    for task in Path(f"/proc/{pid}/task").glob("*"):
+        try:
+            children.extend(int(child) for child in (task / "children").read_text().split())
+        except OSError:
+            pass
+    return children
+
+
+def _read_process(pid: int) -> dict | None:
+    proc = Path(f"/proc/{pid}")
+    try:
+        # comm 中可能有空格，从最后一个括号之后开始按字段切分
+        fields = (proc / "stat").read_text().rpartition(")")[2].split()
+        status = dict(line.split(":", 1) for line in (proc / "status").read_text().splitlines() if ":" in line)
+        io = {}
+        try:
+            io = dict(line.split(": ", 1) for line in (proc / "io").read_text().splitlines())
+        except OSError:
+            pass
+    except (OSError, ValueError):
+        return None
+    if fields[0] == "Z":
+        # 僵尸进程已经释放了内存和 io 统计，读到的是 0，保留之前的采样
+        return None
+    return {
+        "user_time": int(fields[11]) / _CLK_TCK,
+        "system_time": int(fields[12]) / _CLK_TCK,
+        "max_rss": int(status.get("VmHWM", "0 kB").split()[0]) * 1024,
+        "read_bytes": int(io.get("read_bytes", 0)),
+        "write_bytes": int(io.get("write_bytes", 0)),
+        "voluntary_switches": int(status.get("voluntary_ctxt_switches", 0)),
+        "involuntary_switches": int(status.get("nonvoluntary_ctxt_switches", 0)),
+    }
+
+
+class ProcessTreeSampler:
+    """
+    定时采样 /proc 统计进程树的资源用量
+
+    用于无法 wait4 的子进程（asyncio 模式下子进程由事件循环回收）。
+    每个进程的各项统计取历次采样的最大值，已退出的进程保留最后一次有效采样的值，
+    采样间隔内的用量会丢失，结果是近似值。
+    """
+
+    def __init__(self, pid: int):
+        self.pid = pid
+        self._last: dict[int, dict] = {}
+
+    def sample(self):
+        pids = [self.pid]
+        seen = set()
+        while pids:
+            pid = pids.pop()
+            if pid in seen:
+                continue
+            seen.add(pid)
+            stats = _read_process(pid)
+            if stats is None:
+                continue
+            last = self._last.get(pid)
+            self._last[pid] = stats if last is None else {key: max(value, last[key]) for key, value in stats.items()}
+            pids.extend(_children(pid))
+
+    def usage(self) -> RunUsage:
+        values = self._last.values()
+        return RunUsage(
+            user_time=sum(v["user_time"] for v in values),
+            system_time=sum(v["system_time"] for v in values),
+            max_rss=max((v["max_rss"] for v in values), default=0),
+            read_bytes=sum(v["read_bytes"] for v in values),
+            write_bytes=sum(v["write_bytes"] for v in values),
+            voluntary_switches=sum(v["voluntary_switches"] for v in values),
+            involuntary_switches=sum(v["involuntary_switches"] for v in values),
+        )
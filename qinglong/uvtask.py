@@ -1,16 +1,80 @@
+import codecs
+import io
+import locale
 import os
 from pathlib import Path
+import signal
+import asyncio
+import hashlib
 import logging
 import subprocess
 import threading
 import functools
+import contextlib
+import time
+from concurrent.futures import Future, Executor, ThreadPoolExecutor
+from datetime import datetime
 
 from .filelog import RotatingLogFile
+from .metrics import Histogram
+from .models import PrewarmState, ResourceLimits, RunStatus, RunTrigger, RunUsage
+from . import limits as resource_limits
+from .history import history
+from .pidfile import pidfiles
+from .usage import ProcessTreeSampler, from_rusage
 from .config import settings as cfg
+from .aiorunner import runner as aiorunner
 from . import errors
 
 _logger = logging.getLogger(__name__)
 
+# asyncio 读取子进程输出时每次读取的大小
+_READ_SIZE = 64 * 1024
+# 没有换行的输出（例如用 \r 刷新的进度条）超过该长度时按长度切分为多行
+_MAX_LINE = 1024 * 1024
+# 两种运行模式解码子进程输出使用相同的编码和错误处理，无法解码的字节替换为 U+FFFD
+_ENCODING = locale.getpreferredencoding(False)
+_ERRORS = "replace"
+
+
+# 决定虚拟环境内容的文件，变化后需要重新 uv sync
+DEPENDENCY_FILES = ("pyproject.toml", "uv.lock", ".python-version")
+# 指纹保存在虚拟环境目录中，uv venv --clear 时一起清除
+_FINGERPRINT_FILE = ".qinglong-fingerprint"
+
+
+async def _read_lines(stream: asyncio.StreamReader):
+    """
+    按固定大小读取输出并自行切分行，不会因为单行过长而出错
+
+    使用增量解码器，多字节字符跨读取块或超长切分时不会被截断；换行的处理与线程模式的文本模式相同。
+    """
+    decoder = io.IncrementalNewlineDecoder(codecs.getincrementaldecoder(_ENCODING)(errors=_ERRORS), translate=True)
+    pending = ""
+    while True:
+        chunk = await stream.read(_READ_SIZE)
+        pending += decoder.decode(chunk, final=not chunk)
+        start = 0
+        while (end := pending.find("\n", start)) != -1:
+            yield pending[start : end + 1]
+            start = end + 1
+        pending = pending[start:]
+        while len(pending) >= _MAX_LINE:
+            yield pending[:_MAX_LINE]
+            pending = pending[_MAX_LINE:]
+        if not chunk:
+            break
+    if pending:
+        yield pending
+
+
+def _signal_group(process, sig: int):
+    """向任务所在的进程组发送信号，进程组已经不存在时忽略"""
+    try:
+        os.killpg(process.pid, sig)
+    except (ProcessLookupError, PermissionError):
+        pass
+
 
 @functools.cache
 def _env():
@@ -21,9 +85,232 @@ def _env():
     return env
 
 
+def _venv_path(project_path: Path) -> Path:
+    return project_path / ".venv"
+
+
+def _interpreter_home(project_path: Path) -> str | None:
+    """读取虚拟环境 pyvenv.cfg 中的解释器目录，虚拟环境不存在或解释器已被删除时返回 None"""
+    try:
+        config = (_venv_path(project_path) / "pyvenv.cfg").read_text()
+    except OSError:
+        return None
+    for line in config.splitlines():
+        key, _, value = line.partition("=")
+        if key.strip() == "home":
+            home = value.strip()
+            return home if Path(home).is_dir() else None
+    return None
+
+
+def _stat_key(project_path: Path) -> tuple:
+    """依赖文件和 pyvenv.cfg 的 (mtime, size)，用于在内存中快速判断是否需要重新计算指纹"""
+    key = []
+    for name in (*DEPENDENCY_FILES, ".venv/pyvenv.cfg"):
+        try:
+            stat = (project_path / name).stat()
+            key.append((stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            key.append(None)
+    return tuple(key)
+
+
+def project_fingerprint(project_path: Path) -> str | None:
+    """
+    计算工程虚拟环境的指纹
+
+    包括依赖文件的内容、UV_PYTHON 以及虚拟环境使用的解释器，解释器不可用时返回 None。
+    """
+    home = _interpreter_home(project_path)
+    if home is None:
+        return None
+    digest = hashlib.sha256()
+    for name in DEPENDENCY_FILES:
+        file = project_path / name
+        digest.update(name.encode())
+        digest.update(file.read_bytes() if file.is_file() else b"")
+    digest.update(os.environ.get("UV_PYTHON", "").encode())
+    digest.update(home.encode())
+    return digest.hexdigest()
+
+
+def _read_fingerprint(project_path: Path) -> str | None:
+    try:
+        return (_venv_path(project_path) / _FINGERPRINT_FILE).read_text().strip()
+    except OSError:
+        return None
+
+
+def sync_project_env(project_path: Path, env=None) -> bool:
+    """
+    按需同步工程的虚拟环境
+
+    指纹与上次同步时一致则直接复用；虚拟环境可用时只做增量的 uv sync，
+    否则先 uv venv --clear 重建。
+
+    返回:
+        bool: 是否执行了同步
+    """
+    env = env or _env()
+    fingerprint = project_fingerprint(project_path)
+    if fingerprint is not None and fingerprint == _read_fingerprint(project_path):
+        return False
+
+    if fingerprint is None:
+        subprocess.run(["uv", "venv", "--clear"], cwd=project_path, env=env, check=True)
+    subprocess.run(["uv", "sync"], cwd=project_path, env=env, check=True)
+
+    fingerprint = project_fingerprint(project_path)
+    if fingerprint is not None:
+        (_venv_path(project_path) / _FINGERPRINT_FILE).write_text(fingerprint)
+    return True
+
+
+class ProjectInitRegistry:
+    """
+    按工程路径划分的初始化锁
+
+    不同工程的初始化可以并行；同一工程并发的初始化请求会合并到正在进行的那一次，
+    等待其结果而不是再执行一遍。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inflight: dict[str, Future] = {}
+        self._wait_time: dict[str, Histogram] = {}
+        self._init_time: dict[str, Histogram] = {}
+
+    def _histogram(self, histograms: dict[str, Histogram], key: str) -> Histogram:
+        with self._lock:
+            if key not in histograms:
+                histograms[key] = Histogram()
+            return histograms[key]
+
+    def inflight(self, key: str) -> Future | None:
+        """正在进行的初始化"""
+        with self._lock:
+            return self._inflight.get(key)
+
+    def _execute(self, key: str, future: Future, func):
+        start = time.monotonic()
+        try:
+            future.set_result(func())
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                del self._inflight[key]
+        self._histogram(self._init_time, key).observe(time.monotonic() - start)
+
+    def run(self, key: str, func):
+        """执行 key 对应的初始化，已有进行中的初始化时等待它完成并返回其结果"""
+        start = time.monotonic()
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+
+        if owner:
+            self._execute(key, future, func)
+
+        try:
+            return future.result()
+        finally:
+            self._histogram(self._wait_time, key).observe(time.monotonic() - start)
+
+    def submit(self, key: str, func, executor: Executor) -> tuple[Future, bool]:
+        """
+        把初始化放到线程池中执行并立即返回
+
+        排队期间就已登记为进行中，此时触发的任务会等待这次初始化，而不是自己再执行一遍。
+
+        返回:
+            tuple[Future, bool]: 初始化的 Future，以及是否新提交（False 表示合并到了进行中的初始化）
+        """
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                return future, False
+            future = self._inflight[key] = Future()
+        executor.submit(self._execute, key, future, func)
+        return future, True
+
+    def stats(self) -> dict[str, dict]:
+        """每个工程的初始化耗时和任务等待初始化的耗时"""
+        with self._lock:
+            keys = set(self._wait_time) | set(self._init_time)
+            return {
+                key: {
+                    "init": self._init_time[key].snapshot() if key in self._init_time else None,
+                    "wait": self._wait_time[key].snapshot() if key in self._wait_time else None,
+                }
+                for key in keys
+            }
+
+
+init_registry = ProjectInitRegistry()
+
+
+class ProjectPrewarmer:
+    """在后台线程池中预先构建工程的虚拟环境，避免把 uv sync 的耗时留给任务第一次运行"""
+
+    def __init__(self, max_workers: int, registry: ProjectInitRegistry = init_registry):
+        self.registry = registry
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix="qinglong-prewarm")
+        self._lock = threading.Lock()
+        self._status: dict[str, dict] = {}
+
+    def _update(self, name: str, **kwargs):
+        with self._lock:
+            self._status[name].update(kwargs)
+
+    def _prewarm(self, name: str, project_path: Path, abs_path_str: str):
+        self._update(name, state=PrewarmState.RUNNING, started_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+        try:
+            UvTask._init_project(project_path, abs_path_str)
+        except Exception as e:
+            _logger.error(f"prewarm project {name} failed: {e}")
+            self._update(name, state=PrewarmState.FAILED, error=str(e))
+            raise
+        else:
+            self._update(name, state=PrewarmState.DONE)
+        finally:
+            self._update(name, finished_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+
+    def submit(self, name: str, project_path: Path) -> Future:
+        """排队构建工程环境，该工程已有进行中的构建时直接返回它"""
+        project_path = Path(project_path)
+        abs_path_str = str(project_path.absolute())
+        func = functools.partial(self._prewarm, name, project_path, abs_path_str)
+        with self._lock:
+            future, submitted = self.registry.submit(abs_path_str, func, self._executor)
+            if submitted:
+                self._status[name] = {
+                    "project": name,
+                    "state": PrewarmState.QUEUED,
+                    "queued_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                    "started_at": None,
+                    "finished_at": None,
+                    "error": None,
+                }
+        return future
+
+    def status(self, name: str | None = None):
+        """预热状态，name 为空时返回所有工程"""
+        with self._lock:
+            if name is not None:
+                status = self._status.get(name)
+                return dict(status) if status else None
+            return {key: dict(value) for key, value in self._status.items()}
+
+
+prewarmer = ProjectPrewarmer(cfg.PREWARM_WORKERS)
+
+
 class UvTask:
-    _global_task_lock = threading.Lock()
-    _project_inited = set()
+    # 已初始化工程的依赖文件状态，未变化时跳过指纹计算
+    _project_inited: dict[str, tuple] = {}
 
     def __init__(
         self,
@@ -32,14 +319,30 @@ class UvTask:
         project_path: str,
         uv_args: str = "",
         max_log_size: int = 10 * 1024 * 1024,  # 10MB
+        limits: ResourceLimits | None = None,
+        timeout: float | None = None,
+        kill_grace: float | None = None,
     ):
         self.name = name
         self.cmd = cmd
         self.uv_args = uv_args
         self.project_path = Path(project_path)
         self.max_log_size = max_log_size  # 日志文件最大大小（字节）
-        self.log_file = RotatingLogFile(cfg.TASK_LOG_PATH / (self.name + ".log"))
-        self._process = None  # 添加进程属性
+        self.limits = limits  # 进程资源上限
+        self.timeout = timeout  # 单次运行的超时时间（秒），None 表示不限制
+        self.kill_grace = kill_grace  # 超时后 SIGTERM 到 SIGKILL 的等待时间，None 使用全局配置
+        self.last_status: RunStatus | None = None  # 最近一次运行的结果
+        self.log_file = RotatingLogFile(
+            cfg.TASK_LOG_PATH / (self.name + ".log"),
+            flush_interval=cfg.TASK_LOG_FLUSH_INTERVAL,
+            flush_bytes=cfg.TASK_LOG_FLUSH_BYTES,
+            fsync=cfg.TASK_LOG_FSYNC,
+        )
+        self._process: subprocess.Popen | asyncio.subprocess.Process | None = None  # 添加进程属性
+        self._future: Future | None = None  # asyncio 模式下正在运行的任务
+        self._submit_lock = threading.Lock()
+        self._killed = threading.Event()  # 当前运行是否被 kill 终止
+        self._run_lock = threading.Lock()  # 线程模式下的运行权，从准备运行目录起到运行结束都被占用
         _logger.info(f"uvtask log file: {self.log_file}")
 
     @classmethod
@@ -56,73 +359,283 @@ class UvTask:
         Returns:
             bool: 如果进程正在运行返回True，否则返回False
         """
-        if self._process is None:
-            return False
-        return self._process.poll() is None
+        # 运行方在回收进程后才清空 _process，这里不能调用 Popen.poll()，
+        # 否则可能抢在 _wait 的 wait4 之前回收子进程，丢失资源用量
+        return self._process is not None
 
     @property
     def env(self):
         return _env()
 
-    def init_project(self, project_path: Path):
-        with self._global_task_lock:
-            abs_path_str = str(project_path.absolute())
-            if abs_path_str not in self._project_inited:
-                subprocess.run(["uv", "venv", "--clear"], cwd=project_path, env=self.env, check=True)
-                subprocess.run(["uv", "sync"], cwd=project_path, env=self.env, check=True)
-                _logger.info(f"uvtask project inited: {abs_path_str}")
-                self._project_inited.add(abs_path_str)
-
-    def run(self):
-        """运行命令，并将 stdout 和 stderr 直接写入日志文件"""
-        cmd = f"uv run {self.uv_args} {self.cmd}"
-        cmd = [v for v in cmd.split(" ") if v]
-        _logger.info(f"uvtask command: {cmd}")
+    @classmethod
+    def init_project(cls, project_path: Path):
+        """初始化工程虚拟环境，同一工程同时只有一个初始化在执行"""
+        abs_path_str = str(project_path.absolute())
+        if cls._project_inited.get(abs_path_str) == _stat_key(project_path):
+            return
+        init_registry.run(abs_path_str, functools.partial(cls._init_project, project_path, abs_path_str))
+
+    @classmethod
+    def _init_project(cls, project_path: Path, abs_path_str: str):
+        if cls._project_inited.get(abs_path_str) == _stat_key(project_path):
+            return
+        if sync_project_env(project_path, env=_env()):
+            _logger.info(f"uvtask project inited: {abs_path_str}")
+        else:
+            _logger.info(f"uvtask project environment reused: {abs_path_str}")
+        cls._project_inited[abs_path_str] = _stat_key(project_path)
+
+    def _command(self) -> list[str]:
+        uv = [v for v in f"uv run {self.uv_args}".split(" ") if v]
+        task = [v for v in self.cmd.split(" ") if v]
+        prefix = resource_limits.task_prefix(self.limits)
+        if prefix and task and task[0].endswith(".py"):
+            # uv run 会用工程的 python 运行脚本，套上 prlimit 后需要显式指定
+            task.insert(0, "python")
+        return resource_limits.command_prefix(self.limits) + uv + prefix + task
 
+    def _workdir(self) -> Path:
+        """获取运行目录，工程目录会先完成初始化"""
         if self.project_path.is_dir():
-            task_env = self.project_path
             self.init_project(self.project_path)
-        elif self.project_path.is_file():
-            task_env = self.project_path.parent
-
-        # 直接重定向 stdout 和 stderr 到日志文件
-        with self.log_file as log_f:
-            self._process = subprocess.Popen(
-                cmd,
-                cwd=task_env,
-                env=self.env,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                text=True,
-                bufsize=1,
-            )
-            try:
-                assert self._process.stdout is not None
-                while line := self._process.stdout.readline():
-                    log_f.log(line)
-
-                return_code = self._process.wait()
-            finally:
-                self._process = None
+            return self.project_path
+        return self.project_path.parent
+
+    def reserve(self) -> bool:
+        """占用运行权，已经有运行占用时返回 False；占用后调用 run(reserved=True) 或 unreserve 释放"""
+        return self._run_lock.acquire(blocking=False)
+
+    def unreserve(self):
+        """释放 reserve 占用但没有运行的运行权"""
+        self._run_lock.release()
+
+    def run(self, trigger: RunTrigger = RunTrigger.CRON, attempt: int = 1, reserved: bool = False) -> int | None:
+        """
+        运行命令，并将 stdout 和 stderr 直接写入日志文件，返回退出码
+
+        同一任务同时只能有一个运行，已有运行时抛出 TaskAlreadyRunningError；
+        reserved 为 True 表示调用方已经用 reserve 占用了运行权，运行结束后释放。
+        """
+        if not reserved and not self.reserve():
+            raise errors.TaskAlreadyRunningError(self.name)
+        try:
+            return self._run(trigger, attempt)
+        finally:
+            self._run_lock.release()
+
+    def _run(self, trigger: RunTrigger, attempt: int) -> int | None:
+        cmd = self._command()
+        _logger.info(f"uvtask command: {cmd}")
+        run_id = history.start(self.name, trigger, attempt=attempt)
+        return_code = usage = None
+        breach = resource_limits.BreachDetector(self.limits)
+        timed_out = threading.Event()
+        killed = self._killed = threading.Event()
+        timer = None
+        try:
+            task_env = self._workdir()
+
+            # 直接重定向 stdout 和 stderr 到日志文件
+            with self.log_file as log_f:
+                self._process = subprocess.Popen(
+                    cmd,
+                    cwd=task_env,
+                    env=self.env,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.STDOUT,
+                    encoding=_ENCODING,
+                    errors=_ERRORS,
+                    bufsize=1,
+                    start_new_session=True,
+                )
+                pidfiles.write(self.name, self._process.pid)
+                if self.timeout:
+                    timer = threading.Timer(self.timeout, self._expire, args=(self._process, timed_out))
+                    timer.daemon = True
+                    timer.start()
+                try:
+                    assert self._process.stdout is not None
+                    while line := self._process.stdout.readline():
+                        log_f.log(line)
+                        breach.feed(line)
+
+                    return_code, usage = self._wait(self._process)
+                finally:
+                    if return_code is None:
+                        # 读取输出或写日志出错时进程还在运行，终止整个进程组并回收，避免留下不受管理的进程
+                        _signal_group(self._process, signal.SIGKILL)
+                        self._process.wait()
+                    self._process = None
+                    pidfiles.remove(self.name)
+        finally:
+            if timer is not None:
+                timer.cancel()
+            self.last_status = self._finish(run_id, return_code, timed_out, killed, usage, breach)
+        _logger.info(f"uvtask command completed with exit code {return_code}: {cmd}")
+        return return_code
+
+    async def run_async(self, trigger: RunTrigger = RunTrigger.CRON, attempt: int = 1) -> int | None:
+        """在事件循环中运行命令，行为与 run 相同，但不占用线程等待子进程"""
+        cmd = self._command()
+        _logger.info(f"uvtask async command: {cmd}")
+        run_id = history.start(self.name, trigger, attempt=attempt)
+        return_code = usage = None
+        breach = resource_limits.BreachDetector(self.limits)
+        timed_out = threading.Event()
+        killed = self._killed = threading.Event()
+        watchdog = None
+        try:
+            task_env = await asyncio.to_thread(self._workdir)
+
+            with self.log_file as log_f:
+                self._process = await asyncio.create_subprocess_exec(
+                    *cmd,
+                    cwd=task_env,
+                    env=self.env,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.STDOUT,
+                    start_new_session=True,
+                )
+                pidfiles.write(self.name, self._process.pid)
+                if self.timeout:
+                    watchdog = asyncio.create_task(self._watchdog(self._process, timed_out))
+                sampler = ProcessTreeSampler(self._process.pid)
+                sampling = asyncio.create_task(self._sample(sampler))
+                try:
+                    assert self._process.stdout is not None
+                    async for line in _read_lines(self._process.stdout):
+                        log_f.log(line)
+                        breach.feed(line)
+
+                    # 输出结束时进程还未被回收，最后采样一次
+                    sampler.sample()
+                    return_code = await self._process.wait()
+                    usage = sampler.usage()
+                finally:
+                    sampling.cancel()
+                    if self._process.returncode is None:
+                        # 读取输出出错或被取消时进程还在运行，终止整个进程组并回收
+                        _signal_group(self._process, signal.SIGKILL)
+                        await self._process.wait()
+                    self._process = None
+                    pidfiles.remove(self.name)
+        finally:
+            if watchdog is not None:
+                watchdog.cancel()
+            self.last_status = self._finish(run_id, return_code, timed_out, killed, usage, breach)
         _logger.info(f"uvtask command completed with exit code {return_code}: {cmd}")
+        return return_code
+
+    @staticmethod
+    def _wait(process: subprocess.Popen) -> tuple[int, RunUsage | None]:
+        """等待子进程结束，并通过 wait4 取得子进程树的资源用量"""
+        if not hasattr(os, "wait4"):
+            return process.wait(), None
+        try:
+            _, status, rusage = os.wait4(process.pid, 0)
+        except ChildProcessError:
+            # 进程已经被 kill 中的 wait 回收
+            return process.wait(), None
+        process.returncode = os.waitstatus_to_exitcode(status)
+        return process.returncode, from_rusage(rusage)
+
+    @staticmethod
+    def _finish(run_id, return_code, timed_out: threading.Event, killed: threading.Event, usage, breach) -> RunStatus:
+        if timed_out.is_set():
+            status = RunStatus.TIMEOUT
+        else:
+            status = RunStatus.SUCCESS if return_code == 0 else RunStatus.FAILED
+        limit_breach = breach.result(return_code, stopped=timed_out.is_set() or killed.is_set())
+        history.finish(run_id, return_code, status=status, usage=usage, limit_breach=limit_breach)
+        return status
+
+    @property
+    def grace(self) -> float:
+        return cfg.TASK_KILL_GRACE if self.kill_grace is None else self.kill_grace
+
+    def _expire(self, process: subprocess.Popen, timed_out: threading.Event):
+        """线程模式下运行超时：先向进程组发送 SIGTERM，等待宽限期后 SIGKILL"""
+        if self._process is not process:
+            return
+        timed_out.set()
+        _logger.warning(f"uvtask {self.name} timed out after {self.timeout}s, terminating")
+        _signal_group(process, signal.SIGTERM)
+        time.sleep(self.grace)
+        # uv 退出后子进程可能仍在进程组中，无论 uv 是否退出都要清理整个进程组
+        _signal_group(process, signal.SIGKILL)
+
+    async def _watchdog(self, process: asyncio.subprocess.Process, timed_out: threading.Event):
+        """asyncio 模式下的超时处理，与 _expire 相同"""
+        await asyncio.sleep(self.timeout)
+        timed_out.set()
+        _logger.warning(f"uvtask {self.name} timed out after {self.timeout}s, terminating")
+        _signal_group(process, signal.SIGTERM)
+        await asyncio.sleep(self.grace)
+        _signal_group(process, signal.SIGKILL)
+
+    @staticmethod
+    async def _sample(sampler: ProcessTreeSampler):
+        while True:
+            sampler.sample()
+            await asyncio.sleep(cfg.RESOURCE_SAMPLE_INTERVAL)
+
+    async def _run_in_slot(self, slot, trigger: RunTrigger, attempt: int):
+        async with slot:
+            return await self.run_async(trigger, attempt)
+
+    def submit(self, slot=None, trigger: RunTrigger = RunTrigger.CRON, attempt: int = 1, callback=None, on_skip=None) -> Future:
+        """
+        提交到共享事件循环运行并立即返回；上一次运行未结束时不会重复启动
+
+        参数:
+            slot: 可选的异步上下文管理器，进入后才开始运行，用于并发限制
+            trigger: 本次运行的触发方式，记录到运行记录中
+            attempt: 第几次尝试
+            callback: 运行结束后以 Future 为参数调用，跳过的运行不会调用
+            on_skip: 上一次运行未结束、本次被跳过时调用
+        """
+        with self._submit_lock:
+            if self._future is not None and not self._future.done():
+                _logger.warning(f"uvtask {self.name} is still running, skip this run")
+                if on_skip is not None:
+                    on_skip()
+                return self._future
+            self._future = aiorunner.submit(self._run_in_slot(slot or contextlib.nullcontext(), trigger, attempt))
+            if callback is not None:
+                self._future.add_done_callback(callback)
+            return self._future
 
     def kill(self):
-        """终止正在运行的进程"""
+        """终止正在运行的任务：向整个进程组发送 SIGTERM，宽限期内未退出则 SIGKILL"""
+        process = self.terminate()
+        self.wait_terminated(process, time.monotonic() + self.grace)
+
+    def terminate(self):
+        """向正在运行的进程组发送 SIGTERM 后立即返回该进程，由 wait_terminated 等待退出"""
         process = self._process
         if process is None:
             raise errors.TaskNotRunningError(self.name)
 
-        try:
-            process.terminate()
-            process.wait(timeout=5)  # 等待进程终止
+        self._killed.set()
+        _signal_group(process, signal.SIGTERM)
+        return process
+
+    def wait_terminated(self, process, deadline: float):
+        """等待 terminate 终止的进程退出，到 deadline 仍未退出则向进程组发送 SIGKILL"""
+        # 运行方在进程退出、输出读完后才会清空 _process
+        while self._process is process and time.monotonic() < deadline:
+            time.sleep(0.05)
+        terminated = self._process is not process
+        # uv 退出后可能还有脱离输出管道的子进程留在进程组中，一并清理
+        _signal_group(process, signal.SIGKILL)
+        if terminated:
             _logger.info(f"Successfully terminated process for task: {self.name}")
-        except subprocess.TimeoutExpired:
-            process.kill()  # 如果进程没有及时终止，强制结束
+        else:
             _logger.warning(f"Force killed process for task: {self.name}")
-        except Exception as e:
-            _logger.error(f"Error while killing process for task {self.name}: {e}")
-        finally:
-            self._process = None
 
     def get_logs(self, limit: int = 1000):
         return self.log_file.readlines(limit)
+
+    def remove_logs(self):
+        """删除任务的所有日志文件"""
+        self.log_file.remove()
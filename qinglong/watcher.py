@@ -0,0 +1,125 @@
+import fnmatch
+import logging
+import threading
+from collections.abc import Callable
+from pathlib import Path
+
+from .config import settings as cfg
+from .models import FileWatch
+
+try:
+    import watchfiles
+except ImportError:
+    # watchfiles 随 nicegui 依赖的 uvicorn[standard] 安装，缺失时退化为轮询
+    watchfiles = None
+
+_logger = logging.getLogger(__name__)
+
+
+def _matches(watch: FileWatch, path: str) -> bool:
+    name = Path(path).name
+    return not watch.patterns or any(fnmatch.fnmatch(name, pattern) for pattern in watch.patterns)
+
+
+def _snapshot(path: Path, watch: FileWatch) -> dict[str, tuple[float, int]]:
+    if path.is_file():
+        files = [path]
+    elif path.is_dir():
+        files = path.rglob("*") if watch.recursive else path.glob("*")
+    else:
+        files = []
+    snapshot = {}
+    for file in files:
+        try:
+            stat = file.stat()
+        except OSError:
+            continue
+        if file.is_file() and _matches(watch, str(file)):
+            snapshot[str(file)] = (stat.st_mtime, stat.st_size)
+    return snapshot
+
+
+def _poll(path: Path, watch: FileWatch, stop: threading.Event, callback: Callable[[list[str]], None]):
+    last = _snapshot(path, watch)
+    while not stop.wait(cfg.WATCH_POLL_INTERVAL):
+        current = _snapshot(path, watch)
+        changed = sorted(name for name in last.keys() | current.keys() if last.get(name) != current.get(name))
+        last = current
+        if changed:
+            callback(changed)
+
+
+def _run(path: Path, watch: FileWatch, stop: threading.Event, callback: Callable[[list[str]], None]):
+    if watchfiles is None or not path.exists():
+        # 目录还不存在时 inotify 无法监视，轮询可以等到目录出现
+        _poll(path, watch, stop, callback)
+        return
+    default_filter = watchfiles.DefaultFilter()
+    for changes in watchfiles.watch(
+        path,
+        watch_filter=lambda change, name: default_filter(change, name) and _matches(watch, name),
+        recursive=watch.recursive,
+        stop_event=stop,
+        raise_interrupt=False,
+        # 去抖由调用方按 FileWatch.debounce 处理，这里只合并短时间内的同一批变化
+        debounce=200,
+        step=50,
+    ):
+        callback(sorted(name for _, name in changes))
+
+
+class FileWatchers:
+    """
+    管理各任务的文件监视线程
+
+    每个任务一个线程，优先使用 watchfiles（Linux 上基于 inotify），未安装时按 WATCH_POLL_INTERVAL 轮询。
+    回调收到一批变化的文件路径，在监视线程中调用，不应阻塞。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._watches: dict[str, tuple[FileWatch, Path, threading.Event, threading.Thread]] = {}
+
+    def set(self, name: str, watch: FileWatch, path: Path, callback: Callable[[list[str]], None]):
+        """开始监视，配置未变化时保留已有的监视线程"""
+        with self._lock:
+            current = self._watches.get(name)
+            if current is not None and current[:2] == (watch, path) and current[3].is_alive():
+                return
+        self.remove(name)
+
+        def target():
+            def on_change(changed: list[str]):
+                try:
+                    callback(changed)
+                except Exception as e:
+                    _logger.error(f"file watch callback of {name} failed: {e}")
+
+            try:
+                _run(path, watch, stop, on_change)
+            except Exception as e:
+                _logger.error(f"file watch of {name} stopped: {e}")
+
+        stop = threading.Event()
+        thread = threading.Thread(target=target, name=f"watch-{name}", daemon=True)
+        with self._lock:
+            self._watches[name] = (watch, path, stop, thread)
+        thread.start()
+        _logger.info(f"watching {path} for task {name}")
+
+    def remove(self, name: str):
+        with self._lock:
+            current = self._watches.pop(name, None)
+        if current is not None:
+            current[2].set()
+
+    def names(self) -> list[str]:
+        with self._lock:
+            return list(self._watches)
+
+    def stop_all(self):
+        for name in self.names():
+            self.remove(name)
+
+
+watchers = FileWatchers()
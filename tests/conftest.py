@@ -0,0 +1,25 @@
+import pytest
+from pathlib import Path
+from git import Actor, Repo
+
+AUTHOR = Actor("test", "test@example.com")
+
+
+@pytest.fixture
+def bare_repo(tmp_path: Path):
+    """本地 bare 仓库，以及一个用于推送提交的工作区"""
+    bare_path = tmp_path / "remote.git"
+    Repo.init(bare_path, bare=True, initial_branch="main")
+    work = Repo.init(tmp_path / "work", initial_branch="main")
+    work.create_remote("origin", str(bare_path))
+
+    def commit(files: dict[str, str]):
+        for name, content in files.items():
+            Path(work.working_tree_dir, name).write_text(content)
+        work.index.add(list(files))
+        work.index.commit("update", author=AUTHOR, committer=AUTHOR)
+        work.remotes.origin.push("main:main")
+        return work.head.commit.hexsha
+
+    commit({"main.py": "print('v1')", "pyproject.toml": "[project]\nname = 'demo'\n"})
+    return bare_path, commit
@@ -1,4 +1,12 @@
+import json
 import pytest
+import shutil
+import signal
+import subprocess
+import sys
+import time
+import yaml
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime
 from qinglong.api import (
@@ -16,10 +24,25 @@ from qinglong.api import (
     sync_project,
     init_task,
     sync_task,
+    set_project_concurrency,
+    pull_all_projects,
+    import_tasks,
+    export_tasks,
+    task_dict,
+    execute_task,
+    get_task_runs,
+    run_pipeline,
+    get_pipeline,
+    trigger_task,
+    get_scheduler_stats,
+    _job_signature,
 )
-from qinglong.models import ProjectInfo, TaskInfo, TaskStatus
+from qinglong.models import FileWatch, ProjectInfo, RetryPolicy, RunStatus, RunTrigger, SchedulePolicy, TaskInfo, TaskStatus
 from qinglong.database import project_db, task_db
-from qinglong import errors
+from qinglong.scheduler import Scheduler, scheduler
+from qinglong.config import settings as cfg
+from qinglong.uvtask import UvTask
+from qinglong import api, errors
 
 # 测试数据
 TEST_PROJECT_URL = "https://github.com/test/repo.git"
@@ -216,3 +239,634 @@ def test_sync_operations():
     # 测试任务同步
     sync_task()
     assert TEST_TASK_NAME in task_db
+
+
+def test_set_task_invalid_executor():
+    """测试设置不存在的执行器"""
+    project_info = ProjectInfo(
+        name=TEST_PROJECT_NAME,
+        url=TEST_PROJECT_URL,
+        project_path="/test/path",
+        created_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        upgrade_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    )
+    project_db[TEST_PROJECT_NAME] = project_info
+
+    with pytest.raises(errors.InvalidExecutorError):
+        set_task(TEST_TASK_NAME, TEST_PROJECT_NAME, TEST_CRON, TEST_CMD, executor="not-exist")
+    assert TEST_TASK_NAME not in task_db
+
+
+def test_init_task_reconcile(monkeypatch):
+    """测试启动时只对变化的调度任务做增删改"""
+    monkeypatch.setattr(cfg, "UV_MAINTENANCE_ON_START", False)
+    project_info = ProjectInfo(
+        name=TEST_PROJECT_NAME,
+        url=TEST_PROJECT_URL,
+        project_path="/test/path",
+        created_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        upgrade_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    )
+    project_db[TEST_PROJECT_NAME] = project_info
+    set_task(TEST_TASK_NAME, TEST_PROJECT_NAME, TEST_CRON, TEST_CMD)
+    job = scheduler.get_job(TEST_TASK_NAME)
+
+    # 没有变化时保留原有的调度任务
+    init_task()
+    assert scheduler.get_job(TEST_TASK_NAME) is job
+
+    # 修改了 cron 和状态的任务会被重建或暂停
+    task_info = task_db[TEST_TASK_NAME]
+    task_info.cron = "0 0 * * *"
+    task_info.status = TaskStatus.PAUSED
+    task_db[TEST_TASK_NAME] = task_info
+    init_task()
+    job = scheduler.get_job(TEST_TASK_NAME)
+    assert job.name.startswith("0 0 * * *")
+    assert job.next_run_time is None
+
+    # 已删除任务的调度任务会被清理
+    del task_db[TEST_TASK_NAME]
+    init_task()
+    assert scheduler.get_job(TEST_TASK_NAME) is None
+
+
+def test_set_project_concurrency():
+    """测试设置工程并发上限"""
+    project_info = ProjectInfo(
+        name=TEST_PROJECT_NAME,
+        url=TEST_PROJECT_URL,
+        project_path="/test/path",
+        created_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        upgrade_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    )
+    project_db[TEST_PROJECT_NAME] = project_info
+
+    assert set_project_concurrency(TEST_PROJECT_NAME, 2).max_concurrency == 2
+    assert project_db[TEST_PROJECT_NAME].max_concurrency == 2
+    assert scheduler.limiter.limits[f"project:{TEST_PROJECT_NAME}"] == 2
+
+    set_project_concurrency(TEST_PROJECT_NAME, 0)
+    assert f"project:{TEST_PROJECT_NAME}" not in scheduler.limiter.limits
+
+
+def test_project_concurrency_does_not_hog_pool(tmp_path: Path, monkeypatch):
+    """测试线程池只有 2 个线程时，受限工程排队的任务不占用线程，其他工程的任务立即运行"""
+    monkeypatch.setattr(cfg, "SCHEDULER_THREAD_POOL_SIZE", 2)
+    small_scheduler = Scheduler()
+    monkeypatch.setattr(api, "scheduler", small_scheduler)
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    for name in ("capped", "other"):
+        (tmp_path / name).mkdir()
+        script = tmp_path / name / "job.py"
+        script.write_text("import time; time.sleep(2)" if name == "capped" else "print('ok')")
+        project_db[name] = ProjectInfo(name=name, project_path=str(script), created_at=now, upgrade_at=now)
+    set_project_concurrency("capped", 1)
+    for i in range(3):
+        set_task(f"capped-{i}", "capped", "", "python job.py")
+    set_task("other-task", "other", "", "python job.py")
+
+    start = time.time()
+    for i in range(3):
+        small_scheduler.add_delayed_job(f"capped-{i}", execute_task, 0, args=(f"capped-{i}",))
+    time.sleep(0.3)
+    small_scheduler.add_delayed_job("other-task", execute_task, 0, args=("other-task",))
+    other = wait_runs("other-task", start)
+    # 阻塞等待空位时另一个工程的任务要等第一个受限任务结束（2 秒）才有线程
+    assert other[0]["finished_at"] - start < 1.8
+
+    capped = [wait_runs(f"capped-{i}", start)[0] for i in range(3)]
+    capped.sort(key=lambda run: run["started_at"])
+    assert all(run["status"] == RunStatus.SUCCESS for run in capped)
+    assert all(a["finished_at"] <= b["started_at"] for a, b in zip(capped, capped[1:]))
+    small_scheduler.shutdown()
+
+
+def test_pull_all_projects(bare_repo, tmp_path: Path, monkeypatch):
+    """测试并行拉取所有项目并汇总结果"""
+    monkeypatch.setattr(cfg, "PROJECT_PATH", tmp_path / "projects")
+    monkeypatch.setattr(cfg, "PREWARM_ON_UPDATE", False)
+    bare_path, commit = bare_repo
+    for name in ("p1", "p2", "p3"):
+        clone_project(bare_path.as_uri(), name)
+    # p3 的远端地址失效，需要重新克隆时失败
+    project_info = project_db["p3"]
+    project_info.url = (tmp_path / "not-exist.git").as_uri()
+    project_db["p3"] = project_info
+    shutil.rmtree(tmp_path / "projects" / "p3")
+
+    commit({"main.py": "print('v2')"})
+    report = pull_all_projects(max_workers=2, timeout=60)
+
+    assert report["running"] is False
+    assert report["done"] == report["total"] == 3
+    assert report["results"]["p1"]["status"] == "updated"
+    assert report["results"]["p1"]["changed_files"] == ["main.py"]
+    assert report["results"]["p3"]["status"] == "failed"
+    assert report["summary"] == {"updated": 2, "unchanged": 0, "failed": 1, "timeout": 0}
+
+    report = pull_all_projects(max_workers=2, timeout=60)
+    assert report["results"]["p1"]["status"] == "unchanged"
+
+
+def test_import_tasks():
+    """测试批量导入任务，校验失败时不做任何改动"""
+    project_info = ProjectInfo(
+        name=TEST_PROJECT_NAME,
+        url=TEST_PROJECT_URL,
+        project_path="/test/path",
+        created_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        upgrade_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    )
+    project_db[TEST_PROJECT_NAME] = project_info
+    rows = [
+        {"name": f"import-{i}", "project_name": TEST_PROJECT_NAME, "cron": TEST_CRON, "command": TEST_CMD} for i in range(3)
+    ]
+    bad_rows = rows + [
+        {"name": "bad-cron", "project_name": TEST_PROJECT_NAME, "cron": "not a cron", "command": TEST_CMD},
+        {"name": "bad-project", "project_name": "missing", "cron": TEST_CRON, "command": TEST_CMD},
+        {"name": "import-0", "project_name": TEST_PROJECT_NAME, "cron": TEST_CRON, "command": TEST_CMD},
+        {"name": "no-command", "project_name": TEST_PROJECT_NAME, "cron": TEST_CRON},
+        {"name": ["unhashable"], "project_name": TEST_PROJECT_NAME, "cron": TEST_CRON, "command": TEST_CMD},
+    ]
+
+    result = import_tasks(json.dumps(bad_rows))
+    assert not result.ok
+    assert sorted(result.errors) == [3, 4, 5, 6, 7]
+    assert result.imported == []
+    assert len(task_db) == 0
+
+    result = import_tasks(json.dumps(bad_rows), skip_invalid=True)
+    assert result.imported == ["import-0", "import-1", "import-2"]
+    assert all(scheduler.get_job(name) is not None for name in result.imported)
+
+    with pytest.raises(errors.TaskImportError):
+        import_tasks("{", format="json")
+    for name in result.imported:
+        remove_task(name)
+
+
+def test_import_tasks_rollback(monkeypatch):
+    """测试写入数据库失败时不改动调度任务和 UvTask"""
+    project_info = ProjectInfo(
+        name=TEST_PROJECT_NAME,
+        url=TEST_PROJECT_URL,
+        project_path="/test/path",
+        created_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        upgrade_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    )
+    project_db[TEST_PROJECT_NAME] = project_info
+    rows = [
+        {"name": f"import-{i}", "project_name": TEST_PROJECT_NAME, "cron": TEST_CRON, "command": TEST_CMD} for i in range(3)
+    ]
+    setitem = type(task_db).__setitem__
+
+    def failing_setitem(self, key, value):
+        if key == "import-2":
+            raise OSError("disk full")
+        setitem(self, key, value)
+
+    monkeypatch.setattr(type(task_db), "__setitem__", failing_setitem)
+    with pytest.raises(OSError):
+        import_tasks(json.dumps(rows))
+    monkeypatch.undo()
+
+    for row in rows:
+        assert row["name"] not in task_db
+        assert row["name"] not in api.task_dict
+        assert scheduler.get_job(row["name"]) is None
+
+
+def test_export_import_roundtrip():
+    """测试导出的任务可以重新导入，已有任务在原配置上更新"""
+    project_info = ProjectInfo(
+        name=TEST_PROJECT_NAME,
+        url=TEST_PROJECT_URL,
+        project_path="/test/path",
+        created_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        upgrade_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    )
+    project_db[TEST_PROJECT_NAME] = project_info
+    set_task(TEST_TASK_NAME, TEST_PROJECT_NAME, TEST_CRON, TEST_CMD, webhook_token="secret")
+    pause_task(TEST_TASK_NAME)
+    created_at = task_db[TEST_TASK_NAME].created_at
+
+    data = export_tasks(format="yaml")
+    rows = yaml.safe_load(data)
+    assert rows[0]["status"] == "paused"
+    assert "created_at" not in rows[0]
+    assert "webhook_token" not in rows[0]
+    assert yaml.safe_load(export_tasks(format="yaml", include_secrets=True))[0]["webhook_token"] == "secret"
+
+    rows[0]["cron"] = "0 0 * * *"
+    result = import_tasks(yaml.safe_dump(rows), format="yaml")
+    assert result.imported == [TEST_TASK_NAME]
+    task_info = task_db[TEST_TASK_NAME]
+    assert task_info.cron == "0 0 * * *"
+    assert task_info.created_at == created_at
+    assert task_info.webhook_token == "secret"
+    job = scheduler.get_job(TEST_TASK_NAME)
+    assert job.name.startswith("0 0 * * *")
+    assert job.next_run_time is None
+    remove_task(TEST_TASK_NAME)
+
+
+def test_execute_task_overlap(tmp_path: Path, monkeypatch):
+    """测试准备运行目录期间再次触发会被跳过，不会同时启动两次运行"""
+    script = tmp_path / "ok.py"
+    script.write_text("print('ok')")
+    project_db[TEST_PROJECT_NAME] = ProjectInfo(
+        name=TEST_PROJECT_NAME,
+        project_path=str(script),
+        created_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        upgrade_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    )
+    set_task("overlap-task", TEST_PROJECT_NAME, "0 0 1 1 *", "python ok.py")
+    workdir = UvTask._workdir
+
+    def slow_workdir(self):
+        # 模拟初始化工程环境耗时，此时还没有启动进程
+        time.sleep(0.5)
+        return workdir(self)
+
+    monkeypatch.setattr(UvTask, "_workdir", slow_workdir)
+    start = time.time()
+    with ThreadPoolExecutor(2) as pool:
+        results = list(pool.map(lambda _: execute_task("overlap-task"), range(2)))
+    assert results.count(None) == 1 and results.count(0) == 1
+    assert len(wait_runs("overlap-task", start)) == 1
+    remove_task("overlap-task")
+
+
+def test_remove_project_cascade(tmp_path: Path, monkeypatch):
+    """测试删除工程时级联删除其任务、调度任务和日志，正在运行的任务一起终止只等待一次宽限期"""
+    monkeypatch.setattr(cfg, "PROJECT_PATH", tmp_path / "projects")
+    monkeypatch.setattr(cfg, "TASK_LOG_PATH", tmp_path / "log")
+    (tmp_path / "projects" / TEST_PROJECT_NAME).mkdir(parents=True)
+    for name in (TEST_PROJECT_NAME, "other"):
+        project_db[name] = ProjectInfo(
+            name=name,
+            project_path=str(tmp_path / "projects" / name),
+            created_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            upgrade_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        )
+    # 忽略 SIGTERM 的进程，只能在宽限期结束后被 SIGKILL
+    ignore_term = "import signal, time; signal.signal(signal.SIGTERM, signal.SIG_IGN); print(flush=True); time.sleep(60)"
+    processes = []
+    for name in ("t1", "t2"):
+        set_task(name, TEST_PROJECT_NAME, TEST_CRON, TEST_CMD, kill_grace=0.5)
+        task_dict[name].log_file.log("hello")
+        process = subprocess.Popen([sys.executable, "-c", ignore_term], stdout=subprocess.PIPE, start_new_session=True)
+        process.stdout.readline()
+        task_dict[name]._process = process
+        processes.append(process)
+    api._fire_task("t1", RunTrigger.WEBHOOK, delay=60)
+    set_task("t3", "other", TEST_CRON, TEST_CMD)
+
+    start = time.monotonic()
+    remove_project(TEST_PROJECT_NAME)
+    assert time.monotonic() - start < 0.9
+    assert all(process.wait(5) == -signal.SIGKILL for process in processes)
+
+    assert TEST_PROJECT_NAME not in project_db
+    assert scheduler.get_job(api._oneoff_job_id("t1", RunTrigger.WEBHOOK)) is None
+    assert "t1" not in api._pending_jobs
+    assert list(task_db) == ["t3"]
+    assert scheduler.get_job("t1") is None and scheduler.get_job("t2") is None
+    assert "t1" not in task_dict
+    assert not (tmp_path / "log" / "t1.log").exists()
+    assert scheduler.get_job("t3") is not None
+    remove_task("t3")
+
+
+def test_retry_policy():
+    """测试重试条件和指数退避的等待时间"""
+    policy = RetryPolicy(max_attempts=3, delay=10, backoff=2, max_delay=30, jitter=0, exit_codes=[3])
+    assert policy.should_retry(1, RunStatus.FAILED, 3)
+    assert not policy.should_retry(1, RunStatus.FAILED, 1)
+    assert not policy.should_retry(1, RunStatus.SUCCESS, 0)
+    assert policy.should_retry(2, RunStatus.TIMEOUT, -15)
+    assert not policy.should_retry(3, RunStatus.FAILED, 3)
+    assert [policy.delay_for(attempt) for attempt in (1, 2, 3)] == [10, 20, 30]
+    assert 9 <= RetryPolicy(delay=10, jitter=0.1).delay_for(1) <= 11
+
+
+def test_execute_task_retry(tmp_path: Path):
+    """测试失败后由调度器按策略重试，并在运行记录中记录第几次尝试"""
+    script = tmp_path / "fail.py"
+    script.write_text("raise SystemExit(3)")
+    project_db[TEST_PROJECT_NAME] = ProjectInfo(
+        name=TEST_PROJECT_NAME,
+        project_path=str(script),
+        created_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        upgrade_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    )
+    retry = RetryPolicy(max_attempts=3, delay=0.1, jitter=0)
+    set_task("retry-task", TEST_PROJECT_NAME, "0 0 1 1 *", "python fail.py", retry=retry)
+
+    start = time.time()
+    execute_task("retry-task")
+    for _ in range(300):
+        runs = get_task_runs("retry-task", since=start)
+        if len(runs) == 3 and runs[0]["status"] != RunStatus.RUNNING:
+            break
+        time.sleep(0.1)
+    assert [run["attempt"] for run in runs] == [3, 2, 1]
+    assert [run["trigger"] for run in runs] == ["retry", "retry", "cron"]
+    assert all(run["exit_code"] == 3 for run in runs)
+    assert scheduler.get_job(api._oneoff_job_id("retry-task", RunTrigger.RETRY)) is None
+    remove_task("retry-task")
+
+
+def test_task_dependency_validation():
+    """测试依赖未知任务、依赖自身和循环依赖时拒绝保存"""
+    project_db[TEST_PROJECT_NAME] = ProjectInfo(
+        name=TEST_PROJECT_NAME,
+        project_path=TEST_PROJECT_URL,
+        created_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        upgrade_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    )
+    set_task("dep-a", TEST_PROJECT_NAME, TEST_CRON, TEST_CMD)
+    set_task("dep-b", TEST_PROJECT_NAME, "", TEST_CMD, depends_on=["dep-a"])
+    assert scheduler.get_job("dep-b") is None
+
+    with pytest.raises(errors.TaskDependencyError):
+        set_task("dep-c", TEST_PROJECT_NAME, "", TEST_CMD, depends_on=["missing"])
+    with pytest.raises(errors.TaskDependencyError):
+        set_task("dep-c", TEST_PROJECT_NAME, "", TEST_CMD, depends_on=["dep-c"])
+    with pytest.raises(errors.TaskDependencyError):
+        set_task("dep-a", TEST_PROJECT_NAME, TEST_CRON, TEST_CMD, depends_on=["dep-b"])
+
+    rows = [
+        {"name": "dep-a", "project_name": TEST_PROJECT_NAME, "cron": TEST_CRON, "command": TEST_CMD, "depends_on": ["dep-b"]}
+    ]
+    result = import_tasks(json.dumps(rows))
+    assert not result.ok and "cycle" in result.errors[0]
+    assert task_db["dep-a"].depends_on == []
+
+    remove_task("dep-b")
+    remove_task("dep-a")
+
+
+def test_run_pipeline(tmp_path: Path):
+    """测试流水线按依赖顺序运行：a 完成后并行运行 b、c，两者都成功后运行 d"""
+    script = tmp_path / "ok.py"
+    script.write_text("print('ok')")
+    project_db[TEST_PROJECT_NAME] = ProjectInfo(
+        name=TEST_PROJECT_NAME,
+        project_path=str(script),
+        created_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        upgrade_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    )
+    set_task("dag-a", TEST_PROJECT_NAME, "", "python ok.py")
+    set_task("dag-b", TEST_PROJECT_NAME, "", "python ok.py", depends_on=["dag-a"])
+    set_task("dag-c", TEST_PROJECT_NAME, "", "python ok.py", depends_on=["dag-a"])
+    set_task("dag-d", TEST_PROJECT_NAME, "", "python ok.py", depends_on=["dag-b", "dag-c"])
+
+    start = time.time()
+    pipeline = run_pipeline("dag-a")
+    for _ in range(300):
+        state = get_pipeline(pipeline)
+        if state["status"] != "running":
+            break
+        time.sleep(0.1)
+    assert state["status"] == "success"
+    assert state["tasks"] == ["dag-a", "dag-b", "dag-c", "dag-d"]
+    assert state["done"][0] == "dag-a" and state["done"][-1] == "dag-d"
+    with pytest.raises(errors.PipelineNotFoundError):
+        get_pipeline("missing")
+
+    runs = {name: get_task_runs(name, since=start) for name in state["tasks"]}
+    assert [run["trigger"] for run in runs["dag-a"]] == ["manual"]
+    assert all([run["trigger"] for run in runs[name]] == ["dependency"] for name in ("dag-b", "dag-c", "dag-d"))
+    assert runs["dag-d"][0]["started_at"] >= max(runs[name][0]["finished_at"] for name in ("dag-b", "dag-c"))
+
+    for name in ("dag-d", "dag-c", "dag-b", "dag-a"):
+        remove_task(name)
+
+
+def test_pipeline_skip(tmp_path: Path):
+    """测试流水线中的下游任务仍在运行被跳过时，流水线结束为失败并清除依赖状态"""
+    (tmp_path / "ok.py").write_text("print('ok')")
+    (tmp_path / "slow.py").write_text("import time\ntime.sleep(3)")
+    project_db[TEST_PROJECT_NAME] = ProjectInfo(
+        name=TEST_PROJECT_NAME,
+        project_path=str(tmp_path / "ok.py"),
+        created_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        upgrade_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    )
+    set_task("skip-a", TEST_PROJECT_NAME, "", "python ok.py")
+    set_task("skip-b", TEST_PROJECT_NAME, "", "python slow.py", depends_on=["skip-a"])
+    api._fire_task("skip-b", RunTrigger.MANUAL)
+    for _ in range(100):
+        if api.task_dict["skip-b"].is_running:
+            break
+        time.sleep(0.05)
+
+    pipeline = run_pipeline("skip-a")
+    for _ in range(100):
+        state = get_pipeline(pipeline)
+        if state["status"] != "running":
+            break
+        time.sleep(0.05)
+    assert state["status"] == "failed"
+    assert state["failed"] == "skip-b"
+    assert not any(key[0] == pipeline for key in api._upstream_done)
+
+    wait_runs("skip-b", time.time() - 10)
+    remove_task("skip-b")
+    remove_task("skip-a")
+
+
+def test_upstream_failure_resets_dependency():
+    """测试流水线之外上游最终失败时，清除下游已记录的上游完成状态"""
+    project_db[TEST_PROJECT_NAME] = ProjectInfo(
+        name=TEST_PROJECT_NAME,
+        url=TEST_PROJECT_URL,
+        project_path="/test/path",
+        created_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        upgrade_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    )
+    set_task("org-a", TEST_PROJECT_NAME, "", TEST_CMD)
+    set_task("org-c", TEST_PROJECT_NAME, "", TEST_CMD)
+    set_task("org-b", TEST_PROJECT_NAME, "", TEST_CMD, depends_on=["org-a", "org-c"])
+
+    api._fire_downstream("org-a", None)
+    assert api._upstream_done[(None, "org-b")] == {"org-a"}
+    api.task_dict["org-a"].last_status = RunStatus.FAILED
+    api._after_run("org-a", 1, 1, None)
+    assert (None, "org-b") not in api._upstream_done
+
+    for name in ("org-b", "org-c", "org-a"):
+        remove_task(name)
+
+
+def test_oneoff_job_id_does_not_collide():
+    """测试一次性调度任务的 id 不会与名称中带冒号的任务的定时调度任务冲突"""
+    project_db[TEST_PROJECT_NAME] = ProjectInfo(
+        name=TEST_PROJECT_NAME,
+        url=TEST_PROJECT_URL,
+        project_path="/test/path",
+        created_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        upgrade_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    )
+    set_task("col:webhook", TEST_PROJECT_NAME, TEST_CRON, TEST_CMD)
+    set_task("col", TEST_PROJECT_NAME, "", TEST_CMD)
+    api._fire_task("col", RunTrigger.WEBHOOK, delay=60)
+
+    assert scheduler.get_job("col:webhook").args == ("col:webhook",)
+    assert scheduler.get_job(api._oneoff_job_id("col", RunTrigger.WEBHOOK)).args == ("col",)
+    assert api._pending_jobs["col"] == {api._oneoff_job_id("col", RunTrigger.WEBHOOK)}
+    remove_task("col")
+    assert "col" not in api._pending_jobs
+    remove_task("col:webhook")
+
+
+def wait_runs(task_name: str, since: float, count: int = 1) -> list[dict]:
+    for _ in range(300):
+        runs = get_task_runs(task_name, since=since)
+        if len(runs) >= count and all(run["status"] != RunStatus.RUNNING for run in runs):
+            break
+        time.sleep(0.1)
+    return runs
+
+
+def test_event_triggers(tmp_path: Path):
+    """测试 webhook 令牌校验，以及监视目录中的文件变化去抖后只触发一次运行"""
+    script = tmp_path / "ok.py"
+    script.write_text("print('ok')")
+    (tmp_path / "inbox").mkdir()
+    project_db[TEST_PROJECT_NAME] = ProjectInfo(
+        name=TEST_PROJECT_NAME,
+        project_path=str(script),
+        created_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        upgrade_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    )
+    set_task("hook-task", TEST_PROJECT_NAME, "", "python ok.py", webhook_token="secret")
+    with pytest.raises(errors.TriggerRejectedError):
+        trigger_task("hook-task", "wrong")
+    with pytest.raises(errors.TaskNotFoundError):
+        trigger_task("missing", "secret")
+    start = time.time()
+    trigger_task("hook-task", "secret")
+    assert [run["trigger"] for run in wait_runs("hook-task", start)] == ["webhook"]
+    # 运行后不再留在待执行索引中
+    assert "hook-task" not in api._pending_jobs
+    pause_task("hook-task")
+    with pytest.raises(errors.TriggerRejectedError):
+        trigger_task("hook-task", "secret")
+    remove_task("hook-task")
+
+    watch = FileWatch(path="inbox", patterns=["*.csv"], debounce=0.5)
+    set_task("watch-task", TEST_PROJECT_NAME, "", "python ok.py", watch=watch)
+    time.sleep(0.5)
+    start = time.time()
+    for i in range(3):
+        (tmp_path / "inbox" / f"{i}.csv").write_text("a,b")
+        time.sleep(0.1)
+    wait_runs("watch-task", start)
+    # 等待可能多出的运行
+    time.sleep(1)
+    runs = get_task_runs("watch-task", since=start)
+    assert [run["trigger"] for run in runs] == ["watch"]
+    remove_task("watch-task")
+
+
+@pytest.mark.parametrize("runner", ["thread", "asyncio"])
+def test_run_task_manual(tmp_path: Path, monkeypatch, runner: str):
+    """测试手动运行立即执行并记录为 manual，不改变暂停状态，运行中再次触发时报错，返回的 Future 跟踪真正的运行"""
+    monkeypatch.setattr(cfg, "TASK_RUNNER", runner)
+    script = tmp_path / "slow.py"
+    script.write_text("import time; time.sleep(1)")
+    project_db[TEST_PROJECT_NAME] = ProjectInfo(
+        name=TEST_PROJECT_NAME,
+        project_path=str(script),
+        created_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        upgrade_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    )
+    set_task("manual-task", TEST_PROJECT_NAME, "0 0 1 1 *", "python slow.py")
+    pause_task("manual-task")
+
+    start = time.time()
+    future = run_task("manual-task")
+    time.sleep(0.5)
+    with pytest.raises(errors.TaskAlreadyRunningError):
+        run_task("manual-task")
+    assert future.result(timeout=30) == 0
+    runs = get_task_runs("manual-task", since=start)
+    assert [run["trigger"] for run in runs] == ["manual"]
+    assert runs[0]["status"] == RunStatus.SUCCESS
+    assert scheduler.get_job("manual-task").next_run_time is None
+    remove_task("manual-task")
+
+
+@pytest.mark.parametrize("runner", ["thread", "asyncio"])
+def test_run_task_waits_for_slot(tmp_path: Path, monkeypatch, runner: str):
+    """测试工程并发已满时手动运行排队等待，返回的 Future 在排队的运行结束后得到它的退出码"""
+    monkeypatch.setattr(cfg, "TASK_RUNNER", runner)
+    (tmp_path / "slow.py").write_text("import time; time.sleep(1)")
+    (tmp_path / "fail.py").write_text("raise SystemExit(3)")
+    project_db[TEST_PROJECT_NAME] = ProjectInfo(
+        name=TEST_PROJECT_NAME,
+        project_path=str(tmp_path / "slow.py"),
+        created_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        upgrade_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    )
+    set_project_concurrency(TEST_PROJECT_NAME, 1)
+    set_task("slot-a", TEST_PROJECT_NAME, "", "python slow.py")
+    set_task("slot-b", TEST_PROJECT_NAME, "", "python fail.py")
+
+    start = time.time()
+    first = run_task("slot-a")
+    time.sleep(0.3)
+    queued = run_task("slot-b")
+    time.sleep(0.2)
+    assert not queued.done()
+    # 排队期间仍然算作正在运行
+    with pytest.raises(errors.TaskAlreadyRunningError):
+        run_task("slot-b")
+    assert queued.result(timeout=30) == 3
+    assert first.result(timeout=30) == 0
+    a, b = wait_runs("slot-a", start)[0], wait_runs("slot-b", start)[0]
+    assert a["finished_at"] <= b["started_at"]
+    set_project_concurrency(TEST_PROJECT_NAME, 0)
+    remove_task("slot-a")
+    remove_task("slot-b")
+
+
+def test_schedule_policy(monkeypatch):
+    """测试任务的错过触发和错峰配置覆盖全局配置，修改后重建调度任务"""
+    monkeypatch.setattr(cfg, "SCHEDULER_SPREAD", 0)
+    monkeypatch.setattr(cfg, "SCHEDULER_MISFIRE_GRACE_TIME", 0)
+    project_db[TEST_PROJECT_NAME] = ProjectInfo(
+        name=TEST_PROJECT_NAME,
+        project_path=TEST_PROJECT_URL,
+        created_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        upgrade_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    )
+    set_task(TEST_TASK_NAME, TEST_PROJECT_NAME, "0 * * * *", TEST_CMD)
+    job = scheduler.get_job(TEST_TASK_NAME)
+    assert job.misfire_grace_time is None and job.coalesce
+    assert job.next_run_time.minute == 0
+
+    schedule = SchedulePolicy(misfire_grace_time=300, coalesce=False, spread=3600)
+    set_task(TEST_TASK_NAME, TEST_PROJECT_NAME, "0 * * * *", TEST_CMD, schedule=schedule)
+    job = scheduler.get_job(TEST_TASK_NAME)
+    assert job.misfire_grace_time == 300 and not job.coalesce
+    offset = job.trigger.offset
+    assert 0 <= offset < 3600
+    assert job.next_run_time.minute * 60 + job.next_run_time.second == offset
+
+    # 全局配置变化后签名不一致，启动时会重建
+    signature = job.name
+    monkeypatch.setattr(cfg, "SCHEDULER_JITTER", 10)
+    assert _job_signature(task_db[TEST_TASK_NAME]) != signature
+    remove_task(TEST_TASK_NAME)
+
+
+def test_get_scheduler_stats():
+    """测试调度器统计包含各线程池的大小和排队数"""
+    stats = get_scheduler_stats()
+    assert stats["pools"]["default"] == {"size": cfg.SCHEDULER_THREAD_POOL_SIZE, "queued": 0}
+    assert set(stats["counts"]) == {"submitted", "executed", "failed", "missed", "skipped"}
+    assert {"lag", "duration", "queue_depth"} <= set(stats)
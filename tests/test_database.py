@@ -0,0 +1,97 @@
+import pytest
+import shelvez as shelve
+from pathlib import Path
+from qinglong.database import CachedStore, _task_serializer
+from qinglong.models import TaskInfo, TaskStatus
+
+
+def make_task(name: str, status=TaskStatus.STARTED):
+    return TaskInfo(
+        name=name,
+        project_name="project",
+        cron="* * * * *",
+        command="main.py",
+        status=status,
+        created_at="2025-01-01 00:00:00",
+        upgrade_at="2025-01-01 00:00:00",
+    )
+
+
+@pytest.fixture
+def store_path(tmp_path: Path):
+    return tmp_path / "task.sqlite"
+
+
+def open_store(path: Path):
+    return CachedStore(shelve.open(path, serializer=_task_serializer))
+
+
+def test_read_through(store_path: Path):
+    """测试写入后缓存和存储一致，读取返回副本"""
+    store = open_store(store_path)
+    store["a"] = make_task("a")
+    task = store["a"]
+    task.status = TaskStatus.PAUSED
+    assert store["a"].status == TaskStatus.STARTED
+
+    store["a"] = task
+    assert [row["status"] for row in store.dumps()] == [TaskStatus.PAUSED]
+    del store["a"]
+    assert "a" not in store
+    assert store.dumps() == []
+    store.close()
+
+
+def test_dumps_cached(store_path: Path):
+    """测试未修改时列表直接使用缓存"""
+    store = open_store(store_path)
+    store["a"] = make_task("a")
+    first = store.dumps()
+    assert store.dumps()[0] is first[0]
+    store["b"] = make_task("b")
+    assert sorted(row["name"] for row in store.dumps()) == ["a", "b"]
+    store.close()
+
+
+def test_transaction(store_path: Path):
+    """测试批量写入提交后持久化，出错时回滚"""
+    store = open_store(store_path)
+    with store.transaction():
+        for i in range(10):
+            store[f"t{i}"] = make_task(f"t{i}")
+
+    with pytest.raises(RuntimeError):
+        with store.transaction():
+            store["bad"] = make_task("bad")
+            del store["t0"]
+            raise RuntimeError
+    assert "bad" not in store
+    assert "t0" in store
+    store.close()
+
+    reopened = open_store(store_path)
+    assert sorted(reopened) == sorted(f"t{i}" for i in range(10))
+    reopened.close()
+
+
+def test_index(store_path: Path):
+    """测试按字段的二级索引随写入和删除更新"""
+    store = CachedStore(shelve.open(store_path, serializer=_task_serializer), index="project_name")
+    store["a"] = make_task("a")
+    store["b"] = make_task("b")
+    task = make_task("c")
+    task.project_name = "other"
+    store["c"] = task
+    assert sorted(store.index_keys("project")) == ["a", "b"]
+
+    task.project_name = "project"
+    store["c"] = task
+    del store["a"]
+    assert sorted(store.index_keys("project")) == ["b", "c"]
+    assert store.index_values() == ["project"]
+
+    # 重新加载时重建索引
+    store.invalidate()
+    assert sorted(store.index_keys("project")) == ["b", "c"]
+    assert store.index_keys("missing") == []
+    store.close()
@@ -0,0 +1,230 @@
+import hashlib
+import socket
+import threading
+import time
+import pytest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from git import GitCommandError, Repo
+from qinglong import errors
+from qinglong.download import FileDownloader, ProjectDownloder, download_files
+
+PAYLOAD = bytes(range(256)) * 4096
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    """支持 Range 和 If-Range 请求的简单文件服务"""
+
+    ranges = []
+    etag = '"v1"'
+    # 为 True 时忽略请求的起点，总是从头返回 206 片段
+    misplace = False
+
+    def do_GET(self):
+        data = PAYLOAD
+        header = self.headers.get("Range")
+        self.ranges.append(header)
+        if header and self.headers.get("If-Range") in (None, self.etag):
+            start = int(header.removeprefix("bytes=").split("-")[0])
+            if start >= len(data):
+                self.send_response(416)
+                self.end_headers()
+                return
+            if self.misplace:
+                start = 0
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(data) - 1}/{len(data)}")
+            data = data[start:]
+        else:
+            self.send_response(200)
+        self.send_header("ETag", self.etag)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def http_url():
+    RangeHandler.ranges = []
+    RangeHandler.etag = '"v1"'
+    RangeHandler.misplace = False
+    server = ThreadingHTTPServer(("127.0.0.1", 0), RangeHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/file.bin"
+    server.shutdown()
+    server.server_close()
+
+
+def test_clone(bare_repo, tmp_path: Path):
+    """测试首次下载为克隆"""
+    bare_path, commit = bare_repo
+    project_path = tmp_path / "project"
+    update = ProjectDownloder(url=str(bare_path), projectpath=project_path).download()
+
+    assert update.old_sha is None
+    assert update.changed
+    assert (project_path / "main.py").read_text() == "print('v1')"
+
+
+def test_clone_timeout(tmp_path: Path):
+    """测试远端不响应时克隆按超时终止，并清理克隆了一半的目录"""
+    # 只监听不 accept，连接能建立但永远收不到响应
+    server = socket.create_server(("127.0.0.1", 0))
+    project_path = tmp_path / "project"
+    try:
+        url = f"http://127.0.0.1:{server.getsockname()[1]}/repo.git"
+        start = time.monotonic()
+        with pytest.raises(GitCommandError):
+            ProjectDownloder(url=url, projectpath=project_path).download(timeout=1)
+        assert time.monotonic() - start < 10
+    finally:
+        server.close()
+    assert not project_path.exists()
+
+
+def test_update_unchanged(bare_repo, tmp_path: Path):
+    """测试远端没有新提交时不改动工作区"""
+    bare_path, commit = bare_repo
+    downloader = ProjectDownloder(url=str(bare_path), projectpath=tmp_path / "project")
+    sha = downloader.download().new_sha
+
+    update = downloader.download()
+    assert update.old_sha == update.new_sha == sha
+    assert not update.changed
+    assert update.changed_files == []
+
+
+def test_update_changed_files(bare_repo, tmp_path: Path):
+    """测试增量更新返回变化的文件"""
+    bare_path, commit = bare_repo
+    project_path = tmp_path / "project"
+    # 使用 file:// 地址，让 depth=1 生效，覆盖浅克隆上的快进
+    downloader = ProjectDownloder(url=bare_path.as_uri(), projectpath=project_path)
+    downloader.download()
+    old_sha = commit({"main.py": "print('v1.1')"})
+    assert downloader.download().new_sha == old_sha
+
+    commit({"main.py": "print('v2')"})
+    new_sha = commit({"uv.lock": "version = 1\n"})
+    update = downloader.download()
+
+    assert update.old_sha == old_sha
+    assert update.new_sha == new_sha
+    assert sorted(update.changed_files) == ["main.py", "uv.lock"]
+    assert (project_path / "main.py").read_text() == "print('v2')"
+    assert Repo(project_path).head.commit.hexsha == new_sha
+
+
+def test_update_pinned(bare_repo, tmp_path: Path):
+    """测试 HEAD 固定在标签上时不跟随分支，标签被移动后切换到新位置"""
+    bare_path, commit = bare_repo
+    work = Repo(tmp_path / "work")
+    work.create_tag("v1")
+    work.remotes.origin.push("refs/tags/v1")
+    project_path = tmp_path / "project"
+    downloader = ProjectDownloder(url=str(bare_path), projectpath=project_path)
+    pinned_sha = downloader.download().new_sha
+    Repo(project_path).git.checkout("v1")
+
+    commit({"main.py": "print('v2')"})
+    update = downloader.download()
+    assert update.old_sha == update.new_sha == pinned_sha
+    assert (project_path / "main.py").read_text() == "print('v1')"
+
+    work.create_tag("v1", force=True)
+    work.remotes.origin.push("refs/tags/v1", force=True)
+    update = downloader.download()
+    assert update.new_sha == work.head.commit.hexsha
+    assert update.changed_files == ["main.py"]
+    assert (project_path / "main.py").read_text() == "print('v2')"
+
+
+def test_file_download(http_url, tmp_path: Path):
+    """测试流式下载并校验，完成后不留临时文件"""
+    filepath = tmp_path / "out" / "file.bin"
+    checksum = "sha256:" + hashlib.sha256(PAYLOAD).hexdigest()
+    FileDownloader(http_url, filepath, checksum=checksum).download()
+
+    assert filepath.read_bytes() == PAYLOAD
+    assert not filepath.with_name("file.bin.part").exists()
+    assert not filepath.with_name("file.bin.part.validator").exists()
+
+
+def test_file_download_resume(http_url, tmp_path: Path):
+    """测试从已有的临时文件断点续传"""
+    filepath = tmp_path / "file.bin"
+    filepath.with_name("file.bin.part").write_bytes(PAYLOAD[:1000])
+    filepath.with_name("file.bin.part.validator").write_text('"v1"')
+    FileDownloader(http_url, filepath).download()
+
+    assert RangeHandler.ranges == ["bytes=1000-"]
+    assert filepath.read_bytes() == PAYLOAD
+
+
+def test_file_download_restart_without_validator(http_url, tmp_path: Path):
+    """测试没有记录校验值的临时文件不续传"""
+    filepath = tmp_path / "file.bin"
+    filepath.with_name("file.bin.part").write_bytes(b"x" * 1000)
+    FileDownloader(http_url, filepath).download()
+
+    assert RangeHandler.ranges == [None]
+    assert filepath.read_bytes() == PAYLOAD
+
+
+def test_file_download_restart_changed_remote(http_url, tmp_path: Path):
+    """测试远端文件变化时 If-Range 不匹配，从头下载"""
+    filepath = tmp_path / "file.bin"
+    filepath.with_name("file.bin.part").write_bytes(b"x" * 1000)
+    filepath.with_name("file.bin.part.validator").write_text('"v0"')
+    FileDownloader(http_url, filepath).download()
+
+    assert RangeHandler.ranges == ["bytes=1000-"]
+    assert filepath.read_bytes() == PAYLOAD
+
+
+def test_file_download_restart_misplaced_range(http_url, tmp_path: Path):
+    """测试返回片段的起点与临时文件大小不一致时重新下载"""
+    RangeHandler.misplace = True
+    filepath = tmp_path / "file.bin"
+    filepath.with_name("file.bin.part").write_bytes(PAYLOAD[:1000])
+    filepath.with_name("file.bin.part.validator").write_text('"v1"')
+    FileDownloader(http_url, filepath).download()
+
+    assert RangeHandler.ranges == ["bytes=1000-", None]
+    assert filepath.read_bytes() == PAYLOAD
+
+
+def test_file_download_restart_oversized_part(http_url, tmp_path: Path):
+    """测试临时文件超出远端大小时重新下载"""
+    filepath = tmp_path / "file.bin"
+    filepath.with_name("file.bin.part").write_bytes(PAYLOAD + b"junk")
+    filepath.with_name("file.bin.part.validator").write_text('"v1"')
+    FileDownloader(http_url, filepath).download()
+
+    assert RangeHandler.ranges == [f"bytes={len(PAYLOAD) + 4}-", None]
+    assert filepath.read_bytes() == PAYLOAD
+
+
+def test_file_download_checksum_mismatch(http_url, tmp_path: Path):
+    """测试校验失败时抛出异常且不生成目标文件"""
+    filepath = tmp_path / "file.bin"
+    with pytest.raises(errors.ChecksumMismatchError):
+        FileDownloader(http_url, filepath, checksum="md5:" + "0" * 32).download()
+
+    assert not filepath.exists()
+    assert not filepath.with_name("file.bin.part").exists()
+
+
+def test_download_files(http_url, tmp_path: Path):
+    """测试并发下载多个文件，失败的返回异常"""
+    downloaders = [FileDownloader(f"{http_url}?{i}", tmp_path / f"{i}.bin") for i in range(4)]
+    downloaders.append(FileDownloader(http_url, tmp_path / "bad.bin", checksum="0" * 64))
+    results = download_files(downloaders, max_workers=3)
+
+    assert results[:4] == [tmp_path / f"{i}.bin" for i in range(4)]
+    assert isinstance(results[4], errors.ChecksumMismatchError)
+    assert all((tmp_path / f"{i}.bin").read_bytes() == PAYLOAD for i in range(4))
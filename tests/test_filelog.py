@@ -1,4 +1,5 @@
 import os
+import time
 import pytest
 from pathlib import Path
 from qinglong.filelog import RotatingLogFile
@@ -102,3 +103,86 @@ def test_file_encoding(temp_log_file: Path):
         log.flush()
     content = temp_log_file.read_text(encoding="utf-8")
     assert test_message in content
+
+
+def test_buffered_write(temp_log_file: Path):
+    """测试批量刷新模式"""
+    log = RotatingLogFile(temp_log_file, flush_interval=60, flush_bytes=1024 * 1024)
+    with log:
+        for i in range(10):
+            log.write(f"批量消息 {i}")
+        # 刷新间隔未到，内容仍在缓冲区中
+        assert temp_log_file.read_text(encoding="utf-8") == ""
+        assert log.readlines(1).__next__() == "批量消息 9"
+
+    # 关闭时必须全部落盘
+    content = temp_log_file.read_text(encoding="utf-8").splitlines()
+    assert content == [f"批量消息 {i}" for i in range(10)]
+
+
+def test_buffered_flush_after_interval(temp_log_file: Path):
+    """测试写入后没有新行时，缓冲的数据也会在刷新间隔后落盘"""
+    with RotatingLogFile(temp_log_file, flush_interval=0.2) as log:
+        log.write("第一行")
+        log.write("第二行")
+        assert temp_log_file.read_text(encoding="utf-8") == ""
+        time.sleep(0.6)
+        assert temp_log_file.read_text(encoding="utf-8").splitlines() == ["第一行", "第二行"]
+
+
+def test_buffered_rotation_tracks_size(temp_log_file: Path):
+    """测试批量模式下按内存中记录的大小轮转"""
+    with RotatingLogFile(temp_log_file, max_size=100, backup_count=3, flush_interval=60) as log:
+        for i in range(50):
+            log.write(f"轮转消息 {i}")
+
+    backup_files = list(temp_log_file.parent.glob("test.*.log"))
+    assert 0 < len(backup_files) <= 3
+    for file in [temp_log_file, *backup_files]:
+        # 每个文件最多超出 max_size 一行
+        assert file.stat().st_size < 100 + len("轮转消息 00\n".encode("utf-8"))
+
+
+def test_reopen_keeps_size(temp_log_file: Path):
+    """测试重新打开文件时从磁盘同步已有大小"""
+    temp_log_file.write_text("x" * 200 + "\n", encoding="utf-8")
+    with RotatingLogFile(temp_log_file, max_size=100, backup_count=3) as log:
+        log.write("新消息")
+
+    assert temp_log_file.read_text(encoding="utf-8") == "新消息\n"
+    assert temp_log_file.with_name("test.1.log").exists()
+
+
+def test_lazy_buffer(temp_log_file: Path):
+    """测试日志尾部缓存在首次读取时才加载"""
+    temp_log_file.write_text("".join(f"历史消息 {i}\n" for i in range(100)), encoding="utf-8")
+    log = RotatingLogFile(temp_log_file, buffer_lines=10)
+    assert log._buffer is None
+
+    with log:
+        log.write("新消息")
+    assert log._buffer is None
+
+    lines = list(log.readlines(10))
+    assert lines[0] == "新消息"
+    assert lines[1:] == [f"历史消息 {i}" for i in range(99, 90, -1)]
+
+
+def test_lazy_buffer_across_backups(temp_log_file: Path):
+    """测试尾部读取跨越备份文件"""
+    temp_log_file.with_name("test.1.log").write_text("备份 0\n备份 1\n备份 2\n", encoding="utf-8")
+    temp_log_file.write_text("当前 0\n当前 1\n", encoding="utf-8")
+    log = RotatingLogFile(temp_log_file, buffer_lines=4)
+    assert list(log.readlines(4)) == ["当前 1", "当前 0", "备份 2", "备份 1"]
+
+
+def test_tail_lines(temp_log_file: Path):
+    """测试按块反向读取文件尾部"""
+    from qinglong.filelog import tail_lines
+
+    temp_log_file.write_text("".join(f"第{i}行\n" for i in range(1000)), encoding="utf-8")
+    # 使用很小的块，覆盖跨块和多字节字符被切开的情况
+    lines = tail_lines(temp_log_file, 5, block_size=7)
+    assert lines == [f"第{i}行" for i in range(999, 994, -1)]
+    assert len(tail_lines(temp_log_file, 5000, block_size=7)) == 1000
+    assert tail_lines(temp_log_file, 0) == []
@@ -0,0 +1,67 @@
+import time
+import pytest
+from pathlib import Path
+from qinglong.history import RunHistory
+from qinglong.models import RunStatus, RunTrigger, RunUsage
+
+
+@pytest.fixture
+def run_history(tmp_path: Path):
+    history = RunHistory(tmp_path / "history.sqlite")
+    yield history
+    history.close()
+
+
+def test_start_finish(run_history: RunHistory):
+    """测试记录一次运行的开始和结束"""
+    run_id = run_history.start("task", RunTrigger.MANUAL)
+    record = run_history.get(run_id)
+    assert record.status == RunStatus.RUNNING
+    assert record.duration is None
+
+    run_history.finish(run_id, 1)
+    record = run_history.get(run_id)
+    assert record.status == RunStatus.FAILED
+    assert record.trigger == RunTrigger.MANUAL
+    assert record.exit_code == 1
+    assert record.duration >= 0
+
+
+def test_query(run_history: RunHistory):
+    """测试按任务、时间和数量查询，结果按开始时间倒序"""
+    now = time.time()
+    for i in range(5):
+        run_history.finish(run_history.start("a", started_at=now - 100 + i), 0)
+    run_history.start("b", started_at=now)
+
+    records = run_history.query("a", limit=3)
+    assert [r.started_at for r in records] == [now - 96, now - 97, now - 98]
+    assert len(run_history.query("a", since=now - 98)) == 3
+    assert [r.task for r in run_history.query("b")] == ["b"]
+
+
+def test_compact(run_history: RunHistory):
+    """测试按保留天数和每个任务的数量上限清理"""
+    now = time.time()
+    run_history.start("a", started_at=now - 10 * 86400)
+    for i in range(5):
+        run_history.start("a", started_at=now - i)
+        run_history.start("b", started_at=now - i)
+
+    assert run_history.compact(retention_days=7, max_per_task=0) == 1
+    assert run_history.compact(retention_days=0, max_per_task=2) == 6
+    assert [r.started_at for r in run_history.query("a")] == [now, now - 1]
+    assert len(run_history.query("b")) == 2
+
+
+def test_usage_and_top(run_history: RunHistory):
+    """测试记录资源用量并按 CPU 时间汇总"""
+    run_history.finish(run_history.start("a"), 0, usage=RunUsage(user_time=1, system_time=1, max_rss=100))
+    run_history.finish(run_history.start("a"), 0, usage=RunUsage(user_time=3, max_rss=300))
+    run_history.finish(run_history.start("b"), 0, usage=RunUsage(user_time=1, max_rss=500))
+    run_history.finish(run_history.start("c"), 0)
+
+    assert run_history.query("a")[0].usage.max_rss == 300
+    assert run_history.query("c")[0].usage is None
+    top = run_history.top()
+    assert [(row["task"], row["runs"], row["cpu_time"], row["max_rss"]) for row in top] == [("a", 2, 5, 300), ("b", 1, 1, 500)]
@@ -0,0 +1,20 @@
+from qinglong.metrics import Histogram
+
+
+def test_histogram():
+    """测试直方图统计"""
+    histogram = Histogram(buckets=(1, 5, 10))
+    for value in (0.5, 2, 3, 7, 20):
+        histogram.observe(value)
+
+    snapshot = histogram.snapshot()
+    assert snapshot["count"] == 5
+    assert snapshot["sum"] == 32.5
+    assert snapshot["max"] == 20
+    assert snapshot["buckets"] == {"<=1": 1, "<=5": 2, "<=10": 1, ">10": 1}
+    assert histogram.quantile(0.5) == 5
+    assert histogram.quantile(1) == 20
+
+    histogram.reset()
+    assert histogram.snapshot()["count"] == 0
+    assert histogram.quantile(0.5) == 0
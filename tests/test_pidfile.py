@@ -0,0 +1,53 @@
+import os
+import signal
+import subprocess
+import sys
+import time
+from pathlib import Path
+from qinglong.pidfile import PidFiles
+
+
+def test_reap(tmp_path: Path):
+    """测试启动时清理 pidfile 记录的残留进程组"""
+    pidfiles = PidFiles(tmp_path / "pids")
+    script = "import signal, time; signal.signal(signal.SIGTERM, signal.SIG_IGN); time.sleep(60)"
+    process = subprocess.Popen([sys.executable, "-c", script], start_new_session=True)
+    pidfiles.write("orphan", process.pid)
+    # 记录的进程已经不存在
+    (tmp_path / "pids" / "gone.pid").write_text("999999999 1")
+
+    start = time.monotonic()
+    assert pidfiles.reap(grace=0.5) == ["orphan"]
+    assert time.monotonic() - start < 5
+    assert process.wait(timeout=5) < 0
+    assert list((tmp_path / "pids").iterdir()) == []
+
+
+def test_reap_reused_pid(tmp_path: Path):
+    """测试 pid 被其他进程复用时不会误杀"""
+    pidfiles = PidFiles(tmp_path / "pids")
+    process = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(60)"], start_new_session=True)
+    (tmp_path / "pids" / "task.pid").write_text(f"{process.pid} 1")
+
+    assert pidfiles.reap(grace=0.5) == []
+    assert process.poll() is None
+    process.kill()
+    process.wait()
+
+
+def test_reap_group_exited(tmp_path: Path, monkeypatch):
+    """测试检查之后进程组已退出、发送 SIGTERM 失败时继续清理"""
+    pidfiles = PidFiles(tmp_path / "pids")
+    process = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(60)"], start_new_session=True)
+    pidfiles.write("orphan", process.pid)
+    killpg = os.killpg
+
+    def lost_killpg(pgid, sig):
+        if sig == signal.SIGTERM:
+            raise ProcessLookupError(pgid)
+        killpg(pgid, sig)
+
+    monkeypatch.setattr(os, "killpg", lost_killpg)
+    assert pidfiles.reap(grace=0.1) == ["orphan"]
+    assert process.wait(timeout=5) == -signal.SIGKILL
+    assert list((tmp_path / "pids").iterdir()) == []
@@ -1,7 +1,16 @@
+import asyncio
 import pytest
+import sys
+import threading
 import time
+from concurrent.futures import Future
 from datetime import datetime, timedelta
-from qinglong.scheduler import Scheduler
+from apscheduler.events import EVENT_JOB_MAX_INSTANCES, EVENT_JOB_MISSED, JobExecutionEvent, JobSubmissionEvent
+from apscheduler.executors.base import MaxInstancesReachedError
+from apscheduler.jobstores.base import JobLookupError
+from apscheduler.triggers.cron import CronTrigger
+from qinglong.scheduler import Scheduler, ConcurrencyLimiter, OffsetTrigger, spread_offset
+from qinglong.config import settings as cfg
 
 
 @pytest.fixture
@@ -59,15 +68,253 @@ def test_pause_resume_job(scheduler: Scheduler):
     assert execution_count == 2
 
 
-def test_run_job(scheduler: Scheduler):
-    """测试立即运行任务"""
-    execution_count = 0
+def test_submit(scheduler: Scheduler):
+    """测试立即运行一次：不改变暂停状态和下次运行时间，并与定时运行共用 max_instances"""
+    release = threading.Event()
 
-    def test_func():
-        nonlocal execution_count
-        execution_count += 1
+    def test_func(value, suffix=""):
+        release.wait(5)
+        return value + suffix
 
-    scheduler.add_job("test_job", test_func, trigger=10)  # 设置较长的间隔
-    scheduler.run_job("test_job")  # 立即运行
-    time.sleep(0.01)  # 等待执行
-    assert execution_count == 1
+    scheduler.add_job("test_job", test_func, trigger=10, args=("run",), paused=True)
+    future = scheduler.submit("test_job", suffix="-now")
+    with pytest.raises(MaxInstancesReachedError):
+        scheduler.submit("test_job")
+    release.set()
+    assert future.result(timeout=5) == "run-now"
+    assert scheduler.get_job("test_job").next_run_time is None
+
+    # 没有调度任务时使用传入的函数
+    assert scheduler.submit("once", func=test_func, args=("once",)).result(timeout=5) == "once"
+    with pytest.raises(JobLookupError):
+        scheduler.submit("missing")
+
+
+def test_submit_tracks_returned_future(scheduler: Scheduler):
+    """测试函数返回 Future 时，submit 返回的 Future 跟踪它，并在它完成前计入 max_instances"""
+    inner = Future()
+    future = scheduler.submit("handoff", func=lambda: inner)
+    time.sleep(0.2)
+    assert not future.done()
+    with pytest.raises(MaxInstancesReachedError):
+        scheduler.submit("handoff", func=lambda: inner)
+    inner.set_result(7)
+    assert future.result(timeout=5) == 7
+    assert scheduler.submit("handoff", func=lambda: 8).result(timeout=5) == 8
+
+
+def test_executors(scheduler: Scheduler):
+    """测试按名称选择执行器"""
+    assert scheduler.is_thread_executor("default")
+    assert not scheduler.is_thread_executor("not-exist")
+
+    job = scheduler.add_job("test_job", lambda: None, trigger=10, executor="default")
+    assert job.executor == "default"
+
+
+def test_concurrency_limiter():
+    """测试并发上限内排队等待，而不是丢弃"""
+    limiter = ConcurrencyLimiter()
+    limiter.set_limit("project:a", 1)
+
+    running = 0
+    max_running = 0
+    finished = 0
+    lock = threading.Lock()
+
+    def worker():
+        nonlocal running, max_running, finished
+        with limiter.slot("project:a", "group:not-limited"):
+            with lock:
+                running += 1
+                max_running = max(max_running, running)
+            time.sleep(0.02)
+            with lock:
+                running -= 1
+                finished += 1
+
+    threads = [threading.Thread(target=worker) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert max_running == 1
+    assert finished == 5
+
+    limiter.set_limit("project:a", 0)
+    assert limiter.limits == {}
+
+
+def test_concurrency_limiter_fifo():
+    """测试释放的空位按排队顺序分配，后来者不能抢在排队的等待方之前"""
+    limiter = ConcurrencyLimiter()
+    limiter.set_limit("project:a", 1)
+    limiter.set_limit("group:g", 1)
+
+    assert limiter.acquire("project:a").done()
+    first = limiter.acquire("project:a", "group:g")
+    second = limiter.acquire("project:a")
+    # group:g 有空位，但前面有等待 group:g 的等待方，不能抢先
+    third = limiter.acquire("group:g")
+    assert not any(future.done() for future in (first, second, third))
+
+    limiter.release("project:a")
+    assert first.done() and not second.done() and not third.done()
+    limiter.release("project:a", "group:g")
+    assert second.done() and third.done()
+
+    # 取消排队的等待方不会占用空位
+    waiting = limiter.acquire("project:a")
+    assert waiting.cancel()
+    limiter.release("project:a")
+    assert limiter.acquire("project:a").done()
+
+
+def test_concurrency_limiter_async_cancel():
+    """测试协程等待空位时被取消，不会留下排队或占用空位"""
+    limiter = ConcurrencyLimiter()
+    limiter.set_limit("project:a", 1)
+    limiter.acquire("project:a")
+
+    async def wait_slot():
+        async with limiter.slot_async("project:a"):
+            pass
+
+    async def main():
+        task = asyncio.create_task(wait_slot())
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        limiter.release("project:a")
+        await asyncio.wait_for(wait_slot(), 1)
+
+    asyncio.run(main())
+
+
+def test_sqlite_jobstore_requires_sqlalchemy(tmp_path, monkeypatch):
+    """测试未安装 sqlalchemy 时启用 sqlite 任务存储给出明确的错误"""
+    monkeypatch.setattr(cfg, "DB_PATH", tmp_path)
+    monkeypatch.setitem(sys.modules, "sqlalchemy", None)
+    monkeypatch.delitem(sys.modules, "apscheduler.jobstores.sqlalchemy", raising=False)
+    with pytest.raises(RuntimeError, match="--extra sqlite"):
+        Scheduler(jobstore="sqlite")
+
+
+def test_sqlite_jobstore_survives_restart(tmp_path, monkeypatch):
+    """测试持久化任务存储在重启后保留下次运行时间和暂停状态"""
+    pytest.importorskip("sqlalchemy")
+    monkeypatch.setattr(cfg, "DB_PATH", tmp_path)
+
+    first = Scheduler(jobstore="sqlite")
+    first.resume()
+    job = first.add_job("cron_job", print, trigger="0 3 * * *", args=("cron",), name="sig")
+    next_run_time = job.next_run_time
+    first.add_job("paused_job", print, trigger=60, args=("paused",), paused=True)
+    first.shutdown()
+
+    second = Scheduler(jobstore="sqlite")
+    try:
+        jobs = {job.id: job for job in second.jobs}
+        assert jobs["cron_job"].next_run_time == next_run_time
+        assert jobs["cron_job"].name == "sig"
+        assert jobs["cron_job"].args == ("cron",)
+        assert jobs["paused_job"].next_run_time is None
+    finally:
+        second.shutdown()
+
+
+def test_offset_trigger():
+    """测试固定偏移在每次触发时都生效，散列偏移对同一名称保持不变"""
+    cron = CronTrigger.from_crontab("0 * * * *")
+    trigger = OffsetTrigger(cron, offset=90)
+    now = cron.get_next_fire_time(None, datetime.now(cron.timezone))
+    first = trigger.get_next_fire_time(None, now)
+    assert first == now + timedelta(seconds=90)
+    assert trigger.get_next_fire_time(first, first) == now + timedelta(hours=1, seconds=90)
+
+    jittered = OffsetTrigger(cron, offset=90, jitter=30).get_next_fire_time(None, now)
+    assert first <= jittered <= first + timedelta(seconds=30)
+
+    offsets = [spread_offset(f"task-{i}", 600) for i in range(200)]
+    assert offsets == [spread_offset(f"task-{i}", 600) for i in range(200)]
+    assert all(0 <= offset < 600 for offset in offsets)
+    assert len(set(offsets)) > 100
+    assert spread_offset("task", 0) == 0
+
+
+def test_add_job_offset(scheduler: Scheduler):
+    """测试添加任务时按 offset 和 jitter 包装触发器"""
+    job = scheduler.add_job("test_job", lambda: None, trigger="0 * * * *", offset=120, coalesce=False)
+    assert isinstance(job.trigger, OffsetTrigger)
+    assert (job.next_run_time.minute, job.next_run_time.second) == (2, 0)
+    assert not job.coalesce
+    assert not isinstance(scheduler.add_job("plain_job", lambda: None, trigger=10).trigger, OffsetTrigger)
+
+
+def test_scheduler_stats(scheduler: Scheduler):
+    """测试通过调度器事件统计提交、完成、调度延迟和运行耗时，以及错过和跳过次数"""
+    done = threading.Event()
+    # 提交事件在任务交给执行器之后才分发，运行时间要比断言的耗时留出余量
+    scheduler.add_delayed_job("stats_job", lambda: time.sleep(0.2) or done.set(), 0)
+    scheduler.submit("manual_job", func=lambda: None).result(timeout=5)
+    assert done.wait(5)
+    time.sleep(0.1)
+
+    stats = scheduler.stats.snapshot()
+    assert stats["counts"]["submitted"] == 2
+    assert stats["counts"]["executed"] == 2
+    assert stats["running"] == 0
+    assert stats["lag"]["count"] == 2
+    assert stats["duration"]["max"] >= 0.1
+    assert stats["queue_depth"]["count"] == 2
+
+    run_time = datetime.now(scheduler.scheduler.timezone)
+    scheduler.stats.on_event(JobExecutionEvent(EVENT_JOB_MISSED, "late_job", "default", run_time))
+    scheduler.stats.on_event(JobSubmissionEvent(EVENT_JOB_MAX_INSTANCES, "busy_job", "default", [run_time]))
+    stats = scheduler.stats.snapshot()
+    assert stats["counts"]["missed"] == 1
+    assert stats["counts"]["skipped"] == 1
+    assert {job["job_id"] for job in stats["jobs"]} == {"late_job", "busy_job"}
+
+    # 错过的运行不会有提交事件，不能留下等待提交的记录
+    for i in range(100):
+        scheduler.stats.on_event(JobExecutionEvent(EVENT_JOB_MISSED, "late_job", "default", run_time + timedelta(seconds=i)))
+    assert scheduler.stats._finished == {}
+
+
+def test_scheduler_stats_handoff(scheduler: Scheduler):
+    """测试任务函数返回 Future 时，运行耗时统计到该 Future 完成"""
+    inner = Future()
+    scheduler.add_delayed_job("handoff_job", lambda: inner, 0)
+    time.sleep(0.4)
+    assert scheduler.stats.snapshot()["running"] == 1
+
+    inner.set_result(0)
+    stats = scheduler.stats.snapshot()
+    assert stats["running"] == 0
+    assert stats["counts"]["executed"] == 1
+    assert stats["duration"]["max"] >= 0.3
+
+
+def test_queue_depth_unavailable(scheduler: Scheduler, monkeypatch):
+    """测试读取不到线程池的排队数时返回 None，不影响统计"""
+    executor = scheduler.executors["default"]
+
+    class Pool:
+        """转发到原线程池，但没有 _work_queue 属性"""
+
+        def __getattr__(self, name):
+            if name == "_work_queue":
+                raise AttributeError(name)
+            return getattr(pool, name)
+
+    pool = executor._pool
+    monkeypatch.setattr(executor, "_pool", Pool())
+    assert scheduler.queue_depth()["default"] is None
+    scheduler.submit("manual_job", func=lambda: None).result(timeout=5)
+    time.sleep(0.1)
+    stats = scheduler.stats.snapshot()
+    assert stats["counts"]["executed"] == 1
+    assert stats["queue_depth"]["count"] == 0
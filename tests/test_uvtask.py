@@ -1,8 +1,16 @@
+import asyncio
 import os
+import time
 import pytest
+import signal
+import subprocess
 import tempfile
+import threading
 from pathlib import Path
-from qinglong.uvtask import UvTask
+from qinglong import errors, limits as resource_limits, usage as usage_module, uvtask as uvtask_module
+from qinglong.uvtask import UvTask, ProjectInitRegistry, ProjectPrewarmer, project_fingerprint
+from qinglong.models import PrewarmState, ResourceLimits, RunStatus, RunTrigger
+from qinglong.history import history
 from qinglong.config import settings as cfg
 
 
@@ -43,7 +51,10 @@ def test_uvtask_initialization(uvtask: UvTask, temp_project_path: Path):
 
 def test_uvtask_run(uvtask: UvTask):
     """测试命令运行和日志记录"""
-    uvtask.run()
+    assert uvtask.run(trigger=RunTrigger.MANUAL) == 0
+    record = history.query(uvtask.name, limit=1)[0]
+    assert record.status == RunStatus.SUCCESS
+    assert record.trigger == RunTrigger.MANUAL
     logs = list(uvtask.get_logs())
     for log in logs:
         assert "Hello, World!" in log
@@ -60,3 +71,346 @@ def test_uvtask_with_file_project_path(tmp_path: Path):
     for log in task.get_logs():
         assert "test" in log
         break
+
+
+BURN_SCRIPT = """
+import time
+data = bytearray(64 * 1024 * 1024)
+end = time.process_time() + 0.5
+while time.process_time() < end:
+    pass
+print('done', flush=True)
+"""
+
+
+def test_uvtask_run_usage(tmp_path: Path):
+    """测试线程模式下通过 wait4 记录子进程树的资源用量"""
+    test_file = tmp_path / "burn.py"
+    test_file.write_text(BURN_SCRIPT)
+
+    task = UvTask(name="usage_task", cmd="python burn.py", project_path=str(test_file))
+    assert task.run() == 0
+    usage = history.query("usage_task", limit=1)[0].usage
+    assert usage.cpu_time >= 0.5
+    assert usage.max_rss >= 64 * 1024 * 1024
+
+
+def test_uvtask_run_usage_while_polled(tmp_path: Path, monkeypatch):
+    """测试运行期间查询 is_running 不会抢先回收子进程，仍能取得资源用量"""
+    test_file = tmp_path / "burn.py"
+    test_file.write_text(BURN_SCRIPT)
+    wait4 = os.wait4
+
+    def slow_wait4(pid, options):
+        # 放大输出结束到 wait4 之间的窗口
+        time.sleep(0.5)
+        return wait4(pid, options)
+
+    monkeypatch.setattr(os, "wait4", slow_wait4)
+
+    task = UvTask(name="usage_polled_task", cmd="python burn.py", project_path=str(test_file))
+    done = threading.Event()
+
+    def poll():
+        while not done.is_set():
+            task.is_running
+
+    poller = threading.Thread(target=poll, daemon=True)
+    poller.start()
+    try:
+        assert task.run() == 0
+    finally:
+        done.set()
+        poller.join()
+    assert not task.is_running
+    usage = history.query("usage_polled_task", limit=1)[0].usage
+    assert usage is not None
+    assert usage.cpu_time >= 0.5
+
+
+def test_process_tree_sampler_keeps_max(monkeypatch):
+    """测试采样值变小（例如进程变为僵尸）时保留每个进程的最大值"""
+    samples = iter(
+        [
+            {"user_time": 1.0, "system_time": 0.5, "max_rss": 100, "read_bytes": 10, "write_bytes": 20},
+            {"user_time": 1.5, "system_time": 0.0, "max_rss": 0, "read_bytes": 0, "write_bytes": 0},
+        ]
+    )
+    fields = ("voluntary_switches", "involuntary_switches")
+    monkeypatch.setattr(usage_module, "_read_process", lambda pid: next(samples) | dict.fromkeys(fields, 0))
+    monkeypatch.setattr(usage_module, "_children", lambda pid: [])
+
+    sampler = usage_module.ProcessTreeSampler(1)
+    sampler.sample()
+    sampler.sample()
+    usage = sampler.usage()
+    assert (usage.user_time, usage.system_time, usage.max_rss, usage.read_bytes, usage.write_bytes) == (1.5, 0.5, 100, 10, 20)
+
+
+def test_uvtask_run_async_usage(tmp_path: Path, monkeypatch):
+    """测试 asyncio 模式下通过 /proc 采样记录资源用量"""
+    monkeypatch.setattr(cfg, "RESOURCE_SAMPLE_INTERVAL", 0.05)
+    test_file = tmp_path / "burn.py"
+    test_file.write_text(BURN_SCRIPT)
+
+    task = UvTask(name="usage_async_task", cmd="python burn.py", project_path=str(test_file))
+    assert task.submit().result(timeout=120) == 0
+    usage = history.query("usage_async_task", limit=1)[0].usage
+    assert usage.cpu_time >= 0.4
+    assert usage.max_rss >= 64 * 1024 * 1024
+
+
+def test_uvtask_limits(tmp_path: Path):
+    """测试资源上限生效，并在运行记录中记录超限"""
+    test_file = tmp_path / "alloc.py"
+    test_file.write_text("import os\nprint(os.nice(0), flush=True)\ndata = bytearray(512 * 1024 * 1024)")
+
+    limits = ResourceLimits(memory=256 * 1024 * 1024, nice=5)
+    task = UvTask(name="limits_task", cmd="python alloc.py", project_path=str(test_file), limits=limits)
+    assert task.run() != 0
+    record = history.query("limits_task", limit=1)[0]
+    assert record.limit_breach == "memory"
+    assert any(line.endswith(str(os.nice(0) + 5)) for line in task.get_logs())
+
+
+def test_uvtask_cpu_limit(tmp_path: Path):
+    """测试 CPU 时间超限后进程被终止"""
+    test_file = tmp_path / "spin.py"
+    test_file.write_text("while True:\n    pass")
+
+    task = UvTask(name="cpu_limit_task", cmd="python spin.py", project_path=str(test_file), limits=ResourceLimits(cpu_time=1))
+    task.submit().result(timeout=60)
+    record = history.query("cpu_limit_task", limit=1)[0]
+    assert record.status == RunStatus.FAILED
+    assert record.limit_breach == "cpu_time"
+
+
+def test_limits_command():
+    """测试资源上限只套在任务命令上，优先级设置对整个进程树生效"""
+    limits = ResourceLimits(memory=1024, cpu_time=1, nice=5)
+    task = UvTask(name="limits_command_task", cmd="main.py --flag", project_path="/tmp", uv_args="--frozen", limits=limits)
+    cmd = task._command()
+    assert cmd[1:3] == ["-n", "5"]
+    run = cmd.index("run")
+    assert cmd[run + 1] == "--frozen"
+    assert cmd[run + 2].endswith("prlimit")
+    assert cmd[run + 3 :] == ["--as=1024", "--cpu=1:6", "--", "python", "main.py", "--flag"]
+
+
+def test_breach_detector():
+    """测试只有 SIGXCPU 判断为 CPU 超限，超时或手动终止的运行不判断"""
+    limits = ResourceLimits(cpu_time=1)
+    assert resource_limits.BreachDetector(limits).result(128 + signal.SIGXCPU) == "cpu_time"
+    assert resource_limits.BreachDetector(limits).result(-signal.SIGXCPU) == "cpu_time"
+    # 任务自己以 137 退出，或被 SIGKILL 终止，都不能确定是超限
+    assert resource_limits.BreachDetector(limits).result(128 + signal.SIGKILL) is None
+    assert resource_limits.BreachDetector(limits).result(-signal.SIGKILL) is None
+    assert resource_limits.BreachDetector(limits).result(128 + signal.SIGXCPU, stopped=True) is None
+
+
+HANG_SCRIPT = """
+import signal, subprocess, sys, time
+signal.signal(signal.SIGTERM, signal.SIG_IGN)
+child = subprocess.Popen([sys.executable, "-c", "import signal, time; signal.signal(signal.SIGTERM, signal.SIG_IGN); time.sleep(60)"])
+print(child.pid, flush=True)
+time.sleep(60)
+"""
+
+
+def process_alive(pid: int) -> bool:
+    try:
+        state = Path(f"/proc/{pid}/stat").read_text().rpartition(")")[2].split()[0]
+    except OSError:
+        return False
+    return state != "Z"
+
+
+@pytest.mark.parametrize("runner", ["thread", "asyncio"])
+def test_uvtask_timeout(tmp_path: Path, runner: str):
+    """测试超时后终止整个进程组，并记录为超时"""
+    test_file = tmp_path / "hang.py"
+    test_file.write_text(HANG_SCRIPT)
+
+    task = UvTask(name=f"timeout_{runner}", cmd="python hang.py", project_path=str(test_file), timeout=2, kill_grace=0.5)
+    task.remove_logs()
+    start = time.monotonic()
+    if runner == "thread":
+        task.run()
+    else:
+        task.submit().result(timeout=60)
+    assert time.monotonic() - start < 30
+
+    record = history.query(task.name, limit=1)[0]
+    assert record.status == RunStatus.TIMEOUT
+    child_pid = int(next(line for line in task.get_logs() if line.split(": ")[-1].isdigit()).split(": ")[-1])
+    time.sleep(0.2)
+    assert not process_alive(child_pid)
+
+
+def test_uvtask_run_reserved(uvtask: UvTask):
+    """测试运行权被占用时不会再启动运行"""
+    assert uvtask.reserve()
+    assert not uvtask.reserve()
+    with pytest.raises(errors.TaskAlreadyRunningError):
+        uvtask.run()
+    assert uvtask.run(reserved=True) == 0
+    assert uvtask.reserve()
+    uvtask.unreserve()
+
+
+def test_uvtask_run_async(uvtask: UvTask):
+    """测试通过共享事件循环运行命令"""
+    uvtask.submit().result(timeout=120)
+    assert not uvtask.is_running
+    assert next(iter(uvtask.get_logs())).endswith("Hello, World!")
+
+
+def test_uvtask_long_line_async(tmp_path: Path):
+    """测试 asyncio 模式下超过单行上限且没有换行的输出被切分记录，不会中断运行"""
+    test_file = tmp_path / "progress.py"
+    test_file.write_text(
+        "import sys, time\nsys.stdout.write('\\r' + 'x' * 2 * 1024 * 1024)\nsys.stdout.flush()\ntime.sleep(0.5)\nprint('end')"
+    )
+
+    task = UvTask(name="long_line_task", cmd="python progress.py", project_path=str(test_file))
+    task.remove_logs()
+    assert task.submit().result(timeout=60) == 0
+    assert history.query("long_line_task", limit=1)[0].status == RunStatus.SUCCESS
+    logs = list(task.get_logs())
+    assert logs[0].endswith("end")
+    assert sum(line.count("x") for line in logs) == 2 * 1024 * 1024
+
+
+def test_read_lines_multibyte(monkeypatch):
+    """测试多字节字符跨读取块和超长切分时不会被截断"""
+    monkeypatch.setattr(uvtask_module, "_ENCODING", "utf-8")
+
+    async def read(data: bytes) -> list[str]:
+        stream = asyncio.StreamReader()
+        stream.feed_data(data)
+        stream.feed_eof()
+        return [line async for line in uvtask_module._read_lines(stream)]
+
+    text = "中" * (uvtask_module._MAX_LINE + 10)
+    lines = asyncio.run(read((text + "\r\nend").encode()))
+    assert "".join(lines) == text + "\nend"
+    assert "\ufffd" not in "".join(lines)
+    assert len(lines[0]) == uvtask_module._MAX_LINE
+
+
+def test_uvtask_kill_async(tmp_path: Path):
+    """测试终止 asyncio 模式下运行的进程"""
+    test_file = tmp_path / "sleep.py"
+    test_file.write_text("import time\nprint('start', flush=True)\ntime.sleep(60)")
+
+    task = UvTask(name="async_kill_task", cmd="python sleep.py", project_path=str(test_file))
+    future = task.submit()
+    # 正在运行时重复提交不会再启动一个进程
+    assert task.submit() is future
+    for _ in range(200):
+        if task.is_running:
+            break
+        time.sleep(0.05)
+    assert task.is_running
+
+    task.kill()
+    future.result(timeout=10)
+    assert not task.is_running
+
+
+def test_init_project_reuses_env(uvtask: UvTask, temp_project_path: Path, monkeypatch):
+    """测试依赖未变化时跳过 uv sync，依赖变化后重新同步"""
+    uvtask.init_project(temp_project_path)
+    assert project_fingerprint(temp_project_path) is not None
+
+    # 模拟重启：清空内存中的状态，磁盘上的指纹仍然有效
+    UvTask._project_inited.clear()
+    calls = []
+    real_run = subprocess.run
+    monkeypatch.setattr(subprocess, "run", lambda *args, **kwargs: calls.append(args[0]) or real_run(*args, **kwargs))
+    uvtask.init_project(temp_project_path)
+    assert calls == []
+
+    # 依赖文件变化后只做增量同步，不重建虚拟环境
+    pyproject = temp_project_path / "pyproject.toml"
+    pyproject.write_text(pyproject.read_text().replace('version = "0.1.0"', 'version = "0.1.1"'))
+    uvtask.init_project(temp_project_path)
+    assert calls == [["uv", "sync"]]
+
+
+def test_init_registry_coalesce():
+    """测试同一工程的初始化合并，不同工程的初始化并行"""
+    registry = ProjectInitRegistry()
+    calls = {"a": 0, "b": 0}
+    # a 和 b 同时处于初始化中才能通过，串行执行会超时
+    barrier = threading.Barrier(2, timeout=5)
+
+    def init(key):
+        calls[key] += 1
+        barrier.wait()
+        time.sleep(0.2)
+        return key
+
+    results = []
+    threads = [threading.Thread(target=lambda k=k: results.append(registry.run(k, lambda: init(k)))) for k in "aaab"]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(results) == ["a", "a", "a", "b"]
+    assert calls == {"a": 1, "b": 1}
+    stats = registry.stats()
+    assert stats["a"]["init"]["count"] == 1
+    assert stats["a"]["wait"]["count"] == 3
+
+
+def test_prewarm_coalesce(temp_project_path: Path, monkeypatch):
+    """测试预热期间触发的任务等待预热完成，而不是再同步一次"""
+    calls = []
+    started = threading.Event()
+
+    def fake_sync(project_path, env=None):
+        calls.append(project_path)
+        started.set()
+        time.sleep(0.2)
+        return True
+
+    monkeypatch.setattr(uvtask_module, "sync_project_env", fake_sync)
+    UvTask._project_inited.clear()
+    prewarmer = ProjectPrewarmer(max_workers=1, registry=ProjectInitRegistry())
+    monkeypatch.setattr(uvtask_module, "init_registry", prewarmer.registry)
+
+    future = prewarmer.submit("test", temp_project_path)
+    assert started.wait(5)
+    assert prewarmer.status("test")["state"] == PrewarmState.RUNNING
+
+    UvTask.init_project(temp_project_path)
+    future.result(timeout=5)
+    assert calls == [temp_project_path]
+    assert prewarmer.status("test")["state"] == PrewarmState.DONE
+
+
+def test_uvtask_kill_group(tmp_path: Path):
+    """测试终止任务时清理 uv 启动的整个进程组，并删除 pidfile"""
+    test_file = tmp_path / "hang.py"
+    test_file.write_text(HANG_SCRIPT)
+
+    task = UvTask(name="kill_group_task", cmd="python hang.py", project_path=str(test_file), kill_grace=0.5)
+    task.remove_logs()
+    thread = threading.Thread(target=task.run)
+    thread.start()
+    for _ in range(200):
+        logs = [line for line in task.get_logs() if line.split(": ")[-1].isdigit()]
+        if logs:
+            break
+        time.sleep(0.05)
+    child_pid = int(logs[0].split(": ")[-1])
+    assert (cfg.DB_PATH / "pids" / "kill_group_task.pid").exists()
+
+    task.kill()
+    thread.join(timeout=10)
+    assert not thread.is_alive()
+    time.sleep(0.2)
+    assert not process_alive(child_pid)
+    assert not (cfg.DB_PATH / "pids" / "kill_group_task.pid").exists()
@@ -0,0 +1,44 @@
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from qinglong import watcher
+from qinglong.config import settings as cfg
+from qinglong.models import FileWatch
+from qinglong.watcher import FileWatchers
+
+
+def wait_for(event: threading.Event, changes: list, timeout: float = 10) -> list:
+    assert event.wait(timeout)
+    return changes
+
+
+@pytest.mark.parametrize("backend", ["watchfiles", "poll"])
+def test_file_watch(tmp_path: Path, monkeypatch, backend):
+    """测试只在匹配模式的文件变化时回调，删除监视后不再回调"""
+    if backend == "poll":
+        monkeypatch.setattr(watcher, "watchfiles", None)
+        monkeypatch.setattr(cfg, "WATCH_POLL_INTERVAL", 0.1)
+    elif watcher.watchfiles is None:
+        pytest.skip("watchfiles is not installed")
+    changes = []
+    event = threading.Event()
+
+    def callback(changed):
+        changes.extend(changed)
+        event.set()
+
+    watchers = FileWatchers()
+    watchers.set("task", FileWatch(path=".", patterns=["*.csv"]), tmp_path, callback)
+    time.sleep(0.5)
+    (tmp_path / "ignored.txt").write_text("x")
+    (tmp_path / "data.csv").write_text("a,b")
+    assert wait_for(event, changes) == [str(tmp_path / "data.csv")]
+
+    watchers.remove("task")
+    assert watchers.names() == []
+    event.clear()
+    (tmp_path / "more.csv").write_text("c,d")
+    assert not event.wait(1)